@@ -0,0 +1,65 @@
+''' benchmark of the batched tone detection
+
+feeds a frame of 20 ms to each of 1000 streams, a few of them carrying
+dtmf keys or call progress tones and the rest noise, and runs one
+detection pass per tick. reports the time of a tick and the share of the
+20 ms packet interval it takes on one core. run from the project
+directory with
+    python -m benchmarks.bench_detect
+'''
+import math
+import random
+import time
+from array import array
+
+from voip.detect import ToneDetector, ROWS, COLUMNS, numpy
+
+BLOCK = 160
+RATE = 8000
+
+
+def frame(frequencies, amplitude=6000):
+    return array('h', (
+        int(sum(amplitude * math.sin(2 * math.pi * f * n / RATE)
+            for f in frequencies))
+        for n in range(BLOCK)
+        )).tobytes()
+
+
+def run(streams, ticks):
+    generator = random.Random(streams)
+    noise = [array('h', (
+        generator.randint(-3000, 3000) for _ in range(BLOCK)
+        )).tobytes() for _ in range(16)]
+    signals = [frame((ROWS[index % 4], COLUMNS[index // 4 % 4]))
+        for index in range(16)] + [frame((480, 620)), frame((440, 480))]
+    frames = [signals[stream] if stream < len(signals) else noise[stream % 16]
+        for stream in range(streams)]
+
+    events = []
+    detector = ToneDetector(
+        lambda key, kind, value: events.append(value), capacity=streams
+        )
+    for stream in range(streams):
+        detector.add(stream)
+    started = time.perf_counter()
+    for _ in range(ticks):
+        for stream in range(streams):
+            detector.feed(stream, frames[stream])
+        detector.run()
+    elapsed = (time.perf_counter() - started) / ticks
+    print(f'{streams:>6} streams {elapsed * 1000:>8.2f} ms per tick ' +
+        f'{elapsed / 0.02:>7.1%} of 20 ms {len(events)} events')
+
+
+def main():
+    if numpy is None:
+        print('numpy is not available, using the python fallback')
+        run(10, 20)
+        return
+    for streams in (100, 1000, 4000):
+        run(streams, 100)
+
+
+if __name__ == '__main__':
+    main()
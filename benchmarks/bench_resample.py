@@ -0,0 +1,40 @@
+''' benchmark of the sample rate conversion
+
+converts a minute of noise of common prompt formats to 8 kHz mono in
+chunks of a second and reports how long an hour of audio takes. run from
+the project directory with
+    python -m benchmarks.bench_resample
+'''
+import random
+import time
+from array import array
+
+from voip.resample import Converter, numpy
+
+FORMATS = ((48000, 2), (44100, 2), (16000, 1))
+
+
+def run(rate, channels, seconds=60, target=8000):
+    generator = random.Random(rate)
+    data = array('h', (
+        generator.randint(-8000, 8000) for _ in range(rate * channels)
+        )).tobytes()
+    converter = Converter(channels, rate, 2, target)
+    started = time.perf_counter()
+    for _ in range(seconds):
+        converter.convert(data)
+    converter.flush()
+    elapsed = time.perf_counter() - started
+    print(f'{rate:>6}Hz {channels}ch -> {target}Hz ' +
+        f'{elapsed / seconds * 3600:>8.1f} s per hour of audio')
+
+
+def main():
+    if numpy is None:
+        print('numpy is not available, using the python fallback')
+    for rate, channels in FORMATS:
+        run(rate, channels, 60 if numpy is not None else 2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+''' microbenchmarks for the rtp header implementation
+
+run from the project directory with
+    python -m benchmarks.bench_rtp
+'''
+import struct
+import timeit
+
+from voip.rtp import RTPMessage, RTPPacketizer
+
+
+class LegacyRTPMessage():
+    ''' the former header class, kept here to compare against
+    '''
+    def __init__(self, **kwargs):
+        self.mask = int(kwargs.get('mask', 0))
+        self.timestamp = int(kwargs.get('timestamp', 0))
+        self.ssrc = int(kwargs.get('ssrc', 0))
+        self.csrc = int(kwargs.get('csrc', 0))
+        self.extension = int(kwargs.get('extension', 0))
+
+        if 'values' in kwargs:
+            self.mask, self.timestamp, self.ssrc, self.csrc, \
+            self.extension  = struct.unpack('IIIII', kwargs.get('values'))
+
+    def to_bytes(self):
+        return struct.pack(
+            'IIIII',
+            self.mask, self.timestamp,
+            self.ssrc, self.csrc,
+            self.extension
+            )
+
+    @property
+    def sequence_number(self):
+        return (self.mask & 0x0000ffff)
+
+    @sequence_number.setter
+    def sequence_number(self, value):
+        self.mask = (value & 0xffff) | (self.mask & 0xffff0000)
+
+
+def legacy_packets(count):
+    msg = LegacyRTPMessage(mask=0x80000000, ssrc=0x1234)
+    for index in range(count):
+        msg.sequence_number = index
+        msg.timestamp = index * 160
+        msg.to_bytes()
+
+
+def single_packets(count):
+    msg = RTPMessage(ssrc=0x1234)
+    buffer = bytearray(msg.size)
+    for index in range(count):
+        msg.sequence_number = index
+        msg.timestamp = index * 160
+        msg.pack_into(buffer)
+
+
+def batch_packets(count):
+    msg = RTPMessage(ssrc=0x1234)
+    buffer = bytearray(msg.size * count)
+    msg.pack_many(buffer, count, 160)
+
+
+def packetizer_frames(count):
+    payload = bytes(160)
+    for header, _ in RTPPacketizer(8, ssrc=0x1234).frames([payload] * count):
+        pass
+
+
+def packetizer_packets(count):
+    for _ in RTPPacketizer(8, ssrc=0x1234).packets(bytes(160 * count)):
+        pass
+
+
+def legacy_parse(data):
+    return LegacyRTPMessage(values=data)
+
+
+def parse(data):
+    return RTPMessage.from_bytes(data)
+
+
+def run(name, function, number):
+    seconds = min(timeit.repeat(function, number=1, repeat=5))
+    print(f'{name:<24} {number / seconds:>14,.0f} headers/s')
+
+
+def main():
+    count = 100000
+    run('legacy to_bytes', lambda: legacy_packets(count), count)
+    run('pack_into', lambda: single_packets(count), count)
+    run('pack_many', lambda: batch_packets(count), count)
+    run('packetizer frames', lambda: packetizer_frames(count), count)
+    run('packetizer packets', lambda: packetizer_packets(count), count)
+
+    legacy = LegacyRTPMessage(mask=0x80000000).to_bytes()
+    data = RTPMessage(ssrc=0x1234).to_bytes()
+    run(
+        'legacy from_bytes',
+        lambda: [legacy_parse(legacy) for _ in range(count)],
+        count
+        )
+    run('from_bytes', lambda: [parse(data) for _ in range(count)], count)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+''' benchmark of the media scheduler
+
+measures the time of a tick sending one G.711 packet for each of a number
+of streams to a local sink, with and without sendmmsg batching. run from
+the project directory with
+    python -m benchmarks.bench_scheduler [streams]
+'''
+import socket
+import sys
+import time
+
+from voip.rtp import RTPPacketizer
+from voip.scheduler import MediaScheduler, _sendmmsg
+
+
+def drain(sink):
+    try:
+        while True:
+            sink.recv(2048, socket.MSG_DONTWAIT)
+    except BlockingIOError:
+        pass
+
+
+def run(name, streams, shared, batch, ticks=100):
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    address = sink.getsockname()
+    count = 1 if shared else streams
+    sockets = [
+        socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(count)
+        ]
+    data = bytes(160 * (ticks + 2))
+
+    scheduler = MediaScheduler(batch=batch)
+    for index in range(streams):
+        scheduler.add(
+            sockets[index % count], address, RTPPacketizer().packets(data)
+            )
+    # the first tick packetizes all the data
+    scheduler.run_tick(scheduler.start_time + scheduler.tick)
+    drain(sink)
+
+    total = 0.0
+    for tick in range(2, ticks + 2):
+        now = scheduler.start_time + tick * scheduler.tick
+        started = time.perf_counter()
+        scheduler.run_tick(now)
+        total += time.perf_counter() - started
+        drain(sink)
+    mean = total / ticks
+    print(f'{name:<24} {mean * 1000:>8.2f} ms/tick ' +
+        f'{streams / mean:>12,.0f} packets/s ' +
+        f'{mean / scheduler.tick * 100:>6.1f}% of a tick')
+
+    for sock in sockets:
+        sock.close()
+    sink.close()
+
+
+def main():
+    streams = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    if _sendmmsg is None:
+        print('sendmmsg is not available, batching falls back to sendto')
+    run('shared socket, sendmmsg', streams, True, True)
+    run('shared socket, sendto', streams, True, False)
+    run('socket per stream', streams, False, False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+''' microbenchmarks for parsing received sip messages
+
+run from the project directory with
+    python -m benchmarks.bench_sip
+'''
+import logging
+import timeit
+
+from voip.protocol import Response
+from voip.sipmessage import SIPMessage
+from voip.sipparser import SIPView
+
+SDP = (
+    'v=0\r\n'
+    'o=- 4711 4711 IN IP4 192.168.178.1\r\n'
+    's=call\r\n'
+    'c=IN IP4 192.168.178.1\r\n'
+    't=0 0\r\n'
+    'm=audio 7078 RTP/AVP 8 0 101\r\n'
+    'a=rtpmap:8 PCMA/8000\r\n'
+    'a=rtpmap:0 PCMU/8000\r\n'
+    'a=rtpmap:101 telephone-event/8000\r\n'
+    'a=fmtp:101 0-15\r\n'
+    'a=ptime:20\r\n'
+    'a=sendrecv\r\n'
+    )
+
+
+def response(code, reason, method, extra='', body=''):
+    return (
+        f'SIP/2.0 {code} {reason}\r\n'
+        'Via: SIP/2.0/UDP 192.168.178.20:5060;'
+        'branch=z9hG4bKt3cDr01d0123456789abcdef0123456;'
+        'rport=5060;received=192.168.178.20\r\n'
+        'From: "auser" <sip:auser@192.168.178.1>;tag=8f3a2b1c\r\n'
+        'To: <sip:01752002091@192.168.178.1>;tag=5C0D1E2F3A4B5C6D\r\n'
+        'Call-ID: 1f0e2d3c4b5a69788796a5b4c3d2e1f0\r\n'
+        f'CSeq: 101 {method}\r\n'
+        'User-Agent: FRITZ!OS\r\n'
+        f'{extra}'
+        f'Content-Length: {len(body)}\r\n'
+        '\r\n'
+        f'{body}'
+        ).encode('utf8')
+
+
+MESSAGES = {
+    '401': response(
+        401, 'Unauthorized', 'REGISTER',
+        'WWW-Authenticate: Digest realm="fritz.box", '
+        'nonce="4E1BD2A7B7B0E26F", algorithm=MD5\r\n'
+        ),
+    '183': response(
+        183, 'Session Progress', 'INVITE',
+        'Contact: <sip:01752002091@192.168.178.1:5060>\r\n'
+        'Content-Type: application/sdp\r\n', SDP
+        ),
+    '200': response(
+        200, 'OK', 'INVITE',
+        'Contact: <sip:01752002091@192.168.178.1:5060>\r\n'
+        'Allow: INVITE, ACK, OPTIONS, CANCEL, BYE, UPDATE, PRACK, INFO\r\n'
+        'Content-Type: application/sdp\r\n', SDP
+        ),
+    }
+
+
+def parse_sipmessage(data):
+    msg = SIPMessage.from_text(b'192.168.178.1', data)
+    return msg.code, msg.branch, msg.method, msg.get('Call-ID')
+
+
+def parse_response(data):
+    msg = Response(data)
+    return msg.code, msg.get('Via'), msg.get('CSeq'), msg.get('Call-ID')
+
+
+def parse_view(data):
+    msg = SIPView(data)
+    return msg.code, msg.branch, msg.method, msg.get('Call-ID')
+
+
+PARSERS = {
+    'SIPMessage.from_text': parse_sipmessage,
+    'protocol.Response': parse_response,
+    'SIPView': parse_view,
+    }
+
+
+def run(name, function, number):
+    seconds = min(timeit.repeat(function, number=number, repeat=5))
+    print(f'{name:<32} {number / seconds:>12,.0f} messages/s')
+
+
+def main():
+    # the former parsers log every header on debug level
+    logging.disable(logging.DEBUG)
+    count = 20000
+    for code, data in MESSAGES.items():
+        for name, parser in PARSERS.items():
+            run(f'{code} {name}', lambda: parser(data), count)
+
+
+if __name__ == '__main__':
+    main()
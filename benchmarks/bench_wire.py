@@ -0,0 +1,95 @@
+''' microbenchmarks for building sip requests
+
+compares rendering requests to bytes through the SIPRequest classes with
+the precompiled templates of voip.wire. run from the project directory with
+    python -m benchmarks.bench_wire
+'''
+import timeit
+
+from voip.sipmessage import Register, Invite, Ack, Bye
+from voip.sdp import offer
+from voip.wire import Templates
+
+SERVER = '192.168.178.1'
+CALLER = '"auser" <sip:auser@192.168.178.1>'
+CALL_ID = '1f0e2d3c4b5a69788796a5b4c3d2e1f0'
+NUMBER = '01752002091'
+TO = '<sip:01752002091@192.168.178.1>;tag=5C0D1E2F3A4B5C6D'
+AUTHORIZATION = (
+    'Digest username="auser", realm="fritz.box", nonce="4E1BD2A7B7B0E26F", '
+    'uri="sip:192.168.178.1;transport=UDP", '
+    'response="7b0c1d2e3f405162738495a6b7c8d9e0", algorithm=MD5'
+    )
+SDP = offer('192.168.178.20', 16384, session=4711)
+
+TEMPLATES = Templates(SERVER, CALLER)
+
+
+def register_request():
+    request = Register(SERVER, CALLER, CALL_ID, 2)
+    request.set('Authorization', AUTHORIZATION)
+    return bytes(request)
+
+
+def register_template():
+    request = TEMPLATES.register(CALL_ID, 2)
+    request.set('Authorization', AUTHORIZATION)
+    return bytes(request)
+
+
+def invite_request():
+    request = Invite(SERVER, CALLER, CALL_ID, NUMBER)
+    request.set('Content-Type', 'application/sdp')
+    request.set_content(SDP)
+    return bytes(request)
+
+
+def invite_template():
+    request = TEMPLATES.invite(CALL_ID, NUMBER)
+    request.set('Content-Type', 'application/sdp')
+    request.set_content(SDP)
+    return bytes(request)
+
+
+def ack_request():
+    return bytes(Ack(SERVER, CALLER, CALL_ID, NUMBER, 101))
+
+
+def ack_template():
+    return bytes(TEMPLATES.ack(CALL_ID, NUMBER, 101))
+
+
+def bye_request():
+    request = Bye(SERVER, CALLER, CALL_ID, NUMBER, 102)
+    request.set_to(TO)
+    return bytes(request)
+
+
+def bye_template():
+    return bytes(TEMPLATES.bye(CALL_ID, NUMBER, 102, TO))
+
+
+BUILDERS = {
+    'REGISTER': (register_request, register_template),
+    'INVITE': (invite_request, invite_template),
+    'ACK': (ack_request, ack_template),
+    'BYE': (bye_request, bye_template),
+    }
+
+
+def run(name, function, number):
+    seconds = min(timeit.repeat(function, number=number, repeat=5))
+    print(f'{name:<32} {number / seconds:>12,.0f} requests/s')
+    return number / seconds
+
+
+def main():
+    count = 20000
+    for method, (request, template) in BUILDERS.items():
+        before = run(f'{method} SIPRequest', request, count)
+        after = run(f'{method} template', template, count)
+        print(f'{"":<32} {after / before:>12.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+''' benchmark suite of the sip and rtp hot paths
+
+measures every case offline and reports operations per second, the p50
+and p99 latency of one operation, the peak of memory allocated during one
+operation and the memory blocks still allocated per operation afterwards,
+which shows leaks and caches growing without bound. results are written
+as json and compared against a stored baseline:
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --save-baseline
+    python -m benchmarks.suite --baseline benchmarks/baseline.json --check
+
+a case is marked as a regression if its throughput dropped by more than
+`--threshold`, its p99 latency rose by more than `--latency-threshold`,
+which is looser as the tail is noisier, or if it allocates more than
+before. baselines are only comparable on the same machine and python.
+'''
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import time
+import timeit
+import tracemalloc
+import wave
+
+from voip.codec import PCMA
+from voip.rtp import RTPMessage, RTPPacketizer
+from voip.sipmessage import Register, Invite, Ack
+from voip.voip import AsyncVoIP
+
+from benchmarks.bench_sip import MESSAGES, parse_sipmessage, parse_response
+from benchmarks.bench_wire import SERVER, CALLER, CALL_ID, NUMBER, SDP
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+ANNOUNCEMENT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'announcment.wav'
+    )
+CHALLENGE = {
+    'realm': 'fritz.box', 'nonce': '4E1BD2A7B7B0E26F', 'algorithm': 'MD5',
+    }
+CHALLENGE_QOP = dict(CHALLENGE, qop='auth', opaque='5ccc069c403ebaf9')
+
+
+def generate_register():
+    return Register(SERVER, CALLER, CALL_ID, 2).generate()
+
+
+def generate_invite():
+    request = Invite(SERVER, CALLER, CALL_ID, NUMBER)
+    request.set('Content-Type', 'application/sdp')
+    request.set_content(SDP)
+    return request.generate()
+
+
+def generate_ack():
+    return Ack(SERVER, CALLER, CALL_ID, NUMBER, 101).generate()
+
+
+def cases():
+    ''' (name, function) of every case, each call is one operation
+    '''
+    result = []
+    for code, data in MESSAGES.items():
+        result.append((f'parse {code} SIPMessage.from_text',
+            lambda data=data: parse_sipmessage(data)))
+        result.append((f'parse {code} protocol.Response',
+            lambda data=data: parse_response(data)))
+
+    result.append(('generate Register', generate_register))
+    result.append(('generate Invite', generate_invite))
+    result.append(('generate Ack', generate_ack))
+    result.append(('str Register', lambda: str(Register(
+        SERVER, CALLER, CALL_ID, 2
+        ))))
+
+    voip = AsyncVoIP(SERVER, 'auser', 'apassword')
+    result.append(('gen_authorization',
+        lambda: voip.gen_authorization(CHALLENGE, 'REGISTER')))
+    result.append(('gen_authorization qop',
+        lambda: voip.gen_authorization(CHALLENGE_QOP, 'INVITE')))
+
+    message = RTPMessage(payload_type=8, ssrc=0x1234)
+    buffer = bytearray(message.size)
+    packet = message.to_bytes()
+
+    def pack():
+        message.sequence_number = (message.sequence_number + 1) & 0xffff
+        message.pack_into(buffer)
+
+    result.append(('RTPMessage pack_into', pack))
+    result.append(('RTPMessage to_bytes', message.to_bytes))
+    result.append(('RTPMessage from_bytes',
+        lambda: RTPMessage.from_bytes(packet)))
+    result.append(('RTPMessage unpack_from',
+        lambda: message.unpack_from(packet)))
+
+    with wave.open(ANNOUNCEMENT, 'rb') as f:
+        sampwidth = f.getsampwidth()
+        audio = f.readframes(f.getnframes())
+    codec = PCMA()
+    encoded = codec.encode(audio, sampwidth)
+    packetizer = RTPPacketizer(codec.payload_type, codec.clockrate)
+    result.append(('announcment.wav encode',
+        lambda: codec.encode(audio, sampwidth)))
+    result.append(('announcment.wav packetize',
+        lambda: sum(1 for _ in packetizer.packets(encoded))))
+    return result
+
+
+def latencies(function, samples, batch):
+    ''' the latency of one operation in nanoseconds, measured over
+    `samples` batches of `batch` calls to stay above the clock resolution
+    '''
+    clock = time.perf_counter_ns
+    values = []
+    # like timeit, collections of unrelated garbage are left out
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(samples):
+            started = clock()
+            for _ in range(batch):
+                function()
+            values.append((clock() - started) / batch)
+    finally:
+        if enabled:
+            gc.enable()
+    values.sort()
+    return values
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def allocations(function, number):
+    ''' (peak bytes allocated during one operation, blocks still allocated
+    per operation after `number` operations)
+    '''
+    function()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    gc.collect()
+    before = sys.getallocatedblocks()
+    for _ in range(number):
+        function()
+    gc.collect()
+    retained = (sys.getallocatedblocks() - before) / number
+    return max(0, peak - current), round(max(0.0, retained), 2)
+
+
+def measure(function, duration=0.2, samples=200):
+    ''' the results of one case, each measurement takes about `duration`
+    '''
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * duration / max(elapsed, 1e-9)))
+    seconds = min(timer.repeat(repeat=5, number=number))
+    batch = max(1, number // samples)
+    # like the best of the timeit repeats, the lowest percentiles of a few
+    # rounds leave out most of the noise of other processes
+    rounds = [latencies(function, samples, batch) for _ in range(3)]
+    p50 = min(percentile(values, 0.5) for values in rounds)
+    p99 = min(percentile(values, 0.99) for values in rounds)
+    peak, retained = allocations(function, min(number, 1000))
+    return {
+        'ops_per_sec': round(number / seconds, 1),
+        'p50_us': round(p50 / 1000, 3),
+        'p99_us': round(p99 / 1000, 3),
+        'alloc_peak_bytes': peak,
+        'retained_blocks': retained,
+        }
+
+
+def compare(results, baseline, threshold, latency_threshold):
+    ''' {case: [reasons]} of the cases which got worse than `baseline`
+    '''
+    regressions = {}
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        reasons = []
+        if result['ops_per_sec'] < before['ops_per_sec'] * (1 - threshold):
+            reasons.append('ops/s {:,.0f} -> {:,.0f}'.format(
+                before['ops_per_sec'], result['ops_per_sec']
+                ))
+        if result['p99_us'] > before['p99_us'] * (1 + latency_threshold):
+            reasons.append(
+                f'p99 {before["p99_us"]}us -> {result["p99_us"]}us'
+                )
+        # a little slack for the allocator's rounding
+        if result['alloc_peak_bytes'] > before['alloc_peak_bytes'] * 1.05 \
+                + 64:
+            reasons.append(
+                f'peak {before["alloc_peak_bytes"]}B -> ' +
+                f'{result["alloc_peak_bytes"]}B'
+                )
+        if result['retained_blocks'] > before['retained_blocks'] + 0.5:
+            reasons.append(
+                f'retained blocks {before["retained_blocks"]} -> ' +
+                f'{result["retained_blocks"]}'
+                )
+        if reasons:
+            regressions[name] = reasons
+    return regressions
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'system': platform.system(),
+        }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='benchmark the sip and rtp hot paths'
+        )
+    parser.add_argument('--output', help='write the results as json')
+    parser.add_argument(
+        '--baseline', default=BASELINE, help='results to compare against'
+        )
+    parser.add_argument(
+        '--save-baseline', action='store_true',
+        help='store the results as the new baseline'
+        )
+    parser.add_argument(
+        '--threshold', type=float, default=0.15,
+        help='relative drop of ops/s counted as a regression'
+        )
+    parser.add_argument(
+        '--latency-threshold', type=float, default=0.5,
+        help='relative rise of the p99 latency counted as a regression'
+        )
+    parser.add_argument(
+        '--check', action='store_true',
+        help='exit with status 1 if any case regressed'
+        )
+    parser.add_argument('--duration', type=float, default=0.2)
+    parser.add_argument(
+        '--filter', default='', help='only run cases containing this text'
+        )
+    args = parser.parse_args(args)
+
+    # the parsers log every header on debug level
+    logging.disable(logging.DEBUG)
+    results = {}
+    for name, function in cases():
+        if args.filter not in name:
+            continue
+        results[name] = result = measure(function, args.duration)
+        print(f'{name:<36} {result["ops_per_sec"]:>12,.0f} ops/s ' +
+            f'p50 {result["p50_us"]:>9.2f}us p99 {result["p99_us"]:>9.2f}us ' +
+            f'peak {result["alloc_peak_bytes"]:>7}B', file=sys.stderr)
+
+    report = {'environment': environment(), 'results': results}
+    regressions = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('environment') != report['environment']:
+            print('the baseline was taken on another environment',
+                file=sys.stderr)
+        regressions = compare(
+            results, baseline['results'], args.threshold,
+            args.latency_threshold
+            )
+        report['baseline'] = args.baseline
+        report['regressions'] = regressions
+        for name, reasons in regressions.items():
+            print(f'REGRESSION {name}: {", ".join(reasons)}', file=sys.stderr)
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            f.write(text + '\n')
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    elif not args.save_baseline:
+        print(text)
+    return 1 if args.check and regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+''' asyncio sip transport
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import unittest
+
+from voip.aio import RECEIVED, SIPProtocol
+from voip.sipparser import SIPView
+
+
+def request(method, to='<sip:u@127.0.0.1>;tag=abc'):
+    return (
+        f'{method} sip:u@127.0.0.1 SIP/2.0\r\n'
+        'Via: SIP/2.0/UDP 127.0.0.2:5060;branch=z9hG4bKremote\r\n'
+        'From: <sip:100@127.0.0.2>;tag=remote\r\n'
+        f'To: {to}\r\n'
+        'Call-ID: call@127.0.0.2\r\n'
+        f'CSeq: 2 {method}\r\n'
+        'Content-Length: 0\r\n\r\n'
+        ).encode('utf8')
+
+
+class Transport():
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append((data, addr))
+
+
+class SIPProtocolTest(unittest.TestCase):
+    def setUp(self):
+        self.received = []
+        self.protocol = SIPProtocol(
+            '127.0.0.1', callback=self.received.append, wheel=object()
+            )
+        self.transport = Transport()
+        self.protocol.transport = self.transport
+        self.addr = ('127.0.0.2', 5060)
+
+    def answer(self, method, **kwargs):
+        data = request(method, **kwargs)
+        self.protocol.datagram_received(data, self.addr)
+        self.assertEqual(self.received[-1], data)
+        if not self.transport.sent:
+            return None
+        data, addr = self.transport.sent.pop()
+        self.assertEqual(addr, self.addr)
+        return SIPView(data)
+
+    def test_remote_bye_is_answered(self):
+        msg = self.answer('BYE')
+        self.assertEqual(msg.code, 200)
+        self.assertEqual(msg.get('To'), '<sip:u@127.0.0.1>;tag=abc')
+        self.assertEqual(msg.get('Call-ID'), 'call@127.0.0.2')
+        self.assertEqual(msg.get('CSeq'), '2 BYE')
+        self.assertEqual(msg.branch, 'z9hG4bKremote')
+
+    def test_options_get_a_tag(self):
+        msg = self.answer('OPTIONS', to='<sip:u@127.0.0.1>')
+        self.assertEqual(msg.code, 200)
+        self.assertIn(';tag=', msg.get('To'))
+        self.assertIn('OPTIONS', msg.get('Allow'))
+
+    def test_other_requests(self):
+        self.assertEqual(self.answer('INVITE').code, 405)
+        self.assertEqual(self.answer('CANCEL').code, 481)
+        self.assertIsNone(self.answer('ACK'))
+
+    def test_undecodable_datagram_is_dropped(self):
+        # the debug log of received datagrams must not fail on them
+        self.protocol.log.setLevel('DEBUG')
+        self.addCleanup(self.protocol.log.setLevel, 'NOTSET')
+        self.protocol.datagram_received(b'\xff\xfe\x00garbage', self.addr)
+        self.assertEqual(self.transport.sent, [])
+
+    def test_unknown_methods_share_a_label(self):
+        other = RECEIVED.labels('other', '')
+        before = other.value
+        for index in range(3):
+            self.answer(f'X{index}')
+        self.assertEqual(other.value, before + 3)
+        self.assertNotIn(('X0', ''), RECEIVED.children)
+
+
+if __name__ == '__main__':
+    unittest.main()
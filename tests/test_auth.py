@@ -0,0 +1,79 @@
+''' digest authentication
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import unittest
+from unittest import mock
+
+from voip.auth import CredentialCache, parse_digest
+
+CHALLENGE = 'Digest realm="testrealm@host.com", qop="auth,auth-int", ' \
+    'nonce="dcd98b7102dd2f0e8b11d0f600bfb0c093", ' \
+    'opaque="5ccc069c403ebaf9f0171e9517f40e41"'
+
+
+class CredentialCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = CredentialCache()
+        self.server = ('10.0.0.1', 5060)
+
+    def test_rfc2617_example(self):
+        nonce, retry = self.cache.challenge(
+            self.server, 'WWW-Authenticate', CHALLENGE
+            )
+        self.assertTrue(retry)
+        with mock.patch('voip.auth.os.urandom',
+                return_value=bytes.fromhex('0a4f113b')):
+            value = self.cache.authorization(
+                nonce, 'Mufasa', 'Circle Of Life', 'GET', '/dir/index.html'
+                )
+        values = parse_digest(value)
+        self.assertEqual(
+            values['response'], '6629fae49393a05397450978507c4ef1'
+            )
+        self.assertEqual(values['nc'], '00000001')
+        self.assertEqual(values['opaque'], '5ccc069c403ebaf9f0171e9517f40e41')
+
+    def test_servers_sharing_a_realm_keep_their_nonces(self):
+        other = ('10.0.0.2', 5060)
+        self.cache.challenge(
+            self.server, 'WWW-Authenticate', 'Digest realm="pbx",nonce="a"'
+            )
+        self.cache.challenge(
+            other, 'WWW-Authenticate', 'Digest realm="pbx",nonce="b"'
+            )
+        self.assertEqual(
+            [nonce.nonce for nonce in self.cache.preemptive(self.server)],
+            ['a']
+            )
+        self.assertEqual(
+            [nonce.nonce for nonce in self.cache.preemptive(other)], ['b']
+            )
+
+    def test_same_nonce_without_stale_is_not_retried(self):
+        nonce, _ = self.cache.challenge(
+            self.server, 'Proxy-Authenticate', CHALLENGE
+            )
+        request = {'Proxy-Authorization': self.cache.authorization(
+            nonce, 'Mufasa', 'Circle Of Life', 'INVITE', 'sip:100@host'
+            )}
+        _, retry = self.cache.challenge(
+            self.server, 'Proxy-Authenticate', CHALLENGE, request
+            )
+        self.assertFalse(retry)
+        _, retry = self.cache.challenge(
+            self.server, 'Proxy-Authenticate', CHALLENGE + ', stale=TRUE',
+            request
+            )
+        self.assertTrue(retry)
+
+    def test_forget(self):
+        self.cache.challenge(self.server, 'WWW-Authenticate', CHALLENGE)
+        self.assertEqual(len(self.cache.preemptive(self.server)), 1)
+        self.cache.forget(self.server)
+        self.assertEqual(self.cache.preemptive(self.server), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+''' benchmark suite
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import contextlib
+import io
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks import suite
+
+RESULT = {
+    'ops_per_sec': 1000.0, 'p50_us': 1.0, 'p99_us': 2.0,
+    'alloc_peak_bytes': 1000, 'retained_blocks': 0.0,
+    }
+
+
+class CompareTest(unittest.TestCase):
+    def compare(self, **changes):
+        return suite.compare(
+            {'case': dict(RESULT, **changes)}, {'case': RESULT}, 0.15, 0.5
+            )
+
+    def test_noise_within_the_thresholds(self):
+        regressions = self.compare(
+            ops_per_sec=900.0, p99_us=2.9, alloc_peak_bytes=1100,
+            retained_blocks=0.4
+            )
+        self.assertEqual(regressions, {})
+
+    def test_each_regression_is_reported(self):
+        regressions = self.compare(
+            ops_per_sec=800.0, p99_us=3.5, alloc_peak_bytes=2000,
+            retained_blocks=1.0
+            )
+        self.assertEqual(len(regressions['case']), 4)
+
+    def test_new_cases_have_no_baseline(self):
+        self.assertEqual(
+            suite.compare({'new': RESULT}, {'case': RESULT}, 0.15, 0.5), {}
+            )
+
+
+class SuiteTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        # main() silences debug logging for the whole process
+        self.addCleanup(logging.disable, logging.NOTSET)
+
+    def run_suite(self, *args):
+        output = os.path.join(self.directory, 'results.json')
+        with contextlib.redirect_stderr(io.StringIO()):
+            status = suite.main([
+                '--filter', 'RTPMessage pack_into', '--duration', '0.01',
+                '--output', output, *args
+                ])
+        with open(output) as f:
+            return status, json.load(f)
+
+    def test_check_against_a_faster_baseline(self):
+        baseline = os.path.join(self.directory, 'baseline.json')
+        status, report = self.run_suite('--baseline', baseline)
+        self.assertEqual(status, 0)
+        self.assertEqual(list(report['results']), ['RTPMessage pack_into'])
+        self.assertNotIn('regressions', report)
+
+        result = report['results']['RTPMessage pack_into']
+        result['ops_per_sec'] *= 10
+        with open(baseline, 'w') as f:
+            json.dump(report, f)
+        status, report = self.run_suite('--baseline', baseline, '--check')
+        self.assertEqual(status, 1)
+        self.assertIn('RTPMessage pack_into', report['regressions'])
+
+
+if __name__ == '__main__':
+    unittest.main()
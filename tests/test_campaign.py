@@ -0,0 +1,87 @@
+''' outbound campaigns
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import asyncio
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from voip.campaign import Campaign, TokenBucket
+from voip.codec import PCMA
+from voip.store import AnnouncementStore
+
+ANNOUNCEMENT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'announcment.wav'
+    )
+
+
+class Call():
+    payload_type = 8
+    ptime = 20
+
+    def __init__(self, codec):
+        self.codec = codec
+
+    def stream_announcement(self, announcement, scheduler, done):
+        pass
+
+
+class VoIP():
+    ''' answers every call with `call` and records the hangups
+    '''
+    def __init__(self, call):
+        self.call_object = call
+        self.hangups = []
+
+    async def call(self, number, timeout):
+        return self.call_object
+
+    async def hangup(self, call):
+        self.hangups.append(call)
+
+
+class CampaignTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = AnnouncementStore(self.directory)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def dial(self, call):
+        voip = VoIP(call)
+        campaign = Campaign(voip, self.store, ANNOUNCEMENT, scheduler=object())
+        result = asyncio.run(campaign.dial('100'))
+        self.assertEqual(voip.hangups, [call])
+        return result
+
+    def test_call_without_common_codec(self):
+        result = self.dial(Call(None))
+        self.assertEqual(result.result, 'no-codec')
+
+    def test_announcement_which_never_ends_times_out(self):
+        # the stream of Call never calls done, give up right away
+        with mock.patch('voip.campaign.PLAY_SLACK', -3600):
+            result = self.dial(Call(PCMA()))
+        self.assertEqual(result.result, 'error')
+        self.assertIn('did not finish', result.error)
+
+    def test_token_bucket_limits_the_rate(self):
+        now = [0.0]
+        bucket = TokenBucket(2, burst=2, clock=lambda: now[0])
+        self.assertTrue(bucket.try_acquire())
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+        now[0] += 0.5
+        self.assertTrue(bucket.try_acquire())
+        self.assertFalse(bucket.try_acquire())
+
+
+if __name__ == '__main__':
+    unittest.main()
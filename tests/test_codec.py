@@ -0,0 +1,66 @@
+''' G.711 codecs
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import unittest
+import warnings
+from array import array
+from unittest import mock
+
+from voip import codec
+from voip.codec import PCMA, PCMU, select_codec
+
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore', DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:
+        audioop = None
+
+# every signed 16 bit sample, little endian
+SAMPLES = array('h', range(-0x8000, 0x8000)).tobytes()
+VALUES = bytes(range(256))
+
+
+@unittest.skipIf(audioop is None, 'audioop is not available')
+class AudioopTest(unittest.TestCase):
+    ''' the tables match the reference implementation of the standard library
+    '''
+    def test_ulaw(self):
+        self.assertEqual(PCMU().encode(SAMPLES), audioop.lin2ulaw(SAMPLES, 2))
+        self.assertEqual(PCMU().decode(VALUES), audioop.ulaw2lin(VALUES, 2))
+
+    def test_alaw(self):
+        self.assertEqual(PCMA().encode(SAMPLES), audioop.lin2alaw(SAMPLES, 2))
+        self.assertEqual(PCMA().decode(VALUES), audioop.alaw2lin(VALUES, 2))
+
+    def test_unsigned_8_bit(self):
+        data = bytes(range(256))
+        self.assertEqual(
+            PCMU().encode(data, 1),
+            audioop.lin2ulaw(audioop.bias(data, 1, -128), 1)
+            )
+
+
+class FallbackTest(unittest.TestCase):
+    ''' the standard library lookup gives the same result as numpy
+    '''
+    def test_without_numpy(self):
+        for cls in (PCMU, PCMA):
+            expected = cls().encode(SAMPLES), cls().decode(VALUES)
+            with mock.patch.object(codec, 'numpy', None), \
+                    mock.patch.object(codec.G711Codec, '_tables', {}):
+                fallback = cls()
+                self.assertEqual(
+                    (fallback.encode(SAMPLES), fallback.decode(VALUES)),
+                    expected
+                    )
+
+    def test_select_codec_follows_the_offer(self):
+        self.assertIsInstance(select_codec(['101', '8', '0']), PCMA)
+        self.assertIsNone(select_codec(['9', 'x']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+''' dtmf and call progress tone detection
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import math
+import random
+import unittest
+from array import array
+from unittest import mock
+
+from voip import detect
+from voip.detect import COLUMNS, KEYS, ROWS, TONES, ToneDetector
+
+
+class Signal():
+    ''' frames of 20ms of a sum of sines with continuous phase
+    '''
+    def __init__(self):
+        self.position = 0
+
+    def frame(self, frequencies=(), amplitude=8000):
+        samples = array('h')
+        for n in range(self.position, self.position + 160):
+            samples.append(round(sum(
+                amplitude * math.sin(2 * math.pi * f * n / 8000)
+                for f in frequencies
+                )))
+        self.position += 160
+        return samples.tobytes()
+
+    def key(self, key):
+        index = KEYS.index(key)
+        return self.frame((ROWS[index // 4], COLUMNS[index % 4]))
+
+
+class ToneDetectorTest(unittest.TestCase):
+    def run_streams(self, streams):
+        ''' feed the frames of every stream tick by tick, the events
+        '''
+        events = []
+        detector = ToneDetector(
+            lambda key, kind, value: events.append((key, kind, value))
+            )
+        for key in streams:
+            detector.add(key)
+        for tick in range(max(map(len, streams.values()))):
+            for key, frames in streams.items():
+                if tick < len(frames):
+                    detector.feed(key, frames[tick])
+            detector.run()
+        return events
+
+    def dtmf(self):
+        signal = Signal()
+        silence = signal.frame()
+        a = [signal.key('1')] * 3 + [silence] + [signal.key('1')] * 2 + \
+            [signal.key('#')] * 2
+        b = [silence] * 2 + [signal.key('9')] * 4
+        return self.run_streams({'a': a, 'b': b})
+
+    def test_dtmf_keys_of_several_streams(self):
+        events = self.dtmf()
+        self.assertEqual(
+            [value for key, kind, value in events if key == 'a'],
+            ['1', '1', '#']
+            )
+        self.assertEqual(events.count(('b', 'dtmf', '9')), 1)
+
+    def test_single_frames_are_not_reported(self):
+        signal = Signal()
+        frames = [signal.key(key) for key in '123']
+        self.assertEqual(self.run_streams({'a': frames}), [])
+
+    def test_call_progress_tone(self):
+        signal = Signal()
+        ringback = [signal.frame(TONES['ringback'], 4000) for _ in range(12)]
+        self.assertEqual(
+            self.run_streams({'a': ringback}), [('a', 'tone', 'ringback')]
+            )
+
+    def test_noise_is_no_tone(self):
+        generator = random.Random(1)
+        noise = [
+            array('h', (generator.randint(-8000, 8000) for _ in range(160)))
+            .tobytes() for _ in range(20)
+            ]
+        self.assertEqual(self.run_streams({'a': noise}), [])
+
+    @unittest.skipIf(detect.numpy is None, 'numpy is not available')
+    def test_python_fallback_gives_the_same_events(self):
+        expected = self.dtmf()
+        with mock.patch.object(detect, 'numpy', None):
+            self.assertEqual(self.dtmf(), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+''' loopback server and load test
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import asyncio
+import unittest
+
+from voip.loopback import LoadTest, parse_script, serve
+
+
+class LoopbackTest(unittest.IsolatedAsyncioTestCase):
+    async def load(self, password='secret', **options):
+        server = await serve('127.0.0.1', 0, **options)
+        try:
+            host, port = server.address
+            test = LoadTest(
+                host, port, clients=2, calls=3, hold=0.1, password=password,
+                timeout=5.0
+                )
+            summary = await test.run()
+            # the last packets may still be on their way
+            await asyncio.sleep(0.05)
+            return summary, server.summary()
+        finally:
+            server.close()
+
+    async def test_calls_with_proxy_challenge(self):
+        summary, server = await self.load(challenge=407)
+        self.assertEqual(summary['registered'], 2)
+        self.assertEqual(summary['answered'], 3)
+        self.assertEqual(summary['failures'], {})
+        self.assertEqual(server['registered'], 2)
+        self.assertEqual(server['rtp']['packets'], summary['packets_sent'])
+        self.assertEqual(server['rtp']['streams'], 3)
+        self.assertEqual(server['rtp']['lost'], 0)
+        self.assertGreater(summary['packets_sent'], 0)
+
+    async def test_wrong_password_fails_registration(self):
+        summary, server = await self.load(password='wrong')
+        self.assertEqual(summary['registered'], 0)
+        self.assertEqual(summary['answered'], 0)
+        self.assertEqual(server['registered'], 0)
+        self.assertEqual(sum(summary['failures'].values()), 2)
+
+    def test_parse_script(self):
+        self.assertEqual(
+            parse_script('100, 180:0.1,486:0.5'),
+            ((100, 0.0), (180, 0.1), (486, 0.5))
+            )
+        with self.assertRaises(ValueError):
+            parse_script('100,183:0.1')
+
+
+if __name__ == '__main__':
+    unittest.main()
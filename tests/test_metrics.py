@@ -0,0 +1,47 @@
+''' metrics registry
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import sys
+import unittest
+from threading import Thread
+
+from voip.metrics import Registry
+
+
+class RegistryTest(unittest.TestCase):
+    def test_reset_keeps_cached_children(self):
+        registry = Registry()
+        counter = registry.counter('calls_total', 'calls', ('result',))
+        answered = counter.labels('answered')
+        answered.inc(3)
+        registry.reset()
+        self.assertEqual(answered.value, 0)
+        answered.inc()
+        self.assertIn('calls_total{result="answered"} 1', registry.expose())
+
+    def test_concurrent_updates_are_not_lost(self):
+        registry = Registry()
+        counter = registry.counter('sent_total', 'sent')
+        histogram = registry.histogram('parse_seconds', 'parse time')
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-6)
+
+        def update():
+            for _ in range(20000):
+                counter.inc()
+                histogram.observe(0.001)
+
+        threads = [Thread(target=update) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.value, 80000)
+        self.assertEqual(histogram.count, 80000)
+        self.assertEqual(sum(histogram.counts), 80000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+''' rtp/rtcp port pool
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import socket
+import unittest
+
+from voip.ports import PortPool
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class PortPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.pool = PortPool(
+            '127.0.0.1', start=41001, end=41199, reserve=0, clock=self.clock
+            )
+        self.addCleanup(self.pool.close)
+
+    def test_pairs_are_even_and_odd(self):
+        pair = self.pool.acquire()
+        self.assertEqual(pair.port, 41002)
+        self.assertEqual(pair.rtp.getsockname(), ('127.0.0.1', 41002))
+        self.assertEqual(pair.rtcp.getsockname(), ('127.0.0.1', 41003))
+        pair.release()
+
+    def test_quarantine_and_drain_keep_the_mode(self):
+        pair = self.pool.acquire()
+        pair.rtp.setblocking(False)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.sendto(b'late', ('127.0.0.1', pair.port))
+        pair.release()
+        self.assertIsNot(self.pool.acquire(), pair)
+        self.clock.now += self.pool.quarantine
+        self.assertIs(self.pool.acquire(), pair)
+        self.assertFalse(pair.rtp.getblocking())
+        self.assertTrue(pair.rtcp.getblocking())
+        with self.assertRaises(BlockingIOError):
+            pair.rtp.recv(2048)
+
+    def test_close_starts_the_range_again(self):
+        self.pool.prebind(2)
+        self.pool.close()
+        self.assertEqual(len(self.pool), 0)
+        self.assertEqual(self.pool.acquire().port, 41002)
+
+    def test_reserve_is_bound_in_the_background(self):
+        self.pool.reserve = 4
+        pair = self.pool.acquire()
+        refiller = self.pool.refiller
+        if refiller is not None:
+            refiller.join()
+        self.assertEqual(len(self.pool.free), 4)
+        self.assertEqual(
+            sorted(pair.port for pair in self.pool.free),
+            [41004, 41006, 41008, 41010]
+            )
+        self.assertEqual(self.pool.acquire().port, 41004)
+
+
+if __name__ == '__main__':
+    unittest.main()
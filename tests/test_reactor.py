@@ -0,0 +1,114 @@
+''' selectors reactor and dispatchers
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import socket
+import struct
+import time
+import unittest
+
+from voip.reactor import DialogDispatcher, Reactor, StreamDispatcher
+
+
+class ReactorTest(unittest.TestCase):
+    def setUp(self):
+        self.reactor = Reactor(burst=4)
+        self.addCleanup(self.reactor.close)
+        self.sockets = []
+        self.sender = self.socket()
+
+    def socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(('127.0.0.1', 0))
+        self.addCleanup(sock.close)
+        return sock
+
+    def poll(self, expected):
+        ''' poll until `expected` datagrams were dispatched
+        '''
+        count = 0
+        deadline = time.monotonic() + 1
+        while count < expected and time.monotonic() < deadline:
+            count += self.reactor.poll(0.1)
+        return count
+
+    def test_datagrams_of_all_sockets_reach_their_handler(self):
+        received = {}
+        socks = [self.socket() for _ in range(3)]
+        for index, sock in enumerate(socks):
+            self.reactor.register(
+                sock, lambda data, address, index=index:
+                    received.setdefault(index, []).append(bytes(data))
+                )
+        for index, sock in enumerate(socks):
+            for count in range(index + 1):
+                self.sender.sendto(
+                    b'%d-%d' % (index, count), sock.getsockname()
+                    )
+        self.assertEqual(self.poll(6), 6)
+        self.assertEqual(received[2], [b'2-0', b'2-1', b'2-2'])
+        self.assertEqual(len(self.reactor), 3)
+
+    def test_burst_and_failing_handler(self):
+        sock = self.socket()
+        calls = []
+
+        def handler(data, address):
+            calls.append(bytes(data))
+            raise RuntimeError('broken handler')
+
+        handle = self.reactor.register(sock, handler)
+        for index in range(6):
+            self.sender.sendto(b'%d' % index, sock.getsockname())
+        time.sleep(0.05)
+        with self.assertLogs('Reactor', 'ERROR'):
+            self.assertEqual(self.reactor.poll(1), 4)
+            self.assertEqual(self.poll(2), 2)
+        self.assertEqual(handle.received, 6)
+
+    def test_unregistered_socket_is_left_alone(self):
+        sock = self.socket()
+        self.reactor.register(sock, lambda data, address: None)
+        self.reactor.unregister(sock)
+        self.assertNotIn(sock, self.reactor)
+        self.sender.sendto(b'x', sock.getsockname())
+        self.assertEqual(self.reactor.poll(0.05), 0)
+        self.assertEqual(sock.recv(10), b'x')
+
+    def test_stop_wakes_the_thread(self):
+        self.reactor.start()
+        started = time.monotonic()
+        self.reactor.stop()
+        self.assertLess(time.monotonic() - started, 0.5)
+
+
+class DispatcherTest(unittest.TestCase):
+    def test_dialogs_by_call_id(self):
+        calls, other = [], []
+        dispatcher = DialogDispatcher(lambda msg, address: other.append(msg))
+        dispatcher.add('abc', lambda msg, address: calls.append(msg))
+        dispatcher(memoryview(b'BYE sip:a SIP/2.0\r\ni: abc\r\n\r\n'), None)
+        dispatcher(b'BYE sip:a SIP/2.0\r\nCall-ID: x\r\n\r\n', None)
+        with self.assertLogs('DialogDispatcher', 'WARNING'):
+            dispatcher(b'garbage', None)
+        self.assertEqual([msg.method for msg in calls], ['BYE'])
+        self.assertEqual(len(other), 1)
+
+    def test_streams_by_ssrc(self):
+        streams = {}
+        dispatcher = StreamDispatcher()
+        for ssrc in (1, 2):
+            dispatcher.add(
+                ssrc, lambda data, address, ssrc=ssrc:
+                    streams.setdefault(ssrc, []).append(bytes(data))
+                )
+        packet = struct.pack('!BBHII', 0x80, 0, 1, 160, 2) + b'audio'
+        dispatcher(packet, None)
+        dispatcher(struct.pack('!BBHII', 0x80, 0, 1, 160, 3), None)
+        dispatcher(b'short', None)
+        self.assertEqual(streams, {2: [packet]})
+
+
+if __name__ == '__main__':
+    unittest.main()
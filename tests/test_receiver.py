@@ -0,0 +1,118 @@
+''' inbound rtp and jitter buffer
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import struct
+import unittest
+
+from voip.receiver import JitterBuffer, RTPReceiver
+
+
+def payload(sequence):
+    return bytes([sequence & 0xff]) * 160
+
+
+class JitterBufferTest(unittest.TestCase):
+    def setUp(self):
+        self.buffer = JitterBuffer(
+            capacity=16, min_depth=2, max_depth=8, slack=8
+            )
+        self.out = bytearray(640)
+
+    def put(self, sequence):
+        # packets arrive in time, the timestamp continues across the wrap
+        data = payload(sequence)
+        position = (sequence - 60000) & 0xffff
+        return self.buffer.put(
+            sequence, position * 160, data, 0, len(data), position * 0.02
+            )
+
+    def pop(self):
+        length = self.buffer.pop_into(self.out)
+        return self.out[0] if length else None
+
+    def test_reordered_packets_across_the_wrap(self):
+        for sequence in (65534, 0, 65535, 2, 1, 3):
+            self.assertTrue(self.put(sequence))
+        popped = [self.pop() for _ in range(6)]
+        self.assertEqual(popped, [0xfe, 0xff, 0, 1, 2, 3])
+        self.assertEqual(self.buffer.lost, 0)
+        self.assertEqual(len(self.buffer), 0)
+
+    def test_duplicate_and_late_packets_are_dropped(self):
+        for sequence in (10, 11, 12):
+            self.put(sequence)
+        self.assertFalse(self.put(11))
+        self.assertEqual(self.pop(), 10)
+        self.assertFalse(self.put(10))
+        self.assertEqual(self.buffer.duplicates, 1)
+        self.assertEqual(self.buffer.late, 1)
+
+    def test_missing_frame_counts_as_lost(self):
+        for sequence in (1, 2, 4):
+            self.put(sequence)
+        self.assertEqual([self.pop() for _ in range(4)], [1, 2, None, 4])
+        self.assertEqual(self.buffer.lost, 1)
+
+    def test_waits_for_the_target_depth(self):
+        self.put(1)
+        self.assertIsNone(self.pop())
+        self.put(2)
+        self.assertEqual(self.pop(), 1)
+
+    def test_deep_buffer_skips_to_catch_up(self):
+        self.buffer.slack = 2
+        for sequence in range(1, 7):
+            self.put(sequence)
+        self.assertEqual([self.pop(), self.pop()], [1, 3])
+        self.assertEqual(self.buffer.skipped, 1)
+
+    def test_sequence_jump_restarts(self):
+        for sequence in (1, 2, 3):
+            self.put(sequence)
+        self.put(1000)
+        self.put(1001)
+        self.assertEqual(self.pop(), 1000 & 0xff)
+
+
+class RTPReceiverTest(unittest.TestCase):
+    def packet(self, sequence, ssrc=0x1234, payload_type=0, extra=b''):
+        # one csrc, a header extension of one word and 3 bytes of padding
+        header = struct.pack(
+            '!BBHII', 0x80 | 0x20 | 0x10 | 1, payload_type, sequence,
+            sequence * 160, ssrc
+            )
+        return header + bytes(4) + struct.pack('!HH', 0xbede, 1) + \
+            bytes(4) + payload(sequence) + extra + b'\x00\x00\x03'
+
+    def test_payload_behind_csrc_extension_and_padding(self):
+        accepted = []
+        receiver = RTPReceiver(payload_types=(0,), callback=accepted.append)
+        receiver(self.packet(7), ('10.0.0.1', 4000))
+        receiver(self.packet(8, payload_type=101), ('10.0.0.1', 4000))
+        receiver(self.packet(8), ('10.0.0.1', 4000))
+        self.assertEqual(len(accepted), 2)
+        out = bytearray(640)
+        self.assertEqual(receiver.pop_into(out), 160)
+        self.assertEqual(bytes(out[:160]), payload(7))
+        self.assertEqual(receiver.ssrc, 0x1234)
+        self.assertEqual(receiver.address, ('10.0.0.1', 4000))
+
+    def test_new_source_restarts_the_buffer(self):
+        receiver = RTPReceiver()
+        receiver(self.packet(7), None)
+        receiver(self.packet(8), None)
+        receiver(self.packet(500, ssrc=0x99), None)
+        self.assertEqual(receiver.ssrc, 0x99)
+        self.assertEqual(len(receiver.buffer), 1)
+
+    def test_invalid_packets_are_ignored(self):
+        receiver = RTPReceiver()
+        receiver(b'\x80\x00', None)
+        receiver(b'\x40' + bytes(20), None)
+        self.assertIsNone(receiver.ssrc)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+''' streaming call recorder
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import os
+import shutil
+import tempfile
+import unittest
+import wave
+
+from voip.codec import PCMA
+from voip.ports import PortPool
+from voip.recorder import CallRecorder, mix
+from voip.timer import TimerWheel
+from voip.voip import VoIPCall
+
+SDP = '''v=0\r
+o=- 1 1 IN IP4 127.0.0.1\r
+s=-\r
+c=IN IP4 127.0.0.1\r
+t=0 0\r
+m=audio 9 RTP/AVP 8\r
+a=rtpmap:8 PCMA/8000\r
+'''
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecorderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'call.wav')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def frames(self):
+        with wave.open(self.path, 'rb') as f:
+            return f.getnchannels(), f.readframes(f.getnframes())
+
+    def test_stereo_interleaves_the_legs(self):
+        with CallRecorder(self.path) as recorder:
+            recorder.write(b'\x01\x02\x03\x04', b'\x05\x06\x07\x08')
+        self.assertEqual(
+            self.frames(), (2, b'\x01\x02\x05\x06\x03\x04\x07\x08')
+            )
+
+    def test_odd_length_leg_is_truncated(self):
+        with CallRecorder(self.path) as recorder:
+            recorder.write(b'\x01\x02\x03', b'\x04\x05\x06\x07')
+        self.assertEqual(
+            self.frames(), (2, b'\x01\x02\x04\x05\x00\x00\x06\x07')
+            )
+
+    def test_mono_mixes_and_clips(self):
+        loud = (0x7000).to_bytes(2, 'little', signed=True)
+        with CallRecorder(self.path, stereo=False) as recorder:
+            recorder.write(loud, loud)
+        self.assertEqual(
+            self.frames(), (1, (0x7fff).to_bytes(2, 'little', signed=True))
+            )
+        self.assertEqual(mix(b'\x01\x00', b'\x02\x00'), b'\x03\x00')
+
+    def test_long_recording_keeps_every_frame(self):
+        frame = bytes(range(160)) * 2
+        # two seconds fit into the default blocks however slow the writer
+        with CallRecorder(self.path) as recorder:
+            for _ in range(100):
+                recorder.write(frame, frame)
+        channels, data = self.frames()
+        self.assertEqual(recorder.dropped, 0)
+        self.assertEqual(len(data), 100 * 2 * len(frame))
+
+
+class CallRecordingTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'call.wav')
+        self.pool = PortPool('127.0.0.1')
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.directory)
+
+    def test_call_records_the_sent_audio(self):
+        clock = Clock()
+        wheel = TimerWheel(clock=clock)
+        call = VoIPCall(SDP, media=self.pool.acquire())
+        call.record(self.path, wheel)
+        sample = (0x1000).to_bytes(2, 'little', signed=True)
+        packets = call.get_sender().packetizer.packets(
+            PCMA().encode(sample * 160 * 3)
+            )
+        for packet in packets:
+            # the scheduler sends a packet, then the recording timer fires
+            clock.now += 0.02
+            wheel.advance()
+        call.hangup()
+
+        with wave.open(self.path, 'rb') as f:
+            self.assertEqual(f.getnchannels(), 2)
+            data = f.readframes(f.getnframes())
+        frames = [data[index:index + 4] for index in range(0, len(data), 4)]
+        decoded = PCMA().decode(PCMA().encode(sample))
+        self.assertEqual(len(frames), 3 * 160)
+        self.assertEqual(set(frames), {bytes(2) + decoded})
+        self.assertIsNone(call.get_sender().packetizer.monitor)
+
+
+if __name__ == '__main__':
+    unittest.main()
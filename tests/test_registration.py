@@ -0,0 +1,79 @@
+''' registration of many accounts
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import asyncio
+import unittest
+from unittest import mock
+
+from voip.registration import RegistrationManager
+from voip.timer import TimerWheel
+
+
+class Protocol():
+    def __init__(self, wheel):
+        self.wheel = wheel
+        self.local = ('127.0.0.1', 5060)
+
+
+class RegistrationManagerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.now = 1000.0
+        self.wheel = TimerWheel(clock=lambda: self.now)
+        self.manager = RegistrationManager(
+            '127.0.0.1', protocol=Protocol(self.wheel), spread=10.0
+            )
+        self.registered = []
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+
+        async def register(voip, expires=None):
+            self.registered.append((voip.user, expires))
+            if expires:
+                self.started.set()
+                await self.release.wait()
+            return 60
+
+        patcher = mock.patch(
+            'voip.registration.AsyncVoIP.register', register
+            )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def advance(self, seconds):
+        self.now += seconds
+        self.wheel.advance()
+
+    async def test_first_registrations_are_spread(self):
+        with mock.patch('voip.registration.random.uniform',
+                side_effect=[2.0, 7.0]):
+            self.manager.add('100', 'secret')
+            self.manager.add('101', 'secret')
+        self.advance(1.0)
+        await asyncio.sleep(0)
+        self.assertEqual(self.manager.states(), {'new': 2})
+        self.advance(1.5)
+        await asyncio.sleep(0)
+        self.assertEqual(self.registered, [('100', 3600)])
+        self.advance(5.0)
+        await asyncio.sleep(0)
+        self.assertEqual(self.registered, [('100', 3600), ('101', 3600)])
+
+    async def test_remove_while_registering_unregisters(self):
+        self.manager.add('100', 'secret')
+        self.advance(self.manager.spread)
+        await self.started.wait()
+        self.assertEqual(self.manager['100'].state, 'registering')
+        await self.manager.remove('100')
+        self.assertEqual(self.registered, [('100', 3600), ('100', 0)])
+
+    async def test_remove_before_registering_sends_nothing(self):
+        self.manager.add('100', 'secret')
+        account = await self.manager.remove('100')
+        self.assertEqual(account.state, 'removed')
+        self.assertEqual(self.registered, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
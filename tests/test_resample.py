@@ -0,0 +1,83 @@
+''' sample rate and channel conversion
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import math
+import unittest
+from array import array
+from unittest import mock
+
+from voip import resample
+from voip.resample import Converter
+
+
+def tone(frequency, rate, seconds=0.5, amplitude=10000, channels=1):
+    ''' little endian 16 bit pcm of a sine tone
+    '''
+    samples = array('h')
+    for n in range(int(rate * seconds)):
+        value = round(amplitude * math.sin(2 * math.pi * frequency * n / rate))
+        samples.extend([value] * channels)
+    return samples.tobytes()
+
+
+def rms(data, skip=200):
+    ''' root mean square of 16 bit pcm without the filter's settling
+    '''
+    samples = array('h', data)[skip:-skip]
+    return math.sqrt(sum(sample * sample for sample in samples) / len(samples))
+
+
+class ConverterTest(unittest.TestCase):
+    def convert(self, data, channels, rate, chunk=None):
+        converter = Converter(channels, rate, 2, 8000)
+        chunk = chunk or len(data)
+        output = b''.join(
+            converter.convert(data[start:start + chunk])
+            for start in range(0, len(data), chunk)
+            )
+        return output + converter.flush()
+
+    def test_passband_keeps_the_amplitude(self):
+        output = self.convert(tone(1000, 44100), 1, 44100)
+        self.assertEqual(len(output), 2 * 4000)
+        self.assertAlmostEqual(
+            rms(output) / (10000 / math.sqrt(2)), 1.0, delta=0.02
+            )
+
+    def test_tones_above_nyquist_do_not_alias(self):
+        # 6 kHz would fold down to 2 kHz without the low pass
+        output = self.convert(tone(6000, 48000), 1, 48000)
+        self.assertLess(rms(output), 10000 / math.sqrt(2) * 0.01)
+
+    def test_chunks_give_the_same_output(self):
+        data = tone(440, 16000)
+        self.assertEqual(
+            self.convert(data, 1, 16000, chunk=333),
+            self.convert(data, 1, 16000)
+            )
+
+    def test_stereo_is_mixed_down(self):
+        left = array('h', [1000, -2000] * 100)
+        right = array('h', [3000, 2000] * 100)
+        stereo = array('h')
+        for pair in zip(left, right):
+            stereo.extend(pair)
+        output = array('h', self.convert(stereo.tobytes(), 2, 8000))
+        self.assertEqual(list(output[:4]), [2000, 0, 2000, 0])
+
+    @unittest.skipIf(resample.numpy is None, 'numpy is not available')
+    def test_python_fallback_matches_numpy(self):
+        data = tone(1000, 11025, seconds=0.1)
+        expected = array('h', self.convert(data, 1, 11025))
+        with mock.patch.object(resample, 'numpy', None):
+            fallback = array('h', self.convert(data, 1, 11025))
+        self.assertEqual(len(fallback), len(expected))
+        self.assertLessEqual(
+            max(abs(a - b) for a, b in zip(fallback, expected)), 2
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+''' rtcp sender reports
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import unittest
+
+from voip.rtcp import RTCPSession, HEADER, SENDER_INFO
+from voip.rtp import RTPPacketizer
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SenderReportTest(unittest.TestCase):
+    def test_timestamp_matches_the_report_time(self):
+        clock = Clock()
+        packetizer = RTPPacketizer(8, 8000, sampwidth=1, clock=clock)
+        start = packetizer.message.timestamp
+        packets = packetizer.packets(bytes(160 * 10))
+        for _ in range(3):
+            next(packets)
+            clock.now += 0.02
+        # the last packet went out 20ms ago, the next is not sent yet
+        session = RTCPSession(
+            None, ('127.0.0.1', 5005), 1, 'cname', packetizer=packetizer
+            )
+        report = session.build()
+        timestamp = SENDER_INFO.unpack_from(report, HEADER.size)[2]
+        self.assertEqual(timestamp, (start + 3 * 160) & 0xffffffff)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+''' rtp headers and packetizer
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import time
+import unittest
+
+from voip.rtp import RTPMessage, RTPPacketizer, RTPSender
+from voip.timer import TimerWheel
+
+
+class RTPMessageTest(unittest.TestCase):
+    def test_round_trip(self):
+        message = RTPMessage(
+            payload_type=8, marker=1, sequence_number=0x1234,
+            timestamp=0xdeadbeef, ssrc=0x01020304, csrc=[5, 6],
+            extension_profile=0xbede, extension=b'abcd'
+            )
+        data = message.to_bytes()
+        self.assertEqual(len(data), message.size)
+        parsed = RTPMessage.from_bytes(data)
+        for name in RTPMessage.__slots__:
+            self.assertEqual(
+                getattr(parsed, name), getattr(message, name), name
+                )
+
+    def test_plain_header_layout(self):
+        message = RTPMessage(
+            payload_type=0, sequence_number=1, timestamp=160, ssrc=2
+            )
+        buffer = bytearray(12)
+        self.assertEqual(message.pack_into(buffer), 12)
+        self.assertEqual(
+            bytes(buffer), bytes.fromhex('80000001000000a000000002')
+            )
+
+    def test_pack_many_wraps_sequence_and_timestamp(self):
+        message = RTPMessage(
+            sequence_number=0xffff, timestamp=0xffffff00, marker=1
+            )
+        buffer = bytearray(3 * message.size)
+        message.pack_many(buffer, 3, 0x80)
+        headers = [
+            RTPMessage.from_bytes(buffer[index:index + 12])
+            for index in range(0, len(buffer), 12)
+            ]
+        self.assertEqual(
+            [header.sequence_number for header in headers], [0xffff, 0, 1]
+            )
+        self.assertEqual(
+            [header.timestamp for header in headers],
+            [0xffffff00, 0xffffff80, 0]
+            )
+        self.assertEqual([header.marker for header in headers], [1, 0, 0])
+        self.assertEqual(
+            (message.sequence_number, message.timestamp), (2, 0x80)
+            )
+
+
+class PacketizerTest(unittest.TestCase):
+    def packetizer(self):
+        packetizer = RTPPacketizer(8, ssrc=7)
+        packetizer.message.sequence_number = 100
+        packetizer.message.timestamp = 1000
+        return packetizer
+
+    def test_packets_across_chunks(self):
+        count = 2 * RTPPacketizer.CHUNK + 3
+        data = bytes(index % 251 for index in range(160 * count - 10))
+        packets = [bytes(packet) for packet in self.packetizer().packets(data)]
+        self.assertEqual(len(packets), count)
+        for index, packet in enumerate(packets):
+            header = RTPMessage.from_bytes(packet)
+            self.assertEqual(header.sequence_number, 100 + index)
+            self.assertEqual(header.timestamp, 1000 + 160 * index)
+            self.assertEqual(header.marker, 1 if index == 0 else 0)
+            self.assertEqual(len(packet), 172)
+        payload = b''.join(packet[12:] for packet in packets)
+        self.assertEqual(payload[:len(data)], data)
+        # the last frame is padded with its last byte
+        self.assertEqual(set(payload[len(data):]), {data[-1]})
+
+    def test_frames_match_packets(self):
+        data = bytes(range(160)) * 5
+        frames = [data[index:index + 160] for index in range(0, 800, 160)]
+        packed = [bytes(packet) for packet in self.packetizer().packets(data)]
+        framed = [
+            bytes(header) + bytes(payload)
+            for header, payload in self.packetizer().frames(frames)
+            ]
+        self.assertEqual(framed, packed)
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SenderTest(unittest.TestCase):
+    def test_send_is_paced_in_real_time(self):
+        sent = []
+
+        class Client():
+            def write(self, packet):
+                sent.append((time.monotonic(), bytes(packet)))
+
+        sender = RTPSender(Client(), RTPPacketizer(8))
+        stats = sender.send(bytes(160 * 10))
+        self.assertEqual(stats.sent, 10)
+        self.assertEqual(len(sent), 10)
+        # deadlines come from the start time, sleeps do not add up
+        elapsed = sent[-1][0] - sent[0][0]
+        self.assertGreaterEqual(elapsed, 0.18 - 0.002)
+        self.assertLess(elapsed, 0.18 + 0.05)
+
+    def test_start_sends_one_packet_per_ptime_from_the_wheel(self):
+        clock = Clock()
+        wheel = TimerWheel(clock=clock)
+        sent = []
+        done = []
+        sender = RTPSender(None, RTPPacketizer(8))
+        packets = sender.packetizer.packets(bytes(160 * 3))
+        sender.start(
+            wheel, packets, lambda packet: sent.append(clock.now),
+            done.append
+            )
+        for _ in range(20):
+            clock.now += 0.005
+            wheel.advance()
+        self.assertEqual(len(sent), 3)
+        self.assertAlmostEqual(sent[1] - sent[0], 0.02)
+        self.assertAlmostEqual(sent[2] - sent[1], 0.02)
+        self.assertEqual(done, [sender.stats])
+
+    def test_start_resyncs_when_far_behind(self):
+        clock = Clock()
+        wheel = TimerWheel(clock=clock)
+        sender = RTPSender(None, RTPPacketizer(8))
+        packets = sender.packetizer.packets(bytes(160 * 3))
+        sender.start(wheel, packets, lambda packet: None)
+        clock.now += 0.006
+        wheel.advance()
+        clock.now += 1.0
+        with self.assertLogs('RTPSender', 'WARNING'):
+            wheel.advance()
+        self.assertEqual(sender.stats.resyncs, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+''' single threaded media scheduler
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import socket
+import unittest
+
+from voip import scheduler
+from voip.scheduler import MediaScheduler
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.receiver.bind(('127.0.0.1', 0))
+        self.receiver.settimeout(1)
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.address = self.receiver.getsockname()
+        self.done = []
+
+    def tearDown(self):
+        self.receiver.close()
+        self.sender.close()
+
+    def run_ticks(self, scheduler, count):
+        sent = []
+        for _ in range(count):
+            self.clock.now = scheduler.next_tick() + 0.001
+            sent.append(scheduler.run_tick())
+        return sent
+
+    def received(self, count):
+        return sorted(self.receiver.recv(100) for _ in range(count))
+
+    def test_streams_are_paced_by_their_ptime(self):
+        pacer = MediaScheduler(tick=0.02, clock=self.clock)
+        fast = [b'a%d' % index for index in range(4)]
+        slow = [b'b%d' % index for index in range(2)]
+        pacer.add(self.sender, self.address, fast, 20, self.done.append)
+        pacer.add(self.sender, self.address, slow, 40, self.done.append)
+        self.assertEqual(self.run_ticks(pacer, 5), [2, 1, 2, 1, 0])
+        self.assertEqual(self.received(6), sorted(fast + slow))
+        self.assertEqual([stream.sent for stream in self.done], [2, 4])
+        self.assertEqual(len(pacer), 0)
+
+    def test_failing_stream_ends_alone(self):
+        def broken():
+            yield b'x'
+            raise OSError('source closed')
+
+        pacer = MediaScheduler(tick=0.02, clock=self.clock)
+        failing = pacer.add(
+            self.sender, self.address, broken(), 20, self.done.append
+            )
+        good = pacer.add(self.sender, self.address, [b'y'] * 3)
+        with self.assertLogs('MediaScheduler', 'ERROR'):
+            self.assertEqual(self.run_ticks(pacer, 3), [2, 1, 1])
+        self.assertEqual(self.done, [failing])
+        self.assertEqual(good.sent, 3)
+
+    def test_late_scheduler_resyncs(self):
+        pacer = MediaScheduler(tick=0.02, resync=5, clock=self.clock)
+        stream = pacer.add(self.sender, self.address, [b'z'] * 10)
+        self.clock.now += 1.0
+        with self.assertLogs('MediaScheduler', 'WARNING'):
+            self.assertEqual(pacer.run_tick(), 1)
+        self.assertEqual(stream.resyncs, 1)
+        # ticks go on from now instead of catching up
+        self.assertEqual(pacer.current, 50)
+
+    def test_ptime_must_be_a_multiple_of_the_tick(self):
+        pacer = MediaScheduler(tick=0.02, clock=self.clock)
+        with self.assertRaises(ValueError):
+            pacer.add(self.sender, self.address, [], 30)
+
+    @unittest.skipIf(scheduler._sendmmsg is None, 'sendmmsg is not available')
+    def test_batch_sends_parts_and_oversized_packets(self):
+        pacer = MediaScheduler(tick=0.02, batch=True, clock=self.clock)
+        pacer.add(self.sender, self.address, [(b'head', b'tail')])
+        pacer.add(self.sender, self.address, [b'p' * 1600])
+        pacer.add(self.sender, self.address, [b'plain'])
+        self.assertEqual(self.run_ticks(pacer, 1), [3])
+        self.assertEqual(
+            sorted(self.receiver.recv(2000) for _ in range(3)),
+            sorted([b'headtail', b'p' * 1600, b'plain'])
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
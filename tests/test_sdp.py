@@ -0,0 +1,69 @@
+''' session descriptions and codec negotiation
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import unittest
+
+from voip.codec import PCMA, PCMU
+from voip.sdp import Session, negotiate, offer, offer_template
+
+ANSWER = '''v=0
+o=- 42 42 IN IP4 10.0.0.1
+s=-
+c=IN IP4 10.0.0.2
+t=0 0
+a=sendonly
+m=audio 30000/2 RTP/AVP 96 8 0 101
+c=IN IP4 10.0.0.3/127
+a=rtpmap:96 pcma/8000
+a=rtpmap:101 telephone-event/8000
+a=fmtp:101 0-15
+a=ptime:30.0
+a=maxptime:60
+m=video 0 RTP/AVP 31
+'''
+
+
+class SessionTest(unittest.TestCase):
+    def setUp(self):
+        self.session = Session.parse(ANSWER.replace('\n', '\r\n'))
+        self.audio = self.session.audio
+
+    def test_parse(self):
+        self.assertEqual(self.session.origin[1], '42')
+        self.assertEqual(len(self.session.media), 2)
+        self.assertEqual(self.audio.port, 30000)
+        self.assertEqual(self.audio.payload_types, [96, 8, 0, 101])
+        self.assertEqual(self.audio.ptime, 30)
+        self.assertEqual(self.audio.fmtp, {101: '0-15'})
+        self.assertEqual(self.audio.attributes, [('maxptime', '60')])
+        self.assertEqual(self.session.address(self.audio), '10.0.0.3')
+        self.assertEqual(
+            self.session.address(self.session.media[1]), '10.0.0.2'
+            )
+        self.assertEqual(self.session.direction_of(self.audio), 'sendonly')
+
+    def test_negotiate_by_encoding_name(self):
+        self.assertEqual(
+            negotiate(self.audio),
+            [(96, PCMA), (8, PCMA), (0, PCMU)]
+            )
+        self.assertEqual(negotiate(self.audio, [PCMU]), [(0, PCMU)])
+        self.assertEqual(negotiate(self.session.media[1]), [])
+
+    def test_offer_round_trip(self):
+        text = offer('192.168.1.5', 40002, [PCMU, PCMA], 20, session=7)
+        session = Session.parse(text)
+        self.assertEqual(session.origin[1], '7')
+        self.assertEqual(session.address(session.audio), '192.168.1.5')
+        self.assertEqual(session.audio.port, 40002)
+        self.assertEqual(
+            negotiate(session.audio), [(0, PCMU), (8, PCMA)]
+            )
+        template = offer_template([PCMU, PCMA])
+        self.assertIs(offer_template([PCMU, PCMA]), template)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+''' lazy sip message parser
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import unittest
+
+from voip.sipparser import SIPView
+
+RESPONSE = (
+    b'SIP/2.0 200 OK\r\n'
+    b'v: SIP/2.0/UDP 10.0.0.2:5060;branch=z9hG4bKabc;rport=5060,\r\n'
+    b' SIP/2.0/UDP 10.0.0.3;branch=z9hG4bKdef\r\n'
+    b'Via: SIP/2.0/UDP [2001:db8::1]:5070;branch=z9hG4bKghi\r\n'
+    b'f: "Alice, A." <sip:alice@example.com;transport=udp>;tag=1\r\n'
+    b'TO:<sip:bob@example.com>;tag=2\r\n'
+    b'call-id: abc@10.0.0.2\r\n'
+    b'CSeq: 7 INVITE\r\n'
+    b'Contact: <sip:bob@10.0.0.4>;expires=60, <sip:bob@10.0.0.5>\r\n'
+    b'Subject: first\r\n'
+    b'  and second line\r\n'
+    b'l: 4\r\n'
+    b'\r\n'
+    b'v=0\n'
+    )
+
+
+class SIPViewTest(unittest.TestCase):
+    def setUp(self):
+        self.msg = SIPView(RESPONSE)
+
+    def test_start_line(self):
+        self.assertTrue(self.msg.is_response)
+        self.assertEqual(self.msg.code, 200)
+        self.assertEqual(self.msg.message, 'OK')
+        self.assertEqual(self.msg.method, 'INVITE')
+
+    def test_compact_and_case_insensitive_names(self):
+        self.assertEqual(self.msg.get('Call-ID'), 'abc@10.0.0.2')
+        self.assertEqual(self.msg.get('i'), 'abc@10.0.0.2')
+        self.assertEqual(self.msg.get('Content-Length'), '4')
+        self.assertIn('to', self.msg)
+        self.assertNotIn('Route', self.msg)
+        self.assertIsNone(self.msg.get('Route'))
+
+    def test_folded_lines_and_lists(self):
+        self.assertEqual(self.msg.get('Subject'), 'first and second line')
+        self.assertEqual(len(self.msg.vias), 3)
+        self.assertEqual(self.msg.vias[2].host, '[2001:db8::1]')
+        self.assertEqual(self.msg.vias[2].port, 5070)
+        contacts = self.msg.get_all('m')
+        self.assertEqual(
+            contacts, ['<sip:bob@10.0.0.4>;expires=60', '<sip:bob@10.0.0.5>']
+            )
+
+    def test_parsed_headers(self):
+        self.assertEqual(self.msg.branch, 'z9hG4bKabc')
+        self.assertEqual(self.msg.via.params['rport'], '5060')
+        self.assertEqual(self.msg.from_.display, 'Alice, A.')
+        self.assertEqual(
+            self.msg.from_.uri, 'sip:alice@example.com;transport=udp'
+            )
+        self.assertEqual(self.msg.from_.tag, '1')
+        self.assertEqual(self.msg.to.tag, '2')
+        self.assertEqual(self.msg.cseq.number, 7)
+
+    def test_body(self):
+        self.assertEqual(bytes(self.msg.body), b'v=0\n')
+        self.assertEqual(self.msg.content, 'v=0\n')
+
+    def test_request(self):
+        msg = SIPView(b'BYE sip:bob@10.0.0.4 SIP/2.0\r\nCSeq: 8 BYE\r\n\r\n')
+        self.assertFalse(msg.is_response)
+        self.assertEqual(msg.method, 'BYE')
+        self.assertEqual(msg.uri, 'sip:bob@10.0.0.4')
+
+    def test_invalid(self):
+        for data in (b'SIP/2.0 200 OK\r\n', b'garbage\r\n\r\n'):
+            with self.assertRaises(ValueError):
+                SIPView(data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+''' streaming media sources
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+from voip.source import Playlist, WaveSource
+
+
+def write_wave(path, samples, rate=8000, size=None, extra=b''):
+    ''' a mono 16 bit wave file with an optional odd sized chunk before
+    the samples and a data size as written by a recorder still running
+    '''
+    fmt = struct.pack('<HHIIHH', 1, 1, rate, rate * 2, 2, 16)
+    chunks = b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+    if extra:
+        chunks += b'LIST' + struct.pack('<I', len(extra)) + extra + \
+            b'\0' * (len(extra) % 2)
+    size = len(samples) if size is None else size
+    chunks += b'data' + struct.pack('<I', size) + samples
+    with open(path, 'wb') as f:
+        f.write(b'RIFF' + struct.pack('<I', 4 + len(chunks)) + b'WAVE')
+        f.write(chunks)
+
+
+class WaveSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        # 2.5 frames of 20ms, every frame a different value
+        self.samples = b''.join(bytes([index, 0]) * 160 for index in (1, 2))
+        self.samples += b'\x03\x00' * 80
+        self.path = os.path.join(self.directory, 'prompt.wav')
+        write_wave(self.path, self.samples, extra=b'odd')
+
+    def frames(self, source, count=None):
+        frames = []
+        for frame in source.frames():
+            frames.append(bytes(frame))
+            if len(frames) == count:
+                break
+        return frames
+
+    def test_frames_are_padded_with_silence(self):
+        for use_mmap in (True, False):
+            with WaveSource(self.path, use_mmap=use_mmap,
+                    readahead=0.02) as source:
+                self.assertEqual(source.count, 3)
+                frames = self.frames(source)
+            self.assertEqual(len(frames), 3)
+            self.assertEqual(frames[1], b'\x02\x00' * 160)
+            self.assertEqual(frames[2], b'\x03\x00' * 80 + bytes(160))
+
+    def test_loop_and_seek(self):
+        with WaveSource(self.path, loop=True) as source:
+            source.seek(0.02)
+            frames = self.frames(source, 4)
+            self.assertEqual([frame[0] for frame in frames], [2, 3, 1, 2])
+            self.assertAlmostEqual(source.tell(), 0.04)
+
+    def test_unknown_size_takes_the_file(self):
+        write_wave(self.path, self.samples, size=0xffffffff)
+        with WaveSource(self.path) as source:
+            self.assertEqual(source.size, len(self.samples))
+
+    def test_invalid_file(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'RIFF\0\0\0\0AVI LIST')
+        with self.assertRaises(ValueError):
+            WaveSource(self.path)
+
+    def test_playlist(self):
+        other = os.path.join(self.directory, 'other.wav')
+        write_wave(other, b'\x09\x00' * 160)
+        with Playlist([WaveSource(self.path), WaveSource(other)]) as playlist:
+            self.assertAlmostEqual(playlist.duration, 0.08)
+            playlist.seek(0.05)
+            frames = self.frames(playlist)
+        self.assertEqual([frame[0] for frame in frames], [3, 9])
+
+    def test_playlist_rejects_mixed_formats(self):
+        other = os.path.join(self.directory, 'other.wav')
+        write_wave(other, bytes(320), rate=16000)
+        sources = [WaveSource(self.path), WaveSource(other)]
+        try:
+            with self.assertRaises(ValueError):
+                Playlist(sources)
+        finally:
+            for source in sources:
+                source.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
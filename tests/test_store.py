@@ -0,0 +1,85 @@
+''' pre-encoded announcement store
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import os
+import shutil
+import tempfile
+import unittest
+import wave
+
+from voip.codec import PCMA, PCMU
+from voip.store import Announcement, AnnouncementStore
+
+
+class StoreTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source = os.path.join(self.directory, 'prompt.wav')
+        self.pcm = bytes(range(160)) * 42
+        with wave.open(self.source, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(8000)
+            f.writeframes(self.pcm)
+        self.store = AnnouncementStore(os.path.join(self.directory, 'store'))
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.directory)
+
+    def test_frames_hold_the_encoded_source(self):
+        announcement = self.store.get(self.source, PCMU(), 20)
+        encoded = PCMU().encode(self.pcm, 2)
+        self.assertEqual(announcement.payload_type, 0)
+        self.assertEqual(announcement.count, -(-len(encoded) // 160))
+        frames = b''.join(bytes(frame) for frame in announcement.frames)
+        self.assertEqual(frames[:len(encoded)], encoded)
+        self.assertIs(self.store.get(self.source, PCMU(), 20), announcement)
+
+    def test_changed_source_is_rebuilt(self):
+        first = self.store.get(self.source, PCMA(), 20)
+        with wave.open(self.source, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(8000)
+            f.writeframes(bytes(len(self.pcm) * 2))
+        second = self.store.get(self.source, PCMA(), 20)
+        self.assertIsNot(second, first)
+        self.assertEqual(second.count, 2 * first.count)
+
+    def rebuilt_after(self, damage):
+        path = self.store.build(self.source, PCMA(), 20)
+        with open(path, 'r+b') as f:
+            damage(f)
+        store = AnnouncementStore(self.store.directory)
+        try:
+            announcement = store.get(self.source, PCMA(), 20)
+            self.assertEqual(
+                os.path.getsize(path),
+                Announcement.HEADER.size +
+                announcement.count * announcement.framesize
+                )
+        finally:
+            store.close()
+
+    def test_truncated_frames_are_rebuilt(self):
+        self.rebuilt_after(lambda f: f.truncate(Announcement.HEADER.size + 7))
+
+    def test_truncated_header_is_rebuilt(self):
+        self.rebuilt_after(lambda f: f.truncate(10))
+
+    def test_empty_file_is_rebuilt(self):
+        self.rebuilt_after(lambda f: f.truncate(0))
+
+    def test_corrupt_header_is_rejected(self):
+        path = self.store.build(self.source, PCMA(), 20)
+        with open(path, 'r+b') as f:
+            f.write(b'XXXX')
+        with self.assertRaises(ValueError):
+            Announcement(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+''' hashed timer wheel
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import asyncio
+import unittest
+
+from voip.timer import TimerWheel, loop_wheel
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TimerWheelTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.wheel = TimerWheel(tick=0.01, slots=16, clock=self.clock)
+        self.fired = []
+
+    def advance(self, seconds):
+        self.clock.now += seconds
+        return self.wheel.advance()
+
+    def test_timers_fire_in_order_beyond_one_revolution(self):
+        for delay in (0.5, 0.03, 0.2, 0.1):
+            self.wheel.call_later(delay, self.fired.append, delay)
+        self.assertEqual(self.advance(0.025), 0)
+        self.assertEqual(self.advance(0.01), 1)
+        self.assertEqual(self.advance(0.5), 3)
+        self.assertEqual(self.fired, [0.03, 0.1, 0.2, 0.5])
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_cancel_after_being_due(self):
+        # both are due in the same tick, the first cancels the second
+        second = None
+
+        def first():
+            self.fired.append('first')
+            second.cancel()
+
+        self.wheel.call_later(0.01, first)
+        second = self.wheel.call_later(0.01, self.fired.append, 'second')
+        self.advance(0.015)
+        self.assertEqual(self.fired, ['first'])
+        self.assertTrue(second.cancelled)
+
+    def test_idle_wheel_skips_the_ticks_it_slept(self):
+        self.clock.now += 3600
+        self.wheel.call_later(0.02, self.fired.append, 'late')
+        self.assertEqual(self.wheel.current, 360000)
+        self.advance(0.02)
+        self.assertEqual(self.fired, ['late'])
+
+
+class LoopWheelTest(unittest.IsolatedAsyncioTestCase):
+    async def test_wheel_ticks_only_while_timers_are_pending(self):
+        wheel = loop_wheel()
+        self.assertIs(loop_wheel(), wheel)
+        self.assertFalse(wheel.ticking)
+        fired = asyncio.get_running_loop().create_future()
+        wheel.call_later(0.02, fired.set_result, True)
+        self.assertTrue(wheel.ticking)
+        self.assertTrue(await asyncio.wait_for(fired, 1))
+        await asyncio.sleep(wheel.tick * 2)
+        self.assertFalse(wheel.ticking)
+
+
+if __name__ == '__main__':
+    unittest.main()
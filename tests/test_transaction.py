@@ -0,0 +1,131 @@
+''' client transaction timers
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import unittest
+
+from voip.timer import TimerWheel
+from voip.transaction import ClientTransaction, T1
+from voip.wire import Templates
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Protocol():
+    ''' records sent messages instead of sending them
+    '''
+    def __init__(self, wheel):
+        self.wheel = wheel
+        self.sent = []
+        self.removed = []
+
+    def send(self, text, addr=None):
+        self.sent.append(bytes(text))
+
+    def remove_transaction(self, transaction):
+        self.removed.append(transaction)
+
+
+class Response():
+    def __init__(self, code):
+        self.code = code
+
+    def get(self, key, default=None):
+        return {'To': '<sip:100@127.0.0.1>;tag=1'}.get(key, default)
+
+
+class TransactionTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        self.wheel = TimerWheel(clock=self.clock)
+        self.protocol = Protocol(self.wheel)
+        self.templates = Templates('127.0.0.1', '"u" <sip:u@127.0.0.1>')
+
+    def advance(self, seconds):
+        self.clock.now += seconds
+        self.wheel.advance()
+
+    def test_ringing_invite_outlives_timer_b(self):
+        transaction = ClientTransaction(
+            self.protocol, self.templates.invite('call', '100')
+            )
+        transaction.start()
+        self.advance(0.2)
+        transaction.receive(Response(180))
+        self.advance(64 * T1 + 10)
+        self.assertEqual(transaction.state, 'proceeding')
+        self.assertEqual(self.protocol.removed, [])
+        self.assertEqual(transaction.responses.qsize(), 1)
+        self.assertEqual(transaction.responses.get_nowait().code, 180)
+
+    def test_unanswered_invite_times_out(self):
+        transaction = ClientTransaction(
+            self.protocol, self.templates.invite('call', '100')
+            )
+        transaction.start()
+        self.advance(64 * T1 + 1)
+        self.assertEqual(transaction.state, 'terminated')
+        self.assertIsInstance(
+            transaction.responses.get_nowait(), TimeoutError
+            )
+
+    def test_cancelled_invite_times_out(self):
+        transaction = ClientTransaction(
+            self.protocol, self.templates.invite('call', '100')
+            )
+        transaction.start()
+        transaction.receive(Response(180))
+        # the CANCEL went out, but no final response follows
+        transaction.expire(64 * T1)
+        self.advance(64 * T1 - 1)
+        self.assertEqual(transaction.state, 'proceeding')
+        self.advance(2)
+        self.assertEqual(transaction.state, 'terminated')
+        self.assertEqual(self.protocol.removed, [transaction])
+        self.assertEqual(transaction.responses.get_nowait().code, 180)
+        self.assertIsInstance(
+            transaction.responses.get_nowait(), TimeoutError
+            )
+
+    def test_cancelled_invite_answered_in_time(self):
+        transaction = ClientTransaction(
+            self.protocol, self.templates.invite('call', '100')
+            )
+        transaction.start()
+        transaction.receive(Response(180))
+        transaction.expire(64 * T1)
+        transaction.receive(Response(487))
+        self.advance(64 * T1 + 1)
+        self.assertEqual(transaction.final.code, 487)
+        self.assertEqual(transaction.responses.qsize(), 2)
+
+    def test_expire_without_provisional_ends_at_once(self):
+        transaction = ClientTransaction(
+            self.protocol, self.templates.invite('call', '100')
+            )
+        transaction.start()
+        transaction.expire(0)
+        self.assertEqual(transaction.state, 'terminated')
+        self.assertIsInstance(
+            transaction.responses.get_nowait(), TimeoutError
+            )
+
+    def test_proceeding_register_still_times_out(self):
+        transaction = ClientTransaction(
+            self.protocol, self.templates.register('call', 1, 30)
+            )
+        transaction.start()
+        transaction.receive(Response(100))
+        self.advance(64 * T1 + 1)
+        self.assertEqual(transaction.state, 'terminated')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+''' precompiled wire templates
+
+run from the project directory with
+    python -m unittest discover tests
+'''
+import unittest
+
+from voip.sipmessage import Ack, Bye, Invite, Register
+from voip.sipparser import SIPView
+from voip.wire import Templates, response
+
+SERVER = '192.168.1.1'
+CALLER = '"100" <sip:100@192.168.1.1>'
+CALL_ID = '0123456789abcdef'
+
+
+class TemplatesTest(unittest.TestCase):
+    ''' rendered requests are the same as the ones of the SIPRequest classes
+    '''
+    def setUp(self):
+        self.templates = Templates(SERVER, CALLER)
+
+    def assertSame(self, wire, request):
+        request.set_via(wire.branch)
+        self.assertEqual(bytes(wire), bytes(request))
+
+    def test_register(self):
+        self.assertSame(
+            self.templates.register(CALL_ID, 3),
+            Register(SERVER, CALLER, CALL_ID, 3)
+            )
+
+    def test_invite_with_body(self):
+        wire = self.templates.invite(CALL_ID, '200', 101)
+        request = Invite(SERVER, CALLER, CALL_ID, '200', 101)
+        for message in (wire, request):
+            message.set('Authorization', 'Digest username="100"')
+            message.set_content('v=0\r\n')
+        self.assertSame(wire, request)
+
+    def test_ack_and_bye(self):
+        self.assertSame(
+            self.templates.ack(CALL_ID, '200', 5),
+            Ack(SERVER, CALLER, CALL_ID, '200', 5)
+            )
+        self.assertSame(
+            self.templates.bye(CALL_ID, '200', 6),
+            Bye(SERVER, CALLER, CALL_ID, '200', 6)
+            )
+
+    def test_changes_render_again(self):
+        invite = self.templates.invite(CALL_ID, '200')
+        first = bytes(invite)
+        invite.set_sequence(102)
+        invite.new_branch()
+        msg = SIPView(bytes(invite))
+        self.assertNotEqual(bytes(invite), first)
+        self.assertEqual(msg.cseq.number, 102)
+        self.assertEqual(msg.branch, invite.branch)
+
+    def test_cancel_keeps_the_branch(self):
+        invite = self.templates.invite(CALL_ID, '200', 101)
+        cancel = SIPView(bytes(self.templates.cancel(invite)))
+        self.assertEqual(cancel.method, 'CANCEL')
+        self.assertEqual(cancel.branch, invite.branch)
+        self.assertEqual(cancel.get('CSeq'), '101 CANCEL')
+        self.assertEqual(cancel.uri, 'sip:200@192.168.1.1')
+
+
+class ResponseTest(unittest.TestCase):
+    def test_response_copies_the_dialog_headers(self):
+        bye = SIPView(bytes(Templates(SERVER, CALLER).bye(CALL_ID, '200')))
+        msg = SIPView(response(bye, 200, tag='xyz', server='test'))
+        self.assertEqual(msg.code, 200)
+        self.assertEqual(msg.branch, bye.branch)
+        self.assertEqual(msg.get('To'), '<sip:200@192.168.1.1>;tag=xyz')
+        self.assertEqual(msg.get('CSeq'), '1 BYE')
+        self.assertEqual(msg.get('Server'), 'test')
+
+
+if __name__ == '__main__':
+    unittest.main()
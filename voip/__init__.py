@@ -1,2 +1,2 @@
-from .voip import VoIP
+from .voip import VoIP, AsyncVoIP, SIPError
 from .sipmessage import *
@@ -0,0 +1,149 @@
+''' asyncio transport for sip
+
+a single datagram endpoint is shared by any number of registrations and
+dialogs. received responses are routed by via branch and CSeq method to the
+client transaction waiting for them, everything else is handed to the
+callback. requests of the remote side are answered right away, so it does
+not retransmit them: BYE and OPTIONS with 200, CANCEL with 481 as there
+are no server transactions and everything else with 405.
+'''
+import asyncio
+import logging
+import os
+import time
+
+from voip.sipparser import SIPView
+from voip.transaction import ClientTransaction
+from voip.timer import loop_wheel
+from voip.wire import response
+from voip.metrics import REGISTRY
+
+SENT = REGISTRY.counter(
+    'sip_messages_sent_total', 'sent sip messages', ('method',)
+    )
+RECEIVED = REGISTRY.counter(
+    'sip_messages_received_total', 'received sip messages', ('method', 'code')
+    )
+INVALID = REGISTRY.counter(
+    'sip_messages_invalid_total', 'received datagrams which failed to parse'
+    )
+# requests of the remote side which are answered, the others get a 405
+ACCEPTED = 'ACK, BYE, CANCEL, OPTIONS'
+ANSWERS = {'BYE': 200, 'OPTIONS': 200, 'CANCEL': 481}
+# label values come from the remote side, anything else would let it create
+# an unbounded number of children
+METHODS = frozenset((
+    'ACK', 'BYE', 'CANCEL', 'INFO', 'INVITE', 'MESSAGE', 'NOTIFY', 'OPTIONS',
+    'PRACK', 'PUBLISH', 'REFER', 'REGISTER', 'SUBSCRIBE', 'UPDATE',
+    ))
+PARSE_TIME = REGISTRY.histogram(
+    'sip_parse_seconds', 'time to parse a received message',
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001)
+    )
+
+
+class SIPProtocol(asyncio.DatagramProtocol):
+    ''' datagram protocol which dispatches sip messages
+    '''
+    def __init__(self, server, port=5060, callback=None, wheel=None):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.server = server
+        self.port = port
+        self.callback = callback
+        self.transport = None
+        self.transactions = {}
+        self.wheel = wheel
+
+    def connection_made(self, transport):
+        self.transport = transport
+        if self.wheel is None:
+            self.wheel = loop_wheel()
+
+    def connection_lost(self, exc):
+        if exc is not None:
+            self.log.error(f'connection lost: {exc}')
+        self.transport = None
+
+    def error_received(self, exc):
+        self.log.error(f'error received: {exc}')
+
+    def datagram_received(self, data, addr):
+        if self.log.isEnabledFor(logging.DEBUG):
+            # any datagram ends up here, not only valid utf8
+            text = data.decode('utf8', errors='replace')
+            self.log.debug(f'RECEIVED from {addr}\n====\n{text}====\n')
+        started = time.perf_counter()
+        try:
+            msg = SIPView(data)
+        except ValueError as e:
+            INVALID.inc()
+            self.log.warning(f'dropping invalid message from {addr}: {e}')
+            return
+        PARSE_TIME.observe(time.perf_counter() - started)
+        method = msg.method if msg.method in METHODS else 'other'
+        code = str(msg.code) if 100 <= (msg.code or 0) < 700 else ''
+        RECEIVED.labels(method, code).inc()
+
+        transaction = None
+        if msg.is_response:
+            transaction = self.transactions.get((msg.branch, msg.method))
+
+        if transaction is not None:
+            transaction.receive(msg)
+            return
+        if not msg.is_response and msg.method != 'ACK':
+            self.answer(msg, addr)
+        if self.callback is not None:
+            self.callback(data)
+
+    def answer(self, msg, addr):
+        ''' respond to the request `msg` of the remote side
+        '''
+        code = ANSWERS.get(msg.method, 405)
+        headers = (f'Allow: {ACCEPTED}',) if code != 481 else ()
+        self.log.debug(f'answering {msg.method} with {code}')
+        if self.transport is not None:
+            self.transport.sendto(
+                response(msg, code, headers, tag=os.urandom(4).hex()), addr
+                )
+
+    def send(self, text, addr=None):
+        ''' send a message to `addr` or the server
+        '''
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(f'SENDING\n====\n{str(text)}====\n')
+        SENT.labels(getattr(text, 'function', '')).inc()
+        addr = addr if addr is not None else (self.server, self.port)
+        self.transport.sendto(bytes(text), addr)
+
+    def request(self, request, addr=None):
+        ''' start a client transaction for `request` and return it
+        '''
+        transaction = ClientTransaction(self, request, addr)
+        self.transactions[transaction.key] = transaction
+        transaction.start()
+        return transaction
+
+    def remove_transaction(self, transaction):
+        if self.transactions.get(transaction.key) is transaction:
+            del self.transactions[transaction.key]
+
+    def close(self):
+        for transaction in list(self.transactions.values()):
+            transaction.terminate()
+        if self.transport is not None:
+            self.transport.close()
+
+
+async def open_transport(server, port=5060, local=('0.0.0.0', 5060),
+        callback=None, wheel=None):
+    ''' bind a datagram endpoint to `local` and return its SIPProtocol
+    without a timer `wheel`, the protocol uses the one shared by all
+    protocols on the running loop
+    '''
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        lambda: SIPProtocol(server, port, callback, wheel),
+        local_addr=local
+        )
+    return protocol
@@ -0,0 +1,153 @@
+''' digest authentication with a credential cache
+
+HA1 only depends on user, realm and password, so it is computed once per
+(user, realm). the last nonce of every (server, realm) is kept, which lets
+requests carry credentials up front instead of waiting for a challenge.
+servers sharing a realm name issue their own nonces, so they do not
+overwrite each other's. with
+qop=auth every use of a nonce gets the next nonce count and a fresh
+cnonce. a challenge is only followed if the server marks the nonce stale,
+asks for a realm or nonce the request did not use, or the request carried
+no credentials at all.
+'''
+import hashlib
+import os
+import re
+from threading import Lock
+
+PARAM = re.compile(r'([\w-]+)[ \t]*=[ \t]*("(?:[^"\\]|\\.)*"|[^,\s]*)')
+
+
+def md5(text):
+    return hashlib.md5(text.encode('utf8')).hexdigest()
+
+
+def parse_digest(value):
+    ''' parse the parameters of a `Digest` challenge or credentials
+    quoted values may contain commas, as in qop="auth,auth-int"
+    '''
+    scheme, _, params = value.strip().partition(' ')
+    if scheme.lower() != 'digest':
+        raise ValueError(f'unsupported authentication scheme {scheme}')
+    values = {}
+    for name, param in PARAM.findall(params):
+        if param.startswith('"'):
+            param = param[1:-1].replace('\\"', '"')
+        values[name.lower()] = param
+    return values
+
+
+class Nonce():
+    ''' the last challenge of a realm by a server
+    '''
+    __slots__ = ('header', 'realm', 'nonce', 'opaque', 'algorithm', 'qop',
+        'count')
+
+    def __init__(self, header, values):
+        self.header = header
+        self.realm = values.get('realm', '')
+        self.nonce = values.get('nonce', '')
+        self.opaque = values.get('opaque')
+        self.algorithm = values.get('algorithm', 'MD5')
+        qops = [qop.strip() for qop in values.get('qop', '').split(',')]
+        self.qop = 'auth' if 'auth' in qops else None
+        self.count = 0
+
+    def __repr__(self):
+        return f'Nonce({self.realm} {self.nonce} nc={self.count})'
+
+
+class CredentialCache():
+    ''' HA1 per (user, realm) and the last nonce per (server, realm)
+    a cache can be shared by any number of accounts
+    '''
+    # authentication header answering each challenge header
+    HEADERS = {
+        'WWW-Authenticate': 'Authorization',
+        'Proxy-Authenticate': 'Proxy-Authorization',
+        }
+
+    def __init__(self):
+        self.ha1s = {}
+        self.nonces = {}
+        # realm last used by a server for each authorization header
+        self.realms = {}
+        self.lock = Lock()
+
+    def ha1(self, user, realm, password):
+        key = (user, realm)
+        value = self.ha1s.get(key)
+        if value is None:
+            value = self.ha1s[key] = md5(f'{user}:{realm}:{password}')
+        return value
+
+    def challenge(self, server, header, value, request=None):
+        ''' remember the challenge `value` of the `header` challenge header
+        returns the Nonce and whether repeating the request with new
+        credentials can succeed. it can not, if `request` already carried
+        credentials for the same realm and nonce and the nonce is not stale.
+        '''
+        values = parse_digest(value)
+        header = self.HEADERS[header]
+        with self.lock:
+            key = (server, values.get('realm', ''))
+            nonce = self.nonces.get(key)
+            if nonce is None or nonce.nonce != values.get('nonce'):
+                nonce = Nonce(header, values)
+                self.nonces[key] = nonce
+            self.realms[(server, header)] = nonce.realm
+
+        used = request.get(header) if request is not None else None
+        if used is None or values.get('stale', '').lower() == 'true':
+            return nonce, True
+        used = parse_digest(used)
+        retry = used.get('realm') != nonce.realm or \
+            used.get('nonce') != nonce.nonce
+        return nonce, retry
+
+    def authorization(self, nonce, user, password, method, uri):
+        ''' credentials for `method` to `uri` using `nonce`
+        '''
+        ha1 = self.ha1(user, nonce.realm, password)
+        if nonce.qop is not None:
+            with self.lock:
+                nonce.count += 1
+                count = f'{nonce.count:08x}'
+            cnonce = os.urandom(8).hex()
+        if nonce.algorithm.lower() == 'md5-sess':
+            ha1 = md5(f'{ha1}:{nonce.nonce}:{cnonce if nonce.qop else ""}')
+        ha2 = md5(f'{method}:{uri}')
+        if nonce.qop is not None:
+            response = md5(
+                f'{ha1}:{nonce.nonce}:{count}:{cnonce}:{nonce.qop}:{ha2}'
+                )
+        else:
+            response = md5(f'{ha1}:{nonce.nonce}:{ha2}')
+
+        value = f'Digest username="{user}",realm="{nonce.realm}",' + \
+            f'nonce="{nonce.nonce}",uri="{uri}",' + \
+            f'response="{response}",algorithm={nonce.algorithm}'
+        if nonce.qop is not None:
+            value += f',qop={nonce.qop},nc={count},cnonce="{cnonce}"'
+        if nonce.opaque is not None:
+            value += f',opaque="{nonce.opaque}"'
+        return value
+
+    def preemptive(self, server):
+        ''' the cached nonces to authorize requests to `server` up front
+        '''
+        nonces = []
+        with self.lock:
+            for header in self.HEADERS.values():
+                realm = self.realms.get((server, header))
+                nonce = self.nonces.get((server, realm))
+                if realm is not None and nonce is not None:
+                    nonces.append(nonce)
+        return nonces
+
+    def forget(self, server):
+        ''' stop sending credentials up front to `server`
+        '''
+        with self.lock:
+            for header in self.HEADERS.values():
+                self.realms.pop((server, header), None)
@@ -0,0 +1,316 @@
+''' outbound call campaigns
+
+a campaign dials a list of numbers, plays a pre-encoded announcement to
+every answered call and hangs up. up to `concurrency` calls are in flight
+at once and new calls are started no faster than the calls per second
+allowed by a token bucket. the outcome of every call is appended to a csv
+file as soon as it is known:
+
+    python -m voip.campaign SERVER USER PASSWORD numbers.csv \
+        announcment.wav --concurrency 20 --cps 5 --results results.csv
+'''
+import argparse
+import asyncio
+import csv
+import logging
+import os
+import time
+
+from voip.voip import AsyncVoIP
+from voip.store import AnnouncementStore
+from voip.scheduler import MediaScheduler
+from voip.metrics import REGISTRY
+
+ACTIVE = REGISTRY.gauge('campaign_calls_active', 'calls in flight')
+OUTCOMES = REGISTRY.counter(
+    'campaign_calls_total', 'finished campaign calls by result', ('result',)
+    )
+
+# seconds an announcement may take longer than its length
+PLAY_SLACK = 5.0
+
+
+class TokenBucket():
+    ''' allows `rate` events per second with bursts of up to `burst`
+    '''
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def _fill(self):
+        now = self.clock()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+        self.updated = now
+
+    def try_acquire(self):
+        ''' take a token if one is available
+        '''
+        self._fill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        ''' wait for a token and take it
+        '''
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def read_numbers(source):
+    ''' yield numbers from the first column of a csv file, lines which are
+    empty, comments or a header without digits are skipped. any other
+    `source` is iterated as it is.
+    '''
+    if not isinstance(source, (str, os.PathLike)):
+        yield from source
+        return
+    with open(source, newline='') as f:
+        for row in csv.reader(f):
+            if not row:
+                continue
+            number = row[0].strip()
+            if number.startswith('#') or not any(c.isdigit() for c in number):
+                continue
+            yield number
+
+
+class CallResult():
+    ''' outcome and timings of a single campaign call
+    '''
+    FIELDS = (
+        'number', 'result', 'started', 'setup', 'duration', 'packets',
+        'late', 'error',
+        )
+    __slots__ = FIELDS
+
+    def __init__(self, number):
+        self.number = number
+        self.result = None
+        self.started = time.time()
+        self.setup = None
+        self.duration = None
+        self.packets = 0
+        self.late = 0
+        self.error = ''
+
+    def row(self):
+        row = []
+        for name in self.FIELDS:
+            value = getattr(self, name)
+            if isinstance(value, float):
+                value = f'{value:.3f}' if name == 'started' else f'{value:.4f}'
+            row.append('' if value is None else value)
+        return row
+
+
+class Campaign():
+    ''' dial numbers through `voip`, an AsyncVoIP which is connected
+    the media of all calls is sent by one MediaScheduler
+    '''
+    def __init__(self,
+            voip, store, announcement, concurrency=10, cps=1.0,
+            timeout=60, results=None, scheduler=None):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.voip = voip
+        self.store = store
+        self.announcement = announcement
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(cps, burst=max(1, int(cps)))
+        self.timeout = timeout
+        self.results = results
+        self.writer = None
+        self.scheduler = scheduler
+        self._own_scheduler = scheduler is None
+        # futures of the announcements by (payload type, ptime), all calls
+        # share them
+        self.media = {}
+        self.summary = {}
+
+    async def media_for(self, call):
+        ''' the announcement for the codec and ptime of `call`
+        opening or encoding it blocks, so the store is asked in the default
+        executor and calls answered meanwhile wait for the same future
+        '''
+        key = (call.payload_type, call.ptime)
+        announcement = self.media.get(key)
+        if announcement is None:
+            loop = asyncio.get_running_loop()
+            announcement = self.media[key] = loop.run_in_executor(
+                None, self.store.get, self.announcement, call.codec, call.ptime
+                )
+        try:
+            return await announcement
+        except Exception:
+            # the next call tries again
+            if self.media.get(key) is announcement:
+                del self.media[key]
+            raise
+
+    async def play(self, call):
+        ''' play the announcement to `call`
+        returns the statistics of the stream
+        '''
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def finish(stats):
+            # the wait may have timed out meanwhile
+            if not finished.done():
+                finished.set_result(stats)
+
+        def done(stats):
+            loop.call_soon_threadsafe(finish, stats)
+
+        announcement = await self.media_for(call)
+        call.stream_announcement(announcement, self.scheduler, done)
+        # a stream which never ends, e.g. removed by an early teardown,
+        # must not hold the worker forever
+        try:
+            return await asyncio.wait_for(
+                finished, announcement.duration + PLAY_SLACK
+                )
+        except asyncio.TimeoutError:
+            raise TimeoutError('announcement did not finish') from None
+
+    async def dial(self, number):
+        ''' place a single call and return its CallResult
+        '''
+        result = CallResult(number)
+        started = time.monotonic()
+        call = None
+        try:
+            call = await self.voip.call(number, self.timeout)
+            result.setup = time.monotonic() - started
+            if call is None:
+                result.result = 'unanswered'
+                return result
+            if call.codec is None:
+                # answered, but there is nothing to encode the prompt with
+                self.log.warning(f'no common codec with {number}')
+                result.result = 'no-codec'
+                return result
+            stats = await self.play(call)
+            result.packets = stats.sent
+            result.late = stats.late
+            result.result = 'answered'
+        except Exception as e:
+            self.log.warning(f'call to {number} failed: {e}')
+            result.result = 'error'
+            result.error = str(e)
+        finally:
+            if call is not None:
+                try:
+                    await self.voip.hangup(call)
+                except Exception as e:
+                    self.log.warning(f'hangup of {number} failed: {e}')
+            result.duration = time.monotonic() - started
+        return result
+
+    def record(self, result):
+        OUTCOMES.labels(result.result).inc()
+        self.summary[result.result] = self.summary.get(result.result, 0) + 1
+        if self.writer is not None:
+            self.writer.writerow(result.row())
+            self.results_file.flush()
+
+    async def _worker(self, numbers):
+        for number in numbers:
+            await self.bucket.acquire()
+            ACTIVE.inc()
+            try:
+                self.record(await self.dial(number))
+            finally:
+                ACTIVE.dec()
+
+    async def run(self, numbers):
+        ''' dial all `numbers` and return the number of calls per result
+        '''
+        numbers = iter(read_numbers(numbers))
+        self.summary = {}
+        # keep socket binding off the call setup path
+        ports = self.voip.ports
+        ports.prebind(max(0, self.concurrency - len(ports.free)))
+        if self.scheduler is None:
+            self.scheduler = MediaScheduler()
+        if self._own_scheduler:
+            self.scheduler.start()
+        if self.results is not None:
+            new = not os.path.exists(self.results)
+            self.results_file = open(self.results, 'a', newline='')
+            self.writer = csv.writer(self.results_file)
+            if new:
+                self.writer.writerow(CallResult.FIELDS)
+        try:
+            # the workers share the iterator, so numbers are read lazily
+            await asyncio.gather(*(
+                self._worker(numbers) for _ in range(self.concurrency)
+                ))
+        finally:
+            if self._own_scheduler:
+                self.scheduler.stop()
+            if self.writer is not None:
+                self.results_file.close()
+                self.writer = None
+        return self.summary
+
+
+async def run(args):
+    voip = AsyncVoIP(args.server, args.user, args.password, args.port)
+    store = AnnouncementStore(args.store)
+    try:
+        await voip.connect()
+        campaign = Campaign(
+            voip, store, args.announcement, args.concurrency, args.cps,
+            args.timeout, args.results
+            )
+        started = time.monotonic()
+        summary = await campaign.run(args.numbers)
+        elapsed = time.monotonic() - started
+    finally:
+        voip.close()
+        store.close()
+    calls = sum(summary.values())
+    print(f'{calls} calls in {elapsed:.1f}s ' +
+        f'({calls * 3600 / elapsed if elapsed else 0:.0f}/h): ' +
+        ', '.join(f'{key}={value}' for key, value in sorted(summary.items())))
+    return 0
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='run an outbound campaign')
+    parser.add_argument('server')
+    parser.add_argument('user')
+    parser.add_argument('password')
+    parser.add_argument('numbers', help='csv file with numbers')
+    parser.add_argument('announcement', help='wave file to play')
+    parser.add_argument('--port', type=int, default=5060)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--cps', type=float, default=1.0,
+        help='calls started per second')
+    parser.add_argument('--timeout', type=float, default=60,
+        help='seconds to wait for an answer')
+    parser.add_argument('--results', default='results.csv')
+    parser.add_argument('--store', default='.announcements',
+        help='directory of pre-encoded announcements')
+    parser.add_argument('--metrics', help='write metrics to this file')
+    parser.add_argument('--debug', action='store_true')
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    try:
+        return asyncio.run(run(args))
+    finally:
+        if args.metrics:
+            REGISTRY.write(args.metrics)
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,206 @@
+''' G.711 audio codecs
+
+encoding and decoding works on whole buffers through lookup tables which are
+computed once per process. if numpy is available the tables are applied as
+array indexing, otherwise the standard library does the lookup without a
+python loop per sample.
+'''
+import logging
+import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+ULAW_BIAS = 0x84
+ULAW_CLIP = 8159
+ULAW_SEGMENTS = (0x3f, 0x7f, 0xff, 0x1ff, 0x3ff, 0x7ff, 0xfff, 0x1fff)
+ALAW_SEGMENTS = (0x1f, 0x3f, 0x7f, 0xff, 0x1ff, 0x3ff, 0x7ff, 0xfff)
+
+
+def linear2ulaw(sample):
+    ''' encode a single signed 16 bit sample to µ-law
+    '''
+    sample >>= 2
+    if sample < 0:
+        sample = -sample
+        mask = 0x7f
+    else:
+        mask = 0xff
+    sample = min(sample, ULAW_CLIP) + (ULAW_BIAS >> 2)
+
+    for segment, end in enumerate(ULAW_SEGMENTS):
+        if sample <= end:
+            break
+    else:
+        return 0x7f ^ mask
+    return (segment << 4 | (sample >> (segment + 1)) & 0x0f) ^ mask
+
+
+def ulaw2linear(value):
+    ''' decode a single µ-law byte to a signed 16 bit sample
+    '''
+    value = ~value & 0xff
+    sample = ((value & 0x0f) << 3) + ULAW_BIAS
+    sample <<= (value & 0x70) >> 4
+    return ULAW_BIAS - sample if value & 0x80 else sample - ULAW_BIAS
+
+
+def linear2alaw(sample):
+    ''' encode a single signed 16 bit sample to A-law
+    '''
+    sample >>= 3
+    if sample >= 0:
+        mask = 0xd5
+    else:
+        mask = 0x55
+        sample = -sample - 1
+
+    for segment, end in enumerate(ALAW_SEGMENTS):
+        if sample <= end:
+            break
+    else:
+        return 0x7f ^ mask
+
+    value = segment << 4
+    if segment < 2:
+        value |= (sample >> 1) & 0x0f
+    else:
+        value |= (sample >> segment) & 0x0f
+    return value ^ mask
+
+
+def alaw2linear(value):
+    ''' decode a single A-law byte to a signed 16 bit sample
+    '''
+    value ^= 0x55
+    sample = (value & 0x0f) << 4
+    segment = (value & 0x70) >> 4
+    if segment == 0:
+        sample += 8
+    else:
+        sample += 0x108
+        if segment > 1:
+            sample <<= segment - 1
+    return sample if value & 0x80 else -sample
+
+
+class G711Codec():
+    ''' base class for the G.711 codecs
+    derived classes set the payload type, name and the single sample
+    functions from which the lookup tables are built
+    '''
+    payload_type = None
+    name = None
+    clockrate = 8000
+    sampwidth = 1
+
+    _tables = {}
+
+    def __init__(self):
+        self.log = logging.getLogger(self.__class__.__name__)
+        if self.name not in self._tables:
+            self._tables[self.name] = self._build_tables()
+        self.encode16, self.encode8, self.decode16 = self._tables[self.name]
+
+    def _build_tables(self):
+        ''' create lookup tables for signed 16 bit input indexed as unsigned
+        value, unsigned 8 bit input and for decoding
+        '''
+        encode = self.encode_sample
+        decode = self.decode_sample
+        encode16 = bytes(
+            encode(value - 0x10000 if value & 0x8000 else value)
+            for value in range(0x10000)
+            )
+        encode8 = bytes(encode((value - 0x80) << 8) for value in range(0x100))
+        decode16 = array('h', (decode(value) for value in range(0x100)))
+        if numpy is not None:
+            encode16 = numpy.frombuffer(encode16, dtype=numpy.uint8)
+            decode16 = numpy.array(decode16, dtype='<i2')
+        else:
+            decode16 = [
+                sample.to_bytes(2, 'little', signed=True)
+                for sample in decode16
+                ]
+        return encode16, encode8, decode16
+
+    def encode(self, data, sampwidth=2):
+        ''' encode little endian linear pcm of `sampwidth` bytes per sample
+        8 bit samples are unsigned as stored in wave files
+        '''
+        if sampwidth == 1:
+            return bytes(data).translate(self.encode8)
+        if sampwidth != 2:
+            raise ValueError(f'unsupported sample width {sampwidth}')
+
+        if numpy is not None:
+            samples = numpy.frombuffer(data, dtype='<u2')
+            return self.encode16[samples].tobytes()
+
+        samples = array('H')
+        samples.frombytes(data)
+        if sys.byteorder != 'little':
+            samples.byteswap()
+        return bytes(map(self.encode16.__getitem__, samples))
+
+    def decode(self, data):
+        ''' decode to signed 16 bit little endian linear pcm
+        '''
+        if numpy is not None:
+            values = numpy.frombuffer(data, dtype=numpy.uint8)
+            return self.decode16[values].tobytes()
+        return b''.join(map(self.decode16.__getitem__, data))
+
+    def __repr__(self):
+        return f'{self.name}/{self.clockrate}'
+
+
+class PCMU(G711Codec):
+    ''' G.711 µ-law
+    '''
+    payload_type = 0
+    name = 'PCMU'
+
+    @staticmethod
+    def encode_sample(sample):
+        return linear2ulaw(sample)
+
+    @staticmethod
+    def decode_sample(value):
+        return ulaw2linear(value)
+
+
+class PCMA(G711Codec):
+    ''' G.711 A-law
+    '''
+    payload_type = 8
+    name = 'PCMA'
+
+    @staticmethod
+    def encode_sample(sample):
+        return linear2alaw(sample)
+
+    @staticmethod
+    def decode_sample(value):
+        return alaw2linear(value)
+
+
+CODECS = {codec.payload_type: codec for codec in (PCMU, PCMA)}
+
+
+def select_codec(formats):
+    ''' return a codec for the first supported payload type in `formats`
+    which is the format list of an sdp media line in order of preference
+    '''
+    for fmt in formats:
+        try:
+            payload_type = int(fmt)
+        except ValueError:
+            continue
+        if payload_type in CODECS:
+            return CODECS[payload_type]()
+    return None
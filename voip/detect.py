@@ -0,0 +1,322 @@
+''' in-band dtmf and call progress tone detection for many streams
+
+the decoded inbound audio of every call is fed to one ToneDetector, one
+frame per stream and tick. `run` then measures the power of all dtmf and
+call progress frequencies for all streams at once: with numpy the frames
+form a (streams x samples) matrix and the goertzel bins of every stream
+are one matrix product with the cosine and sine terms of the bins, which
+gives the same power as running a goertzel filter per frequency. without
+numpy every stream is run through the goertzel recurrence on its own.
+
+a key is reported once it was detected in two frames in a row, and again
+only after a frame without it. call progress tones are reported once they
+lasted `tone_frames` frames. events go to `callback(key, kind, value)`
+with kind 'dtmf' and the digit or 'tone' and the name of the tone:
+
+    detector = ToneDetector(on_event)
+    detector.add(call)
+    ...
+    detector.feed(call, pcm)   # every tick for every call
+    detector.run()
+'''
+import logging
+import math
+import sys
+import time
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from voip.metrics import REGISTRY
+
+EVENTS = REGISTRY.counter(
+    'tone_events_total', 'detected dtmf keys and tones', ('kind',)
+    )
+RUN_TIME = REGISTRY.histogram(
+    'tone_detection_seconds', 'time of a detection pass over all streams',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02)
+    )
+
+ROWS = (697, 770, 852, 941)
+COLUMNS = (1209, 1336, 1477, 1633)
+KEYS = '123A456B789C*0#D'
+TONES = {
+    'dial': (350, 440),
+    'ringback': (440, 480),
+    'busy': (480, 620),
+    'cng': (1100,),
+    'ced': (2100,),
+    }
+FREQUENCIES = ROWS + COLUMNS + tuple(sorted(
+    {f for tone in TONES.values() for f in tone}
+    ))
+
+
+class ToneDetector():
+    ''' detects dtmf and call progress tones in frames of `block` samples
+    of signed 16 bit little endian pcm at `rate`
+    '''
+    # share of the frame's power in the two dtmf tones, the largest other
+    # row or column against the peak, allowed twist of the column tone
+    DTMF_POWER = 0.7
+    DTMF_PEAK = 0.25
+    TWIST = (10 ** -0.4, 10 ** 0.8)
+    # share of the power of a call progress tone and of each component
+    TONE_POWER = 0.7
+    TONE_COMPONENT = 0.15
+
+    def __init__(self, callback, rate=8000, block=160, capacity=256,
+            min_level=1e4, tone_frames=10):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.callback = callback
+        self.rate = rate
+        self.block = block
+        self.min_level = min_level
+        self.tone_frames = tone_frames
+        self.slots = {}
+        self.keys = []
+        self.free = []
+        self.tones = list(TONES)
+        self.components = [
+            [FREQUENCIES.index(f) for f in TONES[name]] for name in self.tones
+            ]
+        if numpy is not None:
+            angles = 2 * numpy.pi * numpy.outer(
+                numpy.arange(block), numpy.array(FREQUENCIES) / rate
+                )
+            self.basis = numpy.concatenate(
+                (numpy.cos(angles), numpy.sin(angles)), axis=1
+                ).astype(numpy.float32)
+        else:
+            self.coefficients = [
+                2 * math.cos(2 * math.pi * f / rate) for f in FREQUENCIES
+                ]
+        self.capacity = 0
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        old = self.capacity
+        self.capacity = capacity
+        if numpy is not None:
+            frames = numpy.zeros((capacity, self.block), dtype=numpy.float32)
+            fed = numpy.zeros(capacity, dtype=bool)
+            last = numpy.full(capacity, -1, dtype=numpy.int8)
+            reported = numpy.full(capacity, -1, dtype=numpy.int8)
+            counts = numpy.zeros((capacity, len(self.tones)), numpy.int32)
+            if old:
+                frames[:old] = self.frames
+                fed[:old] = self.fed
+                last[:old] = self.last
+                reported[:old] = self.reported
+                counts[:old] = self.counts
+            self.frames, self.fed, self.last, self.reported, self.counts = \
+                frames, fed, last, reported, counts
+        else:
+            extra = capacity - old
+            if not old:
+                self.frames, self.fed, self.last = [], [], []
+                self.reported, self.counts = [], []
+            self.frames += [None] * extra
+            self.fed += [False] * extra
+            self.last += [-1] * extra
+            self.reported += [-1] * extra
+            self.counts += [[0] * len(self.tones) for _ in range(extra)]
+        self.keys += [None] * (capacity - old)
+        self.free += range(capacity - 1, old - 1, -1)
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, key):
+        return key in self.slots
+
+    def add(self, key):
+        ''' start detection for the stream `key`
+        '''
+        if key in self.slots:
+            return
+        if not self.free:
+            self._grow(2 * self.capacity)
+        slot = self.free.pop()
+        self.slots[key] = slot
+        self.keys[slot] = key
+        self._clear(slot)
+
+    def remove(self, key):
+        slot = self.slots.pop(key, None)
+        if slot is not None:
+            self.keys[slot] = None
+            self._clear(slot)
+            self.free.append(slot)
+
+    def _clear(self, slot):
+        self.fed[slot] = False
+        self.last[slot] = -1
+        self.reported[slot] = -1
+        if numpy is not None:
+            self.counts[slot] = 0
+        else:
+            self.counts[slot] = [0] * len(self.tones)
+
+    def feed(self, key, pcm):
+        ''' the next frame of `key`, shorter frames are padded with silence
+        '''
+        slot = self.slots[key]
+        count = min(len(pcm) // 2, self.block)
+        if numpy is not None:
+            row = self.frames[slot]
+            row[:count] = numpy.frombuffer(pcm, dtype='<i2', count=count)
+            row[count:] = 0
+        else:
+            samples = array('h', bytes(pcm[:2 * count]))
+            if sys.byteorder != 'little':
+                samples.byteswap()
+            self.frames[slot] = list(samples) + [0] * (self.block - count)
+        self.fed[slot] = True
+
+    def run(self):
+        ''' detect over the frames fed since the last run and report
+        returns the number of reported events
+        '''
+        started = time.perf_counter()
+        if numpy is not None:
+            events = self._run_numpy()
+        else:
+            events = self._run_python()
+        RUN_TIME.observe(time.perf_counter() - started)
+        for slot, kind, value in events:
+            EVENTS.labels(kind).inc()
+            key = self.keys[slot]
+            try:
+                self.callback(key, kind, value)
+            except Exception:
+                self.log.exception(f'tone callback for {key}')
+        return len(events)
+
+    def _run_numpy(self):
+        high = max(self.slots.values(), default=-1) + 1
+        if not high:
+            return []
+        frames = self.frames[:high]
+        fed = self.fed[:high].copy()
+        self.fed[:high] = False
+
+        # power of every bin relative to a full scale sine of the frame
+        # power, a pure tone gives 1
+        terms = frames @ self.basis
+        count = len(FREQUENCIES)
+        power = terms[:, :count] ** 2 + terms[:, count:] ** 2
+        energy = numpy.einsum('ij,ij->i', frames, frames)
+        loud = fed & (energy > self.min_level * self.block)
+        ratios = power * (2 / self.block) / numpy.maximum(energy, 1.0)[:, None]
+
+        rows = ratios[:, :4]
+        columns = ratios[:, 4:8]
+        row = rows.argmax(axis=1)
+        column = columns.argmax(axis=1)
+        index = numpy.arange(high)
+        row_peak = rows[index, row]
+        column_peak = columns[index, column]
+        # the second largest of the group must be well below the peak
+        row_second = numpy.sort(rows, axis=1)[:, -2]
+        column_second = numpy.sort(columns, axis=1)[:, -2]
+        twist = column_peak / numpy.maximum(row_peak, 1e-9)
+        valid = loud & (row_peak + column_peak > self.DTMF_POWER) & \
+            (row_second < self.DTMF_PEAK * row_peak) & \
+            (column_second < self.DTMF_PEAK * column_peak) & \
+            (twist > self.TWIST[0]) & (twist < self.TWIST[1])
+        digit = numpy.where(valid, row * 4 + column, -1).astype(numpy.int8)
+
+        events = []
+        last = self.last[:high]
+        reported = self.reported[:high]
+        confirmed = fed & (digit >= 0) & (digit == last) & (digit != reported)
+        for slot in numpy.flatnonzero(confirmed):
+            events.append((slot, 'dtmf', KEYS[digit[slot]]))
+        # a frame without the key allows it to be reported again
+        reported[confirmed] = digit[confirmed]
+        reported[fed & (digit < 0)] = -1
+        last[fed] = digit[fed]
+
+        counts = self.counts[:high]
+        for tone, components in enumerate(self.components):
+            parts = ratios[:, components]
+            present = loud & (parts.sum(axis=1) > self.TONE_POWER)
+            if len(components) > 1:
+                present &= (parts > self.TONE_COMPONENT).all(axis=1)
+            present &= digit < 0
+            counts[fed & ~present, tone] = 0
+            counts[fed & present, tone] += 1
+            for slot in numpy.flatnonzero(counts[:, tone] == self.tone_frames):
+                if fed[slot] and present[slot]:
+                    events.append((slot, 'tone', self.tones[tone]))
+        return events
+
+    def _goertzel(self, samples):
+        ''' powers of all frequencies of one frame
+        '''
+        powers = []
+        for coefficient in self.coefficients:
+            previous = before = 0.0
+            for sample in samples:
+                previous, before = \
+                    sample + coefficient * previous - before, previous
+            powers.append(
+                previous * previous + before * before -
+                coefficient * previous * before
+                )
+        return powers
+
+    def _run_python(self):
+        events = []
+        for slot in self.slots.values():
+            if not self.fed[slot]:
+                continue
+            self.fed[slot] = False
+            samples = self.frames[slot]
+            energy = sum(sample * sample for sample in samples)
+            if energy <= self.min_level * self.block:
+                digit, present = -1, [False] * len(self.tones)
+            else:
+                ratios = [power * 2 / self.block / energy
+                    for power in self._goertzel(samples)]
+                digit = self._digit(ratios[:4], ratios[4:8])
+                present = [
+                    digit < 0 and self._tone(ratios, components)
+                    for components in self.components
+                    ]
+            if digit >= 0 and digit == self.last[slot] and \
+                    digit != self.reported[slot]:
+                events.append((slot, 'dtmf', KEYS[digit]))
+                self.reported[slot] = digit
+            elif digit < 0:
+                self.reported[slot] = -1
+            self.last[slot] = digit
+            counts = self.counts[slot]
+            for tone, flag in enumerate(present):
+                counts[tone] = counts[tone] + 1 if flag else 0
+                if counts[tone] == self.tone_frames:
+                    events.append((slot, 'tone', self.tones[tone]))
+        return events
+
+    def _digit(self, rows, columns):
+        row = max(range(4), key=rows.__getitem__)
+        column = max(range(4), key=columns.__getitem__)
+        row_peak, column_peak = rows[row], columns[column]
+        twist = column_peak / max(row_peak, 1e-9)
+        if row_peak + column_peak <= self.DTMF_POWER or \
+                sorted(rows)[-2] >= self.DTMF_PEAK * row_peak or \
+                sorted(columns)[-2] >= self.DTMF_PEAK * column_peak or \
+                not self.TWIST[0] < twist < self.TWIST[1]:
+            return -1
+        return row * 4 + column
+
+    def _tone(self, ratios, components):
+        parts = [ratios[index] for index in components]
+        if sum(parts) <= self.TONE_POWER:
+            return False
+        return len(parts) == 1 or \
+            all(part > self.TONE_COMPONENT for part in parts)
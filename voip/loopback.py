@@ -0,0 +1,850 @@
+''' a local sip registrar and user agent server for load tests
+
+LoopbackServer stands in for a pbx on localhost. it answers REGISTER with
+bindings, challenges REGISTER and INVITE with digest 401 or 407, answers
+every INVITE with a scripted sequence of responses such as 100, 183 and
+200 with a session description, and lets the media of all calls end in
+one RTPSink, which counts packets, loss and duplicates per ssrc and can
+echo them back. retransmitted requests get the last response again.
+
+an Impairment drops, delays, reorders and duplicates the datagrams the
+server sends, so retransmissions, late responses and a jittery media path
+are exercised without a network.
+
+the load command drives any number of registered clients against an
+in-process server, or any other server, and reports the registration and
+call setup rate, failures and media throughput:
+
+    python -m voip.loopback serve --port 5062 --challenge 407 --loss 0.05
+    python -m voip.loopback load --clients 100 --calls 1000 --hold 2
+'''
+import argparse
+import asyncio
+import collections
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import random
+import struct
+import sys
+import time
+
+from voip.aio import open_transport
+from voip.auth import CredentialCache, parse_digest
+from voip.ports import PortPool
+from voip.rtcp import ReceptionStats
+from voip.scheduler import MediaScheduler
+from voip.sdp import offer
+from voip.sipparser import SIPView, Address
+from voip.voip import AsyncVoIP
+from voip.wire import response
+
+# (code, seconds after the INVITE) of the responses to every INVITE
+SCRIPT = ((100, 0.0), (183, 0.05), (200, 0.1))
+# responses carrying the session description
+WITH_SDP = (183, 200)
+HEADER = struct.Struct('!BBHII')
+# seconds a server transaction answers retransmissions, 64 * T1
+TRANSACTION_TIME = 32.0
+# first and longest interval of final responses to INVITE until the ACK
+T1 = 0.5
+T2 = 4.0
+
+
+def md5(text):
+    return hashlib.md5(text.encode('utf8')).hexdigest()
+
+
+def parse_script(text):
+    ''' a script like "100,183:0.05,200:0.1" as (code, delay) pairs
+    '''
+    script = []
+    for item in text.split(','):
+        code, _, delay = item.strip().partition(':')
+        script.append((int(code), float(delay) if delay else 0.0))
+    if not script or script[-1][0] < 200:
+        raise ValueError(f'script {text} ends without a final response')
+    return tuple(script)
+
+
+class Impairment():
+    ''' sends datagrams with loss, delay, jitter, reordering and
+    duplication, each given as probability or seconds
+    '''
+    def __init__(self, loss=0.0, delay=0.0, jitter=0.0, reorder=0.0,
+            duplicate=0.0, reorder_delay=0.04, seed=None):
+        self.loss = loss
+        self.delay = delay
+        self.jitter = jitter
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.reorder_delay = reorder_delay
+        self.random = random.Random(seed)
+        self.stats = collections.Counter()
+
+    @property
+    def active(self):
+        return any((
+            self.loss, self.delay, self.jitter, self.reorder, self.duplicate
+            ))
+
+    def sendto(self, transport, data, address):
+        if not self.active:
+            transport.sendto(data, address)
+            return
+        chance = self.random.random
+        if self.loss and chance() < self.loss:
+            self.stats['dropped'] += 1
+            return
+        wait = self.delay + self.random.uniform(0, self.jitter)
+        if self.reorder and chance() < self.reorder:
+            # held back, so the following datagrams overtake it
+            wait += self.reorder_delay
+            self.stats['reordered'] += 1
+        data = bytes(data)
+        self._later(wait, transport, data, address)
+        if self.duplicate and chance() < self.duplicate:
+            self.stats['duplicated'] += 1
+            self._later(
+                wait + self.random.uniform(0, self.reorder_delay),
+                transport, data, address
+                )
+
+    @staticmethod
+    def _later(wait, transport, data, address):
+        if wait <= 0:
+            transport.sendto(data, address)
+        else:
+            asyncio.get_running_loop().call_later(
+                wait, Impairment._send, transport, data, address
+                )
+
+    @staticmethod
+    def _send(transport, data, address):
+        if not transport.is_closing():
+            transport.sendto(data, address)
+
+
+class RTPSink(asyncio.DatagramProtocol):
+    ''' counts the received rtp packets of all calls, per ssrc
+    with `echo` every packet is sent back through `impairment`
+    '''
+    def __init__(self, echo=False, impairment=None, clockrate=8000):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.echo = echo
+        self.impairment = impairment or Impairment()
+        self.clockrate = clockrate
+        self.transport = None
+        self.packets = 0
+        self.octets = 0
+        self.invalid = 0
+        self.sources = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    @property
+    def port(self):
+        return self.transport.get_extra_info('sockname')[1]
+
+    def datagram_received(self, data, addr):
+        if len(data) < HEADER.size or data[0] >> 6 != 2:
+            self.invalid += 1
+            return
+        _, _, sequence, timestamp, ssrc = HEADER.unpack_from(data)
+        self.packets += 1
+        self.octets += len(data)
+        stats = self.sources.get(ssrc)
+        if stats is None:
+            stats = self.sources[ssrc] = ReceptionStats(self.clockrate)
+        stats.update(ssrc, sequence, timestamp, time.monotonic())
+        if self.echo:
+            self.impairment.sendto(self.transport, data, addr)
+
+    @property
+    def lost(self):
+        return sum(max(0, stats.lost) for stats in self.sources.values())
+
+    @property
+    def duplicates(self):
+        return sum(stats.duplicates for stats in self.sources.values())
+
+    def summary(self):
+        return {
+            'packets': self.packets,
+            'octets': self.octets,
+            'streams': len(self.sources),
+            'lost': self.lost,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            }
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+
+class Dialog():
+    ''' an INVITE received by the server and the timers of its responses
+    '''
+    __slots__ = ('tag', 'invite', 'timers', 'final', 'acked')
+
+    def __init__(self, tag, invite):
+        self.tag = tag
+        self.invite = invite
+        self.timers = []
+        self.final = None
+        self.acked = False
+
+    def cancel(self):
+        for timer in self.timers:
+            timer.cancel()
+        self.timers.clear()
+
+
+class LoopbackServer(asyncio.DatagramProtocol):
+    ''' registrar and user agent server for the users in `users`, a dict
+    of passwords, or for any user with `password`
+    `challenge` is 401 or 407, `methods` are the challenged methods and
+    `script` the (code, delay) responses to every authorized INVITE
+    '''
+    def __init__(self,
+            password='secret', users=None, realm='loopback', challenge=401,
+            qop=True, methods=('REGISTER', 'INVITE'), script=SCRIPT,
+            max_expires=3600, nonce_lifetime=300, impairment=None,
+            sink=None, media_address='127.0.0.1'):
+        self.log = logging.getLogger(self.__class__.__name__)
+        if challenge not in (401, 407):
+            raise ValueError('challenge must be 401 or 407')
+        self.password = password
+        self.users = users
+        self.realm = realm
+        self.challenge = challenge
+        self.qop = qop
+        self.methods = set(methods)
+        self.script = script
+        self.max_expires = max_expires
+        self.nonce_lifetime = nonce_lifetime
+        self.impairment = impairment or Impairment()
+        self.sink = sink
+        self.media_address = media_address
+        self.opaque = os.urandom(8).hex()
+        self.transport = None
+        # nonce: time issued
+        self.nonces = {}
+        # (branch, method): [last response, address, time]
+        self.transactions = {}
+        # aor: (contact, expiry)
+        self.bindings = {}
+        # call id: Dialog
+        self.dialogs = {}
+        self.stats = collections.Counter()
+        self.purge_timer = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.purge_timer = asyncio.get_running_loop().call_later(
+            5, self._purge
+            )
+
+    def connection_lost(self, exc):
+        if self.purge_timer is not None:
+            self.purge_timer.cancel()
+        self.transport = None
+
+    @property
+    def address(self):
+        return self.transport.get_extra_info('sockname')[:2]
+
+    def close(self):
+        for dialog in self.dialogs.values():
+            dialog.cancel()
+        if self.transport is not None:
+            self.transport.close()
+        if self.sink is not None:
+            self.sink.close()
+
+    def _purge(self):
+        now = time.monotonic()
+        for key in [key for key, (_, _, sent) in self.transactions.items()
+                if now - sent > TRANSACTION_TIME]:
+            del self.transactions[key]
+        for nonce in [nonce for nonce, issued in self.nonces.items()
+                if now - issued > 2 * self.nonce_lifetime]:
+            del self.nonces[nonce]
+        for aor in [aor for aor, (_, expiry) in self.bindings.items()
+                if expiry < now]:
+            del self.bindings[aor]
+        self.purge_timer = asyncio.get_running_loop().call_later(
+            5, self._purge
+            )
+
+    def datagram_received(self, data, addr):
+        try:
+            msg = SIPView(data)
+            method = msg.method
+            key = (msg.branch, method)
+        except ValueError as e:
+            self.stats['invalid'] += 1
+            self.log.debug(f'invalid message from {addr}: {e}')
+            return
+        if msg.is_response:
+            return
+        if method == 'ACK':
+            self.on_ack(msg)
+            return
+
+        transaction = self.transactions.get(key)
+        if transaction is not None:
+            # a retransmission, the response may have been lost
+            self.stats['retransmitted'] += 1
+            transaction[1] = addr
+            if transaction[0] is not None:
+                self.impairment.sendto(self.transport, transaction[0], addr)
+            return
+        self.transactions[key] = [None, addr, time.monotonic()]
+        self.stats[method.lower()] += 1
+
+        if method in self.methods:
+            authorized, stale = self.authorized(msg)
+            if not authorized:
+                self.stats['challenged'] += 1
+                self.respond(
+                    key, msg, self.challenge, (self._challenge(stale),)
+                    )
+                return
+        handler = getattr(self, f'on_{method.lower()}', None)
+        if handler is None:
+            self.respond(key, msg, 405, ('Allow: REGISTER, INVITE, ACK, ' +
+                'BYE, CANCEL, OPTIONS',))
+        else:
+            handler(key, msg)
+
+    def response(self, msg, code, headers=(), body=b'', tag=None):
+        ''' the bytes of the response `code` to `msg`
+        '''
+        return response(msg, code, headers, body, tag, 'voip loopback')
+
+    def respond(self, key, msg, code, headers=(), body=b'', tag=None):
+        ''' send a response within the transaction `key` and keep it for
+        retransmissions of the request
+        '''
+        data = self.response(msg, code, headers, body, tag)
+        transaction = self.transactions.get(key)
+        if transaction is None:
+            return
+        transaction[0] = data
+        transaction[2] = time.monotonic()
+        self.stats[f'sent {code}'] += 1
+        if self.transport is not None:
+            self.impairment.sendto(self.transport, data, transaction[1])
+
+    def password_of(self, user):
+        if self.users is not None:
+            return self.users.get(user)
+        return self.password
+
+    def authorized(self, msg):
+        ''' (whether the credentials of `msg` are valid, whether they only
+        failed because the nonce expired)
+        '''
+        header = 'Authorization' if self.challenge == 401 \
+            else 'Proxy-Authorization'
+        value = msg.get(header)
+        if value is None:
+            return False, False
+        try:
+            values = parse_digest(value)
+        except ValueError:
+            return False, False
+        user = values.get('username')
+        password = self.password_of(user)
+        nonce = values.get('nonce')
+        issued = self.nonces.get(nonce)
+        if password is None or issued is None or \
+                values.get('realm') != self.realm:
+            return False, False
+        ha1 = md5(f'{user}:{self.realm}:{password}')
+        ha2 = md5(f'{msg.method}:{values.get("uri", "")}')
+        if 'qop' in values:
+            expected = md5(
+                f'{ha1}:{nonce}:{values.get("nc", "")}:' +
+                f'{values.get("cnonce", "")}:{values["qop"]}:{ha2}'
+                )
+        else:
+            expected = md5(f'{ha1}:{nonce}:{ha2}')
+        if values.get('response') != expected:
+            return False, False
+        if time.monotonic() - issued > self.nonce_lifetime:
+            return False, True
+        return True, False
+
+    def _challenge(self, stale=False):
+        nonce = os.urandom(12).hex()
+        self.nonces[nonce] = time.monotonic()
+        header = 'WWW-Authenticate' if self.challenge == 401 \
+            else 'Proxy-Authenticate'
+        value = f'{header}: Digest realm="{self.realm}", ' + \
+            f'nonce="{nonce}", algorithm=MD5, opaque="{self.opaque}"'
+        if self.qop:
+            value += ', qop="auth"'
+        if stale:
+            value += ', stale=true'
+        return value
+
+    def on_register(self, key, msg):
+        aor = Address(msg.get('To', '')).uri
+        contact = msg.get('Contact')
+        requested = msg.get('Expires', '3600')
+        if contact is not None:
+            address = Address(contact)
+            requested = address.params.get('expires', requested)
+        expires = min(int(requested), self.max_expires) \
+            if requested.isdigit() else self.max_expires
+        if contact is None or expires == 0:
+            self.bindings.pop(aor, None)
+            self.respond(key, msg, 200, ('Expires: 0',))
+            return
+        uri = Address(contact).uri
+        self.bindings[aor] = (uri, time.monotonic() + expires)
+        self.respond(key, msg, 200, (
+            f'Contact: <{uri}>;expires={expires}', f'Expires: {expires}',
+            ))
+
+    def on_invite(self, key, msg):
+        dialog = Dialog(os.urandom(6).hex(), key)
+        self.dialogs[msg.get('Call-ID')] = dialog
+        loop = asyncio.get_running_loop()
+        for code, delay in self.script:
+            if delay <= 0:
+                self._scripted(dialog, msg, code)
+            else:
+                dialog.timers.append(loop.call_later(
+                    delay, self._scripted, dialog, msg, code
+                    ))
+
+    def _scripted(self, dialog, msg, code):
+        headers = ()
+        body = b''
+        if code in WITH_SDP:
+            host, port = self.address
+            headers = (f'Contact: <sip:loopback@{host}:{port}>',)
+            if self.sink is not None:
+                body = offer(self.media_address, self.sink.port).encode()
+        tag = dialog.tag if code > 100 else None
+        self.respond(dialog.invite, msg, code, headers, body, tag)
+        if code >= 200:
+            self.stats['answered' if code < 300 else 'failed'] += 1
+            self._final(msg.get('Call-ID'), dialog, code)
+
+    def _final(self, call_id, dialog, code):
+        ''' the final response to the INVITE of `dialog` was sent, it is
+        repeated until the ACK arrives as it may have been lost
+        '''
+        dialog.cancel()
+        dialog.final = code
+        deadline = time.monotonic() + TRANSACTION_TIME
+        dialog.timers.append(asyncio.get_running_loop().call_later(
+            T1, self._repeat, call_id, dialog, T1, deadline
+            ))
+
+    def _repeat(self, call_id, dialog, interval, deadline):
+        dialog.timers.clear()
+        if dialog.acked or self.dialogs.get(call_id) is not dialog:
+            return
+        if time.monotonic() > deadline:
+            self.stats['unacknowledged'] += 1
+            if dialog.final >= 300:
+                del self.dialogs[call_id]
+            return
+        transaction = self.transactions.get(dialog.invite)
+        if transaction is not None and self.transport is not None:
+            self.stats['repeated'] += 1
+            self.impairment.sendto(
+                self.transport, transaction[0], transaction[1]
+                )
+        interval = min(2 * interval, T2)
+        dialog.timers.append(asyncio.get_running_loop().call_later(
+            interval, self._repeat, call_id, dialog, interval, deadline
+            ))
+
+    def on_ack(self, msg):
+        self.stats['ack'] += 1
+        call_id = msg.get('Call-ID')
+        dialog = self.dialogs.get(call_id)
+        if dialog is None or dialog.final is None:
+            return
+        tag = Address(msg.get('To', '')).tag
+        if tag != dialog.tag:
+            # an ACK without the dialog's To tag does not match it
+            self.stats['unmatched ack'] += 1
+            return
+        dialog.acked = True
+        dialog.cancel()
+        if dialog.final >= 300:
+            del self.dialogs[call_id]
+
+    def on_cancel(self, key, msg):
+        self.respond(key, msg, 200)
+        call_id = msg.get('Call-ID')
+        dialog = self.dialogs.get(call_id)
+        if dialog is None or dialog.final is not None:
+            return
+        self.stats['cancelled'] += 1
+        # the INVITE is answered from its transaction, the CANCEL carries
+        # the same headers apart from the CSeq method
+        invite = SIPView(
+            msg.data.replace(b' CANCEL\r\n', b' INVITE\r\n', 1)
+            )
+        self.respond(dialog.invite, invite, 487, tag=dialog.tag)
+        self._final(call_id, dialog, 487)
+
+    def on_bye(self, key, msg):
+        dialog = self.dialogs.pop(msg.get('Call-ID'), None)
+        if dialog is not None:
+            dialog.cancel()
+        self.respond(key, msg, 200 if dialog is not None else 481)
+
+    def on_options(self, key, msg):
+        self.respond(key, msg, 200, (
+            'Allow: REGISTER, INVITE, ACK, BYE, CANCEL, OPTIONS',
+            ))
+
+    def summary(self):
+        summary = dict(self.stats)
+        summary['registered'] = len(self.bindings)
+        summary['dialogs'] = len(self.dialogs)
+        summary.update(self.impairment.stats)
+        if self.sink is not None:
+            summary['rtp'] = self.sink.summary()
+        return summary
+
+
+async def serve(host='127.0.0.1', port=5060, rtp_port=0, echo=False,
+        impairment=None, media_address=None, **options):
+    ''' start a LoopbackServer on `host`:`port` with an RTPSink and return
+    the server, `options` are passed on to it
+    '''
+    loop = asyncio.get_running_loop()
+    impairment = impairment or Impairment()
+    _, sink = await loop.create_datagram_endpoint(
+        lambda: RTPSink(echo, impairment), local_addr=(host, rtp_port)
+        )
+    if media_address is None:
+        media_address = '127.0.0.1' if host == '0.0.0.0' else host
+    _, server = await loop.create_datagram_endpoint(
+        lambda: LoopbackServer(
+            impairment=impairment, sink=sink, media_address=media_address,
+            **options
+            ),
+        local_addr=(host, port)
+        )
+    return server
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+class LoadTest():
+    ''' `clients` registered AsyncVoIP accounts placing `calls` calls in
+    total, one at a time each, which stream silence for `hold` seconds
+    '''
+    def __init__(self,
+            server, port, clients=10, calls=None, hold=1.0, number='100',
+            user='user', password='secret', timeout=10.0):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.server = server
+        self.port = port
+        self.clients = clients
+        self.calls = calls if calls is not None else 5 * clients
+        self.hold = hold
+        self.number = number
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.failures = collections.Counter()
+        self.registration_times = []
+        self.setup_times = []
+        self.answered = 0
+        self.sent = 0
+        self.registration_elapsed = 0.0
+        self.call_elapsed = 0.0
+        self.silence = {}
+
+    def _local(self):
+        try:
+            loopback = ipaddress.ip_address(self.server).is_loopback
+        except ValueError:
+            loopback = False
+        return '127.0.0.1' if loopback else '0.0.0.0'
+
+    async def register(self, voip):
+        started = time.monotonic()
+        try:
+            await voip.connect()
+        except Exception as e:
+            self.failures[f'register {type(e).__name__}'] += 1
+            return False
+        self.registration_times.append(time.monotonic() - started)
+        return True
+
+    async def dial(self, voip, scheduler):
+        started = time.monotonic()
+        try:
+            call = await voip.call(self.number, self.timeout)
+        except Exception as e:
+            self.failures[f'call {type(e).__name__}'] += 1
+            return
+        if call is None:
+            self.failures['unanswered'] += 1
+            return
+        self.setup_times.append(time.monotonic() - started)
+        self.answered += 1
+        try:
+            if self.hold > 0 and call.codec is not None:
+                stats = await self.stream(call, scheduler)
+                self.sent += stats.sent
+        finally:
+            try:
+                await voip.hangup(call)
+            except Exception as e:
+                self.failures[f'hangup {type(e).__name__}'] += 1
+
+    async def stream(self, call, scheduler):
+        key = call.payload_type
+        data = self.silence.get(key)
+        if data is None:
+            codec = call.codec
+            data = self.silence[key] = codec.encode(
+                bytes(2 * int(codec.clockrate * self.hold))
+                )
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+
+        def done(stats):
+            loop.call_soon_threadsafe(finished.set_result, stats)
+
+        call.stream_raw(data, scheduler, done)
+        return await finished
+
+    async def run(self):
+        ''' register all clients, place all calls and return the summary
+        '''
+        protocol = await open_transport(
+            self.server, self.port, local=(self._local(), 0)
+            )
+        ports = PortPool(self._local())
+        credentials = CredentialCache()
+        scheduler = MediaScheduler()
+        scheduler.start()
+        clients = [
+            AsyncVoIP(self.server, f'{self.user}{index}', self.password,
+                self.port, protocol=protocol, credentials=credentials,
+                ports=ports)
+            for index in range(self.clients)
+            ]
+        try:
+            started = time.monotonic()
+            registered = await asyncio.gather(*(
+                self.register(voip) for voip in clients
+                ))
+            self.registration_elapsed = time.monotonic() - started
+
+            remaining = iter(range(self.calls))
+
+            async def worker(voip):
+                for _ in remaining:
+                    await self.dial(voip, scheduler)
+
+            started = time.monotonic()
+            await asyncio.gather(*(
+                worker(voip) for voip, ok in zip(clients, registered) if ok
+                ))
+            self.call_elapsed = time.monotonic() - started
+        finally:
+            scheduler.stop()
+            for voip in clients:
+                voip.close()
+            protocol.close()
+            ports.close()
+        return self.summary()
+
+    def summary(self):
+        registrations = len(self.registration_times)
+        calls = self.call_elapsed or 1e-9
+        setup_p50 = percentile(self.setup_times, 0.5)
+        setup_p99 = percentile(self.setup_times, 0.99)
+        return {
+            'clients': self.clients,
+            'registered': registrations,
+            'registration_rate': round(
+                registrations / (self.registration_elapsed or 1e-9), 1
+                ),
+            'calls': self.calls,
+            'answered': self.answered,
+            'failures': dict(self.failures),
+            'setup_rate': round(self.answered / calls, 1),
+            'setup_p50_ms': round(setup_p50 * 1000, 2)
+                if setup_p50 is not None else None,
+            'setup_p99_ms': round(setup_p99 * 1000, 2)
+                if setup_p99 is not None else None,
+            'seconds': round(self.call_elapsed, 3),
+            'packets_sent': self.sent,
+            'packets_per_second': round(self.sent / calls, 1),
+            }
+
+
+def impairment_from(args):
+    return Impairment(
+        args.loss, args.delay, args.jitter, args.reorder, args.duplicate,
+        seed=args.seed
+        )
+
+
+def server_options(args):
+    return {
+        'password': args.password,
+        'realm': args.realm,
+        'challenge': args.challenge,
+        'qop': not args.no_qop,
+        'methods': args.challenged.split(',') if args.challenged else (),
+        'script': parse_script(args.script),
+        'echo': args.echo,
+        'impairment': impairment_from(args),
+        }
+
+
+async def run_serve(args):
+    server = await serve(args.host, args.port, args.rtp_port,
+        **server_options(args))
+    host, port = server.address
+    print(f'serving on {host}:{port}, rtp on {server.sink.port}')
+    try:
+        while True:
+            await asyncio.sleep(args.report or 3600)
+            if args.report:
+                print(json.dumps(server.summary(), sort_keys=True))
+    finally:
+        server.close()
+
+
+async def run_load(args):
+    server = None
+    host, port = args.server, args.port
+    if host is None:
+        server = await serve('127.0.0.1', 0, **server_options(args))
+        host, port = server.address
+    test = LoadTest(
+        host, port, args.clients, args.calls, args.hold, args.number,
+        args.user, args.password, args.timeout
+        )
+    try:
+        summary = await test.run()
+    finally:
+        if server is not None:
+            # late media of the last calls
+            await asyncio.sleep(0.1)
+            summary['server'] = server.summary()
+            server.close()
+    rtp = summary.get('server', {}).get('rtp')
+    if rtp is not None:
+        seconds = summary['seconds'] or 1e-9
+        summary['packets_received'] = rtp['packets']
+        summary['kbit_per_second'] = round(
+            rtp['octets'] * 8 / seconds / 1000, 1
+            )
+    return summary
+
+
+def main(args=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--password', default='secret')
+    common.add_argument('--realm', default='loopback')
+    common.add_argument('--challenge', type=int, choices=(401, 407),
+        default=401)
+    common.add_argument('--challenged', default='REGISTER,INVITE',
+        help='comma separated methods which are challenged')
+    common.add_argument('--no-qop', action='store_true')
+    common.add_argument('--script', default='100,183:0.05,200:0.1',
+        help='responses to INVITE as code:seconds')
+    common.add_argument('--echo', action='store_true',
+        help='send received rtp back')
+    common.add_argument('--loss', type=float, default=0.0)
+    common.add_argument('--delay', type=float, default=0.0)
+    common.add_argument('--jitter', type=float, default=0.0)
+    common.add_argument('--reorder', type=float, default=0.0)
+    common.add_argument('--duplicate', type=float, default=0.0)
+    common.add_argument('--seed', type=int)
+    common.add_argument('--debug', action='store_true')
+
+    parser = argparse.ArgumentParser(
+        description='local sip registrar and user agent server for load tests'
+        )
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', parents=[common],
+        help='run the server')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=5060)
+    serve_parser.add_argument('--rtp-port', type=int, default=0)
+    serve_parser.add_argument('--report', type=float, default=0,
+        help='print the statistics every this many seconds')
+    load_parser = commands.add_parser('load', parents=[common],
+        help='drive clients against the server')
+    load_parser.add_argument('--server',
+        help='server to test instead of an in-process one')
+    load_parser.add_argument('--port', type=int, default=5060)
+    load_parser.add_argument('--clients', type=int, default=10)
+    load_parser.add_argument('--calls', type=int,
+        help='calls in total, five per client by default')
+    load_parser.add_argument('--hold', type=float, default=1.0,
+        help='seconds of media per call')
+    load_parser.add_argument('--number', default='100')
+    load_parser.add_argument('--user', default='user',
+        help='prefix of the user names')
+    load_parser.add_argument('--timeout', type=float, default=10.0)
+    load_parser.add_argument('--json', help='write the summary to this file')
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.WARNING)
+    if args.command == 'serve':
+        try:
+            asyncio.run(run_serve(args))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    summary = asyncio.run(run_load(args))
+    print(f'{summary["registered"]}/{summary["clients"]} clients registered ' +
+        f'({summary["registration_rate"]}/s)')
+    line = f'{summary["answered"]}/{summary["calls"]} calls answered in ' + \
+        f'{summary["seconds"]}s, {summary["setup_rate"]} calls/s'
+    if summary['answered']:
+        line += f', setup p50 {summary["setup_p50_ms"]}ms ' + \
+            f'p99 {summary["setup_p99_ms"]}ms'
+    print(line)
+    if summary['failures']:
+        print('failures: ' + ', '.join(
+            f'{reason}={count}'
+            for reason, count in sorted(summary['failures'].items())
+            ))
+    line = f'media: {summary["packets_sent"]} packets sent ' + \
+        f'({summary["packets_per_second"]}/s)'
+    if 'packets_received' in summary:
+        rtp = summary['server']['rtp']
+        line += f', {summary["packets_received"]} received, ' + \
+            f'{rtp["lost"]} lost, {summary["kbit_per_second"]} kbit/s'
+    print(line)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+    return 0 if not summary['failures'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
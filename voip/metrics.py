@@ -0,0 +1,238 @@
+''' metrics registry
+
+counters, gauges and histograms with fixed buckets which are cheap enough
+to stay enabled in production. the registry renders them in the prometheus
+text format, which can be written to a file or served over http.
+updates take the lock of their metric, += is not atomic across threads:
+
+    from voip.metrics import REGISTRY
+    REGISTRY.write('voip.prom')
+    REGISTRY.serve(9100)
+'''
+import bisect
+import logging
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+
+class Metric():
+    ''' base class of all metrics
+    a metric with label names only holds children, one per label values
+    '''
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), **kwargs):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.kwargs = kwargs
+        self.children = {}
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        pass
+
+    def labels(self, *values):
+        ''' return the child for the label `values`
+        '''
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects {self.labelnames}')
+            with self.lock:
+                child = self.children.get(values)
+                if child is None:
+                    child = self.__class__(self.name, '', **self.kwargs)
+                    self.children[values] = child
+        return child
+
+    def samples(self):
+        ''' yield (suffix, labels, value) of the metric and its children
+        '''
+        if not self.labelnames:
+            yield from self._samples({})
+            return
+        for values, child in list(self.children.items()):
+            yield from child._samples(dict(zip(self.labelnames, values)))
+
+    def _samples(self, labels):
+        yield '', labels, self.value
+
+
+class Counter(Metric):
+    ''' a monotonically increasing value
+    '''
+    kind = 'counter'
+
+    def reset(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class Gauge(Metric):
+    ''' a value which can go up and down
+    '''
+    kind = 'gauge'
+
+    def reset(self):
+        self.value = 0
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+
+class Histogram(Metric):
+    ''' counts observations in fixed buckets
+    '''
+    kind = 'histogram'
+    BUCKETS = (
+        0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+        0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+        )
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        super().__init__(
+            name, documentation, labelnames,
+            buckets=tuple(buckets) if buckets else self.BUCKETS
+            )
+
+    def reset(self):
+        self.buckets = self.kwargs['buckets']
+        # the last count is for values above the highest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def _samples(self, labels):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield '_bucket', dict(labels, le=repr(float(bound))), total
+        yield '_bucket', dict(labels, le='+Inf'), self.count
+        yield '_sum', labels, self.sum
+        yield '_count', labels, self.count
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    items = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', r'\\').replace('"', r'\"')
+        items.append(f'{name}="{value}"')
+    return '{' + ','.join(items) + '}'
+
+
+class Registry():
+    ''' a collection of metrics
+    asking for an existing name returns the registered metric
+    '''
+    def __init__(self):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.metrics = {}
+        self.lock = Lock()
+        self.server = None
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, labelnames, **kwargs)
+                self.metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f'{name} is already a {metric.kind}')
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=None):
+        return self._register(
+            Histogram, name, documentation, labelnames, buckets=buckets
+            )
+
+    def reset(self):
+        ''' set all metrics back to zero
+        '''
+        for metric in self.metrics.values():
+            metric.reset()
+            # modules keep the children of .labels() around, so they are
+            # zeroed in place instead of being replaced
+            for child in list(metric.children.values()):
+                child.reset()
+
+    def expose(self):
+        ''' render all metrics in the prometheus text format
+        '''
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for suffix, labels, value in metric.samples():
+                lines.append(f'{name}{suffix}{_format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        ''' write all metrics to `path` atomically, e.g. for the textfile
+        collector of the node exporter
+        '''
+        temp = f'{path}.{os.getpid()}.tmp'
+        with open(temp, 'w') as f:
+            f.write(self.expose())
+        os.replace(temp, path)
+
+    def serve(self, port, address='127.0.0.1'):
+        ''' serve the metrics over http from a background thread
+        '''
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                data = registry.expose().encode('utf8')
+                self.send_response(200)
+                self.send_header(
+                    'Content-Type', 'text/plain; version=0.0.4; charset=utf-8'
+                    )
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                registry.log.debug(format % args)
+
+        self.server = ThreadingHTTPServer((address, port), Handler)
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+REGISTRY = Registry()
@@ -0,0 +1,220 @@
+''' local rtp/rtcp port allocation
+
+calls get their media sockets from a pool of pre-bound pairs instead of
+binding on call setup. every pair consists of an even rtp port and the odd
+rtcp port above it (rfc 3550 section 11). sockets returned on hangup are
+quarantined for a while, so late packets of the old call are not taken for
+the new one, and drained before they are handed out again. when fewer than
+`reserve` pairs are free, a background thread binds more, so call setup
+only binds itself once the reserve ran out.
+'''
+import logging
+import socket
+import time
+from collections import deque
+from threading import Lock, Thread, current_thread
+
+from voip.metrics import REGISTRY
+
+PAIRS = REGISTRY.gauge(
+    'rtp_port_pairs', 'bound rtp/rtcp port pairs by state', ('state',)
+    )
+
+
+def local_address(server, port=5060):
+    ''' the local address used to reach `server`, no packet is sent
+    '''
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.connect((server, port))
+        return s.getsockname()[0]
+
+
+class PortPair():
+    ''' a bound rtp socket and its rtcp socket
+    '''
+    __slots__ = ('pool', 'address', 'port', 'rtp', 'rtcp', 'released')
+
+    def __init__(self, pool, address, port, rtp, rtcp):
+        self.pool = pool
+        self.address = address
+        self.port = port
+        self.rtp = rtp
+        self.rtcp = rtcp
+        self.released = None
+
+    @property
+    def rtcp_port(self):
+        return self.port + 1
+
+    def release(self):
+        ''' give the pair back to its pool
+        '''
+        self.pool.release(self)
+
+    def close(self):
+        self.rtp.close()
+        self.rtcp.close()
+
+    def __repr__(self):
+        return f'PortPair({self.address}:{self.port}/{self.rtcp_port})'
+
+
+class PortPool():
+    ''' hands out port pairs from the range `start` to `end`
+    pairs are bound ahead of time with `prebind` or in the background
+    '''
+    def __init__(self,
+            address='0.0.0.0', start=16384, end=32767, rcvbuf=65536,
+            sndbuf=65536, quarantine=2.0, reserve=8, clock=time.monotonic):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.address = address
+        self.start = start + start % 2
+        self.end = end
+        self.rcvbuf = rcvbuf
+        self.sndbuf = sndbuf
+        self.quarantine = quarantine
+        self.reserve = reserve
+        self.clock = clock
+        self.next_port = self.start
+        self.free = deque()
+        self.quarantined = deque()
+        self.used = 0
+        self.lock = Lock()
+        self.refiller = None
+
+    def __len__(self):
+        ''' number of bound pairs
+        '''
+        return len(self.free) + len(self.quarantined) + self.used
+
+    def _socket(self, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.sndbuf)
+            sock.bind((self.address, port))
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _bind(self):
+        ''' bind the next free pair of the range
+        '''
+        while self.next_port + 1 <= self.end:
+            port = self.next_port
+            self.next_port += 2
+            try:
+                rtp = self._socket(port)
+            except OSError:
+                continue
+            try:
+                rtcp = self._socket(port + 1)
+            except OSError:
+                rtp.close()
+                continue
+            return PortPair(self, self.address, port, rtp, rtcp)
+        raise OSError(f'no free rtp ports in {self.start}-{self.end}')
+
+    def prebind(self, count):
+        ''' bind up to `count` pairs ahead of time
+        '''
+        with self.lock:
+            for _ in range(count):
+                try:
+                    self.free.append(self._bind())
+                except OSError as e:
+                    self.log.warning(f'prebinding stopped: {e}')
+                    break
+                PAIRS.labels('free').inc()
+        return len(self.free)
+
+    def acquire(self):
+        ''' take a pair for a new call
+        '''
+        with self.lock:
+            now = self.clock()
+            while self.quarantined and \
+                    self.quarantined[0].released + self.quarantine <= now:
+                pair = self.quarantined.popleft()
+                self._drain(pair)
+                self.free.append(pair)
+                PAIRS.labels('quarantined').dec()
+                PAIRS.labels('free').inc()
+            if self.free:
+                pair = self.free.popleft()
+                PAIRS.labels('free').dec()
+            else:
+                pair = self._bind()
+            self.used += 1
+            PAIRS.labels('used').inc()
+            if len(self.free) < self.reserve and self.refiller is None:
+                self.refiller = Thread(target=self._refill, daemon=True)
+                self.refiller.start()
+        return pair
+
+    def _refill(self):
+        ''' bind pairs until `reserve` are free
+        the lock is taken per pair, so acquire() is not held up for long
+        '''
+        thread = current_thread()
+        while True:
+            with self.lock:
+                # close() replaced or dropped this thread
+                if self.refiller is not thread:
+                    return
+                if len(self.free) >= self.reserve:
+                    self.refiller = None
+                    return
+                try:
+                    pair = self._bind()
+                except OSError as e:
+                    self.log.warning(f'refilling stopped: {e}')
+                    self.refiller = None
+                    return
+                self.free.append(pair)
+                PAIRS.labels('free').inc()
+
+    def release(self, pair):
+        ''' take back a pair, it is handed out again after the quarantine
+        '''
+        with self.lock:
+            pair.released = self.clock()
+            self.quarantined.append(pair)
+            self.used -= 1
+            PAIRS.labels('used').dec()
+            PAIRS.labels('quarantined').inc()
+
+    @staticmethod
+    def _drain(pair):
+        ''' drop datagrams which arrived for the previous call
+        '''
+        for sock in (pair.rtp, pair.rtcp):
+            # sockets handed to an event loop have to stay non-blocking
+            blocking = sock.getblocking()
+            sock.setblocking(False)
+            try:
+                while True:
+                    sock.recv(2048)
+            except OSError:
+                pass
+            finally:
+                sock.setblocking(blocking)
+
+    def close(self):
+        ''' close all pairs which are not in use
+        pairs bound later start at the beginning of the range again
+        '''
+        with self.lock:
+            refiller, self.refiller = self.refiller, None
+            for pair in self.free:
+                pair.close()
+            for pair in self.quarantined:
+                pair.close()
+            PAIRS.labels('free').dec(len(self.free))
+            PAIRS.labels('quarantined').dec(len(self.quarantined))
+            self.free.clear()
+            self.quarantined.clear()
+            self.next_port = self.start
+        if refiller is not None:
+            refiller.join()
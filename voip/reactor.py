@@ -0,0 +1,244 @@
+''' single threaded receiver for many datagram sockets
+
+the sip socket and the rtp and rtcp sockets of all calls are registered
+with one Reactor, which waits for all of them in one `selectors` call
+(epoll on linux). every ready socket is drained with `recvfrom_into` into
+one reusable buffer, so receiving costs no allocation per datagram. the
+handler of the socket gets a memoryview of the datagram and the sender's
+address, the view is only valid until the handler returns.
+
+handlers are plain callables, the dispatchers below route the datagrams of
+one socket further: DialogDispatcher by sip Call-ID, StreamDispatcher by
+rtp ssrc for sockets shared by several streams.
+'''
+import logging
+import selectors
+import socket
+import struct
+from threading import Lock, Thread
+
+from voip.sipparser import SIPView
+from voip.metrics import REGISTRY
+
+DATAGRAMS = REGISTRY.counter(
+    'reactor_datagrams_total', 'datagrams received by the reactor', ('kind',)
+    )
+READY = REGISTRY.histogram(
+    'reactor_ready_sockets', 'sockets ready per poll of the reactor',
+    buckets=(1, 2, 5, 10, 50, 100, 500, 1000, 5000)
+    )
+ERRORS = REGISTRY.counter(
+    'reactor_handler_errors_total', 'exceptions raised by reactor handlers'
+    )
+
+# sockets are drained without switching them to non-blocking mode, the
+# scheduler sends on the same sockets and expects them blocking
+_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
+SSRC = struct.Struct('!I')
+
+
+class Handle():
+    ''' a socket registered with the reactor
+    '''
+    __slots__ = ('sock', 'handler', 'kind', 'counter', 'received')
+
+    def __init__(self, sock, handler, kind):
+        self.sock = sock
+        self.handler = handler
+        self.kind = kind
+        self.counter = DATAGRAMS.labels(kind)
+        self.received = 0
+
+    def __repr__(self):
+        return f'Handle({self.kind} {self.sock.getsockname()} ' + \
+            f'received={self.received})'
+
+
+class Reactor():
+    ''' receives on any number of sockets from a single thread
+    every poll reads at most `burst` datagrams of up to `size` bytes from a
+    socket before the next ready socket gets its turn
+    '''
+    def __init__(self, size=2048, burst=64):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.selector = selectors.DefaultSelector()
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.burst = burst
+        self.handles = {}
+        self.lock = Lock()
+        self.thread = None
+        self.running = False
+        # wakes a blocked poll up on stop
+        self._wakeup, self._notify = socket.socketpair()
+        self._wakeup.setblocking(False)
+        self.selector.register(self._wakeup, selectors.EVENT_READ, None)
+
+    def __len__(self):
+        return len(self.handles)
+
+    def __contains__(self, sock):
+        return sock in self.handles
+
+    def register(self, sock, handler, kind='rtp'):
+        ''' call `handler(data, address)` for every datagram on `sock`
+        a socket registered again gets the new handler
+        '''
+        if _DONTWAIT == 0:
+            sock.setblocking(False)
+        with self.lock:
+            handle = Handle(sock, handler, kind)
+            if sock in self.handles:
+                self.selector.modify(sock, selectors.EVENT_READ, handle)
+            else:
+                self.selector.register(sock, selectors.EVENT_READ, handle)
+            self.handles[sock] = handle
+        return handle
+
+    def unregister(self, sock):
+        ''' stop receiving on `sock`, it is not closed
+        '''
+        with self.lock:
+            handle = self.handles.pop(sock, None)
+            if handle is not None:
+                try:
+                    self.selector.unregister(sock)
+                except (KeyError, ValueError):
+                    # closed before it was unregistered
+                    pass
+        return handle
+
+    def poll(self, timeout=None):
+        ''' wait up to `timeout` seconds for datagrams and dispatch them
+        returns the number of dispatched datagrams
+        '''
+        events = self.selector.select(timeout)
+        count = 0
+        ready = 0
+        for key, _ in events:
+            handle = key.data
+            if handle is None:
+                self._drain_wakeup()
+                continue
+            ready += 1
+            count += self._drain(handle)
+        if ready:
+            READY.observe(ready)
+        return count
+
+    def _drain(self, handle):
+        recv = handle.sock.recvfrom_into
+        view = self.view
+        size = len(self.buffer)
+        handler = handle.handler
+        count = 0
+        # errors count against the burst as well, a socket which keeps
+        # failing must not starve the others
+        for _ in range(self.burst):
+            try:
+                length, address = recv(self.buffer, size, _DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                # closed under the reactor or an icmp error of a former send
+                if handle.sock.fileno() < 0:
+                    self.unregister(handle.sock)
+                    break
+                self.log.debug(f'receiving on {handle} failed: {e}')
+                continue
+            count += 1
+            try:
+                handler(view[:length], address)
+            except Exception:
+                ERRORS.inc()
+                self.log.exception(f'handler of {handle}')
+        if count:
+            handle.received += count
+            handle.counter.inc(count)
+        return count
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup.recv(64):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def start(self):
+        ''' poll in a background thread
+        '''
+        self.running = True
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            self.poll(1.0)
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self._notify.send(b'\0')
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        ''' stop and unregister all sockets, the sockets are not closed
+        '''
+        self.stop()
+        for sock in list(self.handles):
+            self.unregister(sock)
+        self.selector.close()
+        self._wakeup.close()
+        self._notify.close()
+
+
+class DialogDispatcher():
+    ''' routes the sip messages of a socket by Call-ID
+    handlers get the parsed SIPView and the sender's address, messages of
+    unknown dialogs go to `default`
+    '''
+    def __init__(self, default=None):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.default = default
+        self.dialogs = {}
+
+    def add(self, call_id, handler):
+        self.dialogs[call_id] = handler
+
+    def remove(self, call_id):
+        self.dialogs.pop(call_id, None)
+
+    def __call__(self, data, address):
+        try:
+            # SIPView copies the datagram out of the reactor's buffer
+            msg = SIPView(data)
+        except ValueError as e:
+            self.log.warning(f'dropping invalid message from {address}: {e}')
+            return
+        handler = self.dialogs.get(msg.get('Call-ID'), self.default)
+        if handler is not None:
+            handler(msg, address)
+
+
+class StreamDispatcher():
+    ''' routes the rtp packets of a socket shared by several streams by
+    ssrc, packets of unknown streams go to `default`
+    '''
+    def __init__(self, default=None):
+        self.default = default
+        self.streams = {}
+
+    def add(self, ssrc, handler):
+        self.streams[ssrc] = handler
+
+    def remove(self, ssrc):
+        self.streams.pop(ssrc, None)
+
+    def __call__(self, data, address):
+        if len(data) < 12:
+            return
+        handler = self.streams.get(SSRC.unpack_from(data, 8)[0], self.default)
+        if handler is not None:
+            handler(data, address)
@@ -0,0 +1,296 @@
+''' inbound rtp and adaptive jitter buffer
+
+an RTPReceiver is the reactor handler of a call's rtp socket. it reads the
+header fields straight from the reactor's memoryview, checks the payload
+type and source and hands the payload on to a JitterBuffer.
+
+the jitter buffer keeps a fixed number of slots in one preallocated
+buffer, a packet goes to the slot of its extended sequence number modulo
+the capacity. this orders reordered packets without sorting, duplicates
+and packets which arrive after their playout are dropped. payloads are
+copied in on arrival and out on playout, no buffer is allocated per packet.
+
+playout waits until `target` packets are buffered. the target follows the
+interarrival jitter of rfc 3550 section 6.4.1 between `min_depth` and
+`max_depth`, a buffer running empty starts buffering again and one which
+holds more than `target + slack` packets skips a frame to catch up.
+'''
+import logging
+import struct
+import time
+from array import array
+from threading import Lock
+
+from voip.metrics import REGISTRY
+from voip.rtcp import ReceptionStats
+
+PACKETS = REGISTRY.counter(
+    'rtp_packets_received_total', 'received rtp packets by result',
+    ('result',)
+    )
+ACCEPTED = PACKETS.labels('accepted')
+DUPLICATE = PACKETS.labels('duplicate')
+LATE = PACKETS.labels('late')
+INVALID = PACKETS.labels('invalid')
+FOREIGN = PACKETS.labels('foreign')
+UNDERRUNS = REGISTRY.counter(
+    'rtp_jitter_underruns_total', 'jitter buffers which ran empty'
+    )
+LOST = REGISTRY.counter(
+    'rtp_packets_lost_total', 'packets missing at their playout'
+    )
+
+HEADER = struct.Struct('!BBHII')
+EXTENSION = struct.Struct('!HH')
+
+
+class JitterBuffer():
+    ''' reorders and delays the packets of one rtp stream
+    `capacity` is rounded up to a power of two, payloads of more than
+    `size` bytes are dropped. `samples` is the number of rtp timestamp
+    units of a frame, which scales the jitter to packets.
+    '''
+    def __init__(self,
+            capacity=64, size=640, samples=160, clockrate=8000,
+            min_depth=2, max_depth=None, slack=2):
+        self.capacity = 1 << max(1, capacity - 1).bit_length()
+        self.mask = self.capacity - 1
+        self.size = size
+        self.samples = samples
+        self.clockrate = clockrate
+        self.min_depth = min_depth
+        self.max_depth = max_depth if max_depth is not None \
+            else self.capacity // 2
+        self.slack = slack
+        self.buffer = bytearray(self.capacity * size)
+        self.view = memoryview(self.buffer)
+        # extended sequence number held by a slot, -1 if empty
+        self.sequences = array('q', [-1]) * self.capacity
+        self.lengths = array('I', [0]) * self.capacity
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        ''' forget all packets and the state of the stream
+        '''
+        for index in range(self.capacity):
+            self.sequences[index] = -1
+        self.highest = None
+        self.next = None
+        self.count = 0
+        self.playing = False
+        self.started = False
+        self.target = self.min_depth
+        # rfc 3550 interarrival jitter in timestamp units
+        self.jitter = 0.0
+        self.transit = None
+        self.received = 0
+        self.duplicates = 0
+        self.late = 0
+        self.lost = 0
+        self.skipped = 0
+        self.underruns = 0
+
+    def __len__(self):
+        return self.count
+
+    def extend(self, sequence):
+        ''' the extended sequence number of the 16 bit `sequence`
+        '''
+        if self.highest is None:
+            # a cycle up front keeps early reordered packets positive
+            return sequence + 0x10000
+        delta = (sequence - self.highest) & 0xffff
+        if delta < 0x8000:
+            return self.highest + delta
+        return self.highest - (0x10000 - delta)
+
+    def put(self, sequence, timestamp, data, start, end, arrival=None):
+        ''' add the payload `data[start:end]` of a packet
+        returns False if the packet was dropped
+        '''
+        length = end - start
+        if length > self.size:
+            INVALID.inc()
+            return False
+        arrival = time.monotonic() if arrival is None else arrival
+        with self.lock:
+            extended = self.extend(sequence)
+            if self.highest is None:
+                self.highest = self.next = extended
+            elif extended < self.next:
+                if self.started or self.highest - extended >= self.capacity:
+                    self.late += 1
+                    LATE.inc()
+                    return False
+                # reordered ahead of the first packet, before playout
+                self.next = extended
+            elif extended - self.next >= self.capacity:
+                if extended - self.highest >= self.capacity:
+                    # the sequence jumped, start over
+                    self._restart(extended)
+                else:
+                    self._advance(extended - self.capacity + 1)
+
+            index = extended & self.mask
+            if self.sequences[index] == extended:
+                self.duplicates += 1
+                DUPLICATE.inc()
+                return False
+            offset = index * self.size
+            self.buffer[offset:offset + length] = data[start:end]
+            self.lengths[index] = length
+            self.sequences[index] = extended
+            self.count += 1
+            self.received += 1
+            if extended > self.highest:
+                self.highest = extended
+            self._update_jitter(timestamp, arrival)
+        ACCEPTED.inc()
+        return True
+
+    def _restart(self, extended):
+        for index in range(self.capacity):
+            self.sequences[index] = -1
+        self.count = 0
+        self.playing = self.started = False
+        self.highest = self.next = extended
+        self.transit = None
+
+    def _advance(self, sequence):
+        ''' drop everything before `sequence` to make room
+        '''
+        while self.next < sequence:
+            index = self.next & self.mask
+            if self.sequences[index] == self.next:
+                self.sequences[index] = -1
+                self.count -= 1
+                self.skipped += 1
+            else:
+                self.lost += 1
+                LOST.inc()
+            self.next += 1
+
+    def _update_jitter(self, timestamp, arrival):
+        transit = int(arrival * self.clockrate) - timestamp
+        if self.transit is not None:
+            deviation = abs(transit - self.transit)
+            if deviation < 0x80000000:
+                self.jitter += (deviation - self.jitter) / 16
+        self.transit = transit
+        target = self.min_depth + round(2 * self.jitter / self.samples)
+        self.target = min(self.max_depth, target)
+
+    def pop_into(self, out):
+        ''' write the payload of the next frame into `out`
+        returns its length, 0 if the frame is missing or the buffer is
+        still filling up. call it once per frame duration.
+        '''
+        with self.lock:
+            if self.next is None:
+                return 0
+            depth = self.highest - self.next + 1
+            if not self.playing:
+                if self.count == 0 or depth < self.target:
+                    return 0
+                self.playing = self.started = True
+            elif depth > self.target + self.slack:
+                # too much delay built up, drop the oldest frame
+                self._advance(self.next + 1)
+
+            index = self.next & self.mask
+            length = 0
+            if self.sequences[index] == self.next:
+                length = self.lengths[index]
+                offset = index * self.size
+                out[:length] = self.view[offset:offset + length]
+                self.sequences[index] = -1
+                self.count -= 1
+            else:
+                self.lost += 1
+                LOST.inc()
+            self.next += 1
+            if self.count == 0 and self.highest < self.next:
+                self.playing = False
+                self.underruns += 1
+                UNDERRUNS.inc()
+            return length
+
+    @property
+    def jitter_ms(self):
+        return self.jitter * 1000 / self.clockrate
+
+    def __repr__(self):
+        return f'JitterBuffer(depth={self.count} target={self.target} ' + \
+            f'received={self.received} lost={self.lost} ' + \
+            f'late={self.late} duplicates={self.duplicates} ' + \
+            f'jitter={self.jitter_ms:.2f}ms)'
+
+
+class RTPReceiver():
+    ''' reactor handler for the rtp socket of a call
+    packets of other payload types than `payload_types` are ignored, the
+    first source seen is locked onto and a new ssrc restarts the buffer.
+    `callback` is called with the receiver after every accepted packet.
+    the rtcp reception statistics of the stream are kept in `stats`.
+    '''
+    def __init__(self, buffer=None, payload_types=None, callback=None,
+            clock=time.monotonic):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.buffer = buffer if buffer is not None else JitterBuffer()
+        self.payload_types = set(payload_types) \
+            if payload_types is not None else None
+        self.callback = callback
+        self.clock = clock
+        self.stats = ReceptionStats(self.buffer.clockrate)
+        self.ssrc = None
+        self.address = None
+        self.payload_type = None
+
+    def __call__(self, data, address):
+        size = len(data)
+        if size < HEADER.size:
+            INVALID.inc()
+            return
+        first, second, sequence, timestamp, ssrc = HEADER.unpack_from(data)
+        if first >> 6 != 2:
+            INVALID.inc()
+            return
+        payload_type = second & 0x7f
+        if self.payload_types is not None and \
+                payload_type not in self.payload_types:
+            # rtcp multiplexed on the port and events like rfc 4733
+            FOREIGN.inc()
+            return
+
+        start = HEADER.size + 4 * (first & 0x0f)
+        if first & 0x10:
+            if size < start + EXTENSION.size:
+                INVALID.inc()
+                return
+            start += EXTENSION.size + 4 * EXTENSION.unpack_from(data, start)[1]
+        end = size
+        if first & 0x20:
+            end -= data[size - 1]
+        if end < start:
+            INVALID.inc()
+            return
+
+        if ssrc != self.ssrc:
+            if self.ssrc is not None:
+                self.log.info(f'source changed from {self.ssrc:08x} to ' +
+                    f'{ssrc:08x}')
+                with self.buffer.lock:
+                    self.buffer.reset()
+            self.ssrc = ssrc
+            self.address = address
+            self.payload_type = payload_type
+        arrival = self.clock()
+        self.stats.update(ssrc, sequence, timestamp, arrival)
+        if self.buffer.put(
+                sequence, timestamp, data, start, end, arrival) and \
+                self.callback is not None:
+            self.callback(self)
+
+    def pop_into(self, out):
+        return self.buffer.pop_into(out)
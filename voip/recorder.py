@@ -0,0 +1,236 @@
+''' streaming call recording to wave files
+
+a CallRecorder takes one frame of decoded audio per packet interval for
+each leg of a call and writes it to a wave file while the call lasts. in
+stereo the inbound leg is the left and the outbound leg the right channel,
+in mono both legs are mixed. VoIPCall.record drives it from a timer with
+the jitter buffer of the call's receiver and the payloads its sender hands
+out.
+
+frames are collected in a fixed number of preallocated blocks. full blocks
+are handed to a background thread which writes them to disk, so a slow
+disk never stalls the thread handling the media. if the writer falls
+behind so far that no free block is left, the newest block is dropped,
+logged and counted, memory stays at `blocks * blocksize` bytes however
+long the call is. the wave header is written with a length of zero and
+patched on close.
+'''
+import logging
+import queue
+import sys
+import time
+import wave
+from array import array
+from threading import Thread
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from voip.metrics import REGISTRY
+
+RECORDINGS = REGISTRY.gauge('recordings_active', 'open call recordings')
+DROPPED = REGISTRY.counter(
+    'recording_blocks_dropped_total', 'blocks of recorded audio dropped '
+    'because the writer fell behind'
+    )
+WRITE_TIME = REGISTRY.histogram(
+    'recording_write_seconds', 'time to write a block of a recording',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.1)
+    )
+
+
+def mix(first, second):
+    ''' the sum of two buffers of signed 16 bit little endian pcm, clipped
+    '''
+    if numpy is not None:
+        total = numpy.frombuffer(first, dtype='<i2').astype(numpy.int32)
+        total += numpy.frombuffer(second, dtype='<i2')
+        return numpy.clip(total, -0x8000, 0x7fff).astype('<i2').tobytes()
+    left = array('h', bytes(first))
+    right = array('h', bytes(second))
+    if sys.byteorder != 'little':
+        left.byteswap()
+        right.byteswap()
+    for index, sample in enumerate(right):
+        left[index] = max(-0x8000, min(0x7fff, left[index] + sample))
+    if sys.byteorder != 'little':
+        left.byteswap()
+    return left.tobytes()
+
+
+class CallRecorder():
+    ''' records the legs of a call to the wave file `path`
+    audio is signed 16 bit little endian pcm at `rate` samples per second
+    '''
+    def __init__(self, path, stereo=True, rate=8000, blocks=16,
+            blocksize=16384):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        self.channels = 2 if stereo else 1
+        self.rate = rate
+        # blocks hold whole sample frames
+        blocksize -= blocksize % (2 * self.channels)
+        self.free = queue.SimpleQueue()
+        for _ in range(blocks - 1):
+            self.free.put(bytearray(blocksize))
+        self.full = queue.SimpleQueue()
+        self.block = bytearray(blocksize)
+        self.fill = 0
+        # interleaved frame and received payload, grown for larger frames
+        self.frame = bytearray(640 * self.channels)
+        self.payload = bytearray(640)
+        self.frames = 0
+        self.dropped = 0
+        self.error = None
+
+        self.wave = wave.open(path, 'wb')
+        self.wave.setnchannels(self.channels)
+        self.wave.setsampwidth(2)
+        self.wave.setframerate(rate)
+        self.thread = Thread(target=self._write, daemon=True)
+        self.thread.start()
+        self.closed = False
+        RECORDINGS.inc()
+
+    @property
+    def duration(self):
+        ''' seconds of audio recorded so far
+        '''
+        return self.frames / self.rate
+
+    def write(self, inbound=None, outbound=None, length=None):
+        ''' add one frame of both legs, a missing leg is silence
+        `length` in bytes per leg defaults to the longer leg, shorter legs
+        are padded with silence
+        '''
+        if self.closed:
+            raise ValueError('recording is closed')
+        if length is None:
+            length = max(
+                len(inbound) if inbound is not None else 0,
+                len(outbound) if outbound is not None else 0
+                )
+        length -= length % 2
+        if not length:
+            return
+        if self.channels == 1:
+            self._write_mono(inbound, outbound, length)
+        else:
+            self._write_stereo(inbound, outbound, length)
+        self.frames += length // 2
+
+    def _write_stereo(self, inbound, outbound, length):
+        size = 2 * length
+        if len(self.frame) < size:
+            self.frame = bytearray(size)
+        frame = self.frame
+        frame[:size] = bytes(size)
+        # every sample takes two bytes of one leg, the channels alternate
+        for leg, offset in ((inbound, 0), (outbound, 2)):
+            if leg is None:
+                continue
+            # a trailing half sample would not fill both bytes of a slot
+            leg = bytes(leg[:min(len(leg), length) & ~1])
+            end = 2 * len(leg)
+            frame[offset:end:4] = leg[0::2]
+            frame[offset + 1:end:4] = leg[1::2]
+        self._append(memoryview(frame)[:size])
+
+    def _write_mono(self, inbound, outbound, length):
+        legs = [bytes(leg[:min(len(leg), length) & ~1]).ljust(length, b'\0')
+            for leg in (inbound, outbound) if leg is not None]
+        if len(legs) == 2:
+            self._append(mix(*legs))
+        elif legs:
+            self._append(legs[0])
+        else:
+            self._append(bytes(length))
+
+    def _append(self, data):
+        position = 0
+        size = len(data)
+        while position < size:
+            count = min(size - position, len(self.block) - self.fill)
+            self.block[self.fill:self.fill + count] = \
+                data[position:position + count]
+            self.fill += count
+            position += count
+            if self.fill == len(self.block):
+                self._submit()
+
+    def _submit(self):
+        try:
+            block = self.free.get_nowait()
+        except queue.Empty:
+            # the writer is behind, keep the memory bounded
+            if not self.dropped:
+                self.log.warning(
+                    f'writer of {self.path} is behind, dropping audio'
+                    )
+            self.dropped += 1
+            DROPPED.inc()
+            self.fill = 0
+            return
+        self.full.put((self.block, self.fill))
+        self.block = block
+        self.fill = 0
+
+    def _write(self):
+        while True:
+            item = self.full.get()
+            if item is None:
+                break
+            block, fill = item
+            started = time.perf_counter()
+            try:
+                self.wave.writeframesraw(memoryview(block)[:fill])
+            except OSError as e:
+                if self.error is None:
+                    self.log.error(f'writing {self.path} failed: {e}')
+                self.error = e
+            WRITE_TIME.observe(time.perf_counter() - started)
+            self.free.put(block)
+
+    def tick(self, receiver, codec, outbound=None):
+        ''' record the next frame from the jitter buffer of `receiver`,
+        decoded with `codec`, and `outbound` as the other leg. called once
+        per packet interval of the call, see VoIPCall.record
+        '''
+        buffer = receiver.buffer
+        if len(self.payload) < buffer.size:
+            self.payload = bytearray(buffer.size)
+        length = buffer.pop_into(self.payload)
+        inbound = codec.decode(memoryview(self.payload)[:length]) \
+            if length else None
+        self.write(inbound, outbound, 2 * buffer.samples)
+
+    def close(self):
+        ''' write the rest, patch the wave header and close the file
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        if self.fill:
+            self.full.put((self.block, self.fill))
+        self.full.put(None)
+        self.thread.join()
+        try:
+            self.wave.close()
+        finally:
+            RECORDINGS.dec()
+        if self.dropped:
+            self.log.warning(
+                f'{self.dropped} blocks of {self.path} were dropped'
+                )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f'CallRecorder({self.path} {self.duration:.1f}s ' + \
+            f'dropped={self.dropped})'
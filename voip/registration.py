@@ -0,0 +1,198 @@
+''' registration of many accounts over one sip socket
+
+every account is an `AsyncVoIP` sharing the transport, timer wheel and
+credential cache of the manager. first registrations are spread at random
+over `spread` seconds, so adding thousands of accounts does not send
+thousands of REGISTERs at once. refreshes are scheduled at a random point
+between `refresh - jitter` and `refresh` of the granted expiry, so accounts
+registered at the same time drift apart instead of refreshing together.
+failed registrations are retried with exponential backoff. accounts can be
+added and removed at any time without touching the others.
+'''
+import asyncio
+import logging
+import random
+
+from voip.aio import open_transport
+from voip.auth import CredentialCache
+from voip.ports import PortPool
+from voip.voip import AsyncVoIP
+from voip.metrics import REGISTRY
+
+ACCOUNTS = REGISTRY.gauge(
+    'sip_accounts', 'managed accounts by registration state', ('state',)
+    )
+
+
+class Account():
+    ''' registration state of a single account
+    state is one of new, registering, registered, failed or removed
+    '''
+    def __init__(self, voip):
+        self.voip = voip
+        self.state = 'new'
+        self.failures = 0
+        self.error = None
+        # event loop time the registration expires at
+        self.expires = None
+        self.timer = None
+        self.task = None
+
+    @property
+    def user(self):
+        return self.voip.user
+
+    def __repr__(self):
+        return f'Account({self.user} {self.state} failures={self.failures})'
+
+
+class RegistrationManager():
+    ''' keeps any number of accounts registered at `server`
+    calls of all accounts take their media sockets from `ports`
+    '''
+    def __init__(self,
+            server, port=5060, local=('0.0.0.0', 5060), expires=3600,
+            refresh=0.8, jitter=0.1, backoff=2.0, max_backoff=300.0,
+            spread=10.0, callback=None, protocol=None, ports=None):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.server = server
+        self.port = port
+        self.local = local
+        self.expires = expires
+        self.refresh = refresh
+        self.jitter = jitter
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.spread = spread
+        self.callback = callback
+        self.protocol = protocol
+        self._own_protocol = protocol is None
+        self.credentials = CredentialCache()
+        self.ports = ports if ports is not None else PortPool()
+        self.accounts = {}
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def __iter__(self):
+        return iter(self.accounts)
+
+    def __contains__(self, user):
+        return user in self.accounts
+
+    def __getitem__(self, user):
+        return self.accounts[user]
+
+    async def open(self):
+        ''' bind the shared sip socket unless a protocol was given
+        '''
+        if self.protocol is None:
+            self.protocol = await open_transport(
+                self.server, self.port, self.local, self.callback
+                )
+
+    def add(self, user, password):
+        ''' add an account and register it within `spread` seconds
+        '''
+        if user in self.accounts:
+            raise ValueError(f'account {user} already exists')
+        if self.protocol is None:
+            raise RuntimeError('the manager is not open')
+        voip = AsyncVoIP(
+            self.server, user, password, self.port,
+            protocol=self.protocol, credentials=self.credentials,
+            ports=self.ports
+            )
+        account = Account(voip)
+        self.accounts[user] = account
+        ACCOUNTS.labels(account.state).inc()
+        self._schedule(account, random.uniform(0, self.spread))
+        return account
+
+    async def remove(self, user):
+        ''' stop refreshing an account and unregister it
+        '''
+        account = self.accounts.pop(user)
+        self._stop(account)
+        # a REGISTER in flight may have been accepted already
+        registered = account.state in ('registered', 'registering')
+        self._set_state(account, 'removed')
+        if registered:
+            try:
+                await account.voip.register(0)
+            except Exception as e:
+                self.log.warning(f'unregistering {user} failed: {e}')
+        return account
+
+    async def close(self):
+        ''' remove all accounts and close the socket if it is owned
+        '''
+        await asyncio.gather(*(self.remove(user) for user in list(self)))
+        if self._own_protocol and self.protocol is not None:
+            self.protocol.close()
+            self.protocol = None
+
+    def states(self):
+        ''' number of accounts in each state
+        '''
+        states = {}
+        for account in self.accounts.values():
+            states[account.state] = states.get(account.state, 0) + 1
+        return states
+
+    def _set_state(self, account, state):
+        ACCOUNTS.labels(account.state).dec()
+        account.state = state
+        if state != 'removed':
+            ACCOUNTS.labels(state).inc()
+
+    def _schedule(self, account, delay):
+        account.timer = self.protocol.wheel.call_later(
+            delay, self._register, account
+            )
+
+    def _stop(self, account):
+        if account.timer is not None:
+            account.timer.cancel()
+            account.timer = None
+        if account.task is not None:
+            account.task.cancel()
+            account.task = None
+
+    def _register(self, account):
+        ''' timer of an account fired
+        '''
+        account.timer = None
+        if account.state != 'registered':
+            self._set_state(account, 'registering')
+        account.task = asyncio.ensure_future(self._run(account))
+
+    async def _run(self, account):
+        loop = asyncio.get_running_loop()
+        try:
+            expires = await account.voip.register(self.expires)
+        except Exception as e:
+            account.failures += 1
+            account.error = e
+            delay = min(
+                self.backoff * 2 ** (account.failures - 1), self.max_backoff
+                )
+            delay *= random.uniform(0.5, 1.0)
+            self.log.warning(
+                f'registering {account.user} failed: {e}, '
+                f'retrying in {delay:.1f}s'
+                )
+            # an earlier registration stays valid until it expires
+            if account.expires is None or account.expires <= loop.time():
+                self._set_state(account, 'failed')
+        else:
+            account.failures = 0
+            account.error = None
+            account.expires = loop.time() + expires
+            self._set_state(account, 'registered')
+            delay = max(expires * random.uniform(
+                self.refresh - self.jitter, self.refresh
+                ), self.backoff)
+        account.task = None
+        if self.accounts.get(account.user) is account:
+            self._schedule(account, delay)
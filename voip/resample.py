@@ -0,0 +1,371 @@
+''' sample rate and channel conversion
+
+audio of any pcm wave format is mixed down to mono and resampled to the
+clock rate of a codec by a polyphase filter: the rate changes by the
+ratio `up / down` of the two rates, the windowed sinc low pass is split
+into `up` phases and every output sample is the dot product of one phase
+with the input samples before it. with numpy the outputs of a block are
+computed as one matrix product per phase, without it a plain python loop
+does the same much slower.
+
+converters keep the filter state between calls, so audio can be converted
+in chunks of any size for live playback as well as whole files offline:
+
+    python -m voip.resample prompts/*.wav --rate 8000 --output converted
+'''
+import argparse
+import logging
+import math
+import os
+import sys
+import wave
+from array import array
+
+try:
+    import numpy
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:
+    numpy = None
+
+
+def kaiser(length, beta):
+    ''' a kaiser window of `length` points
+    '''
+    if numpy is not None:
+        return numpy.kaiser(length, beta)
+
+    def bessel(x):
+        # series of the modified bessel function of order zero
+        total = term = 1.0
+        k = 1
+        while term > 1e-12 * total:
+            term *= (x / (2 * k)) ** 2
+            total += term
+            k += 1
+        return total
+    if length == 1:
+        return [1.0]
+    scale = bessel(beta)
+    return [
+        bessel(beta * math.sqrt(1 - (2 * n / (length - 1) - 1) ** 2)) / scale
+        for n in range(length)
+        ]
+
+
+def lowpass(up, down, zeros=8, rolloff=0.9, beta=8.0):
+    ''' the taps of the interpolation filter at `up` times the input rate
+    with `zeros` zero crossings on each side of the center
+    '''
+    factor = max(up, down)
+    center = zeros * factor
+    length = 2 * center + 1
+    window = kaiser(length, beta)
+    taps = []
+    for index in range(length):
+        x = rolloff * (index - center) / factor
+        sinc = 1.0 if x == 0 else math.sin(math.pi * x) / (math.pi * x)
+        taps.append(up * rolloff / factor * sinc * window[index])
+    return taps
+
+
+class Resampler():
+    ''' streaming polyphase resampler of mono float samples
+    '''
+    def __init__(self, rate, target, zeros=8):
+        divisor = math.gcd(rate, target)
+        self.rate = rate
+        self.target = target
+        self.up = target // divisor
+        self.down = rate // divisor
+        taps = lowpass(self.up, self.down, zeros)
+        # delay of the filter in samples at the upsampled rate
+        self.delay = (len(taps) - 1) // 2
+        self.width = -(-len(taps) // self.up)
+        taps += [0.0] * (self.width * self.up - len(taps))
+        # phase p holds taps p, p + up, ... reversed, so it lines up with
+        # the input samples in ascending order
+        self.phases = [
+            taps[phase::self.up][::-1] for phase in range(self.up)
+            ]
+        if numpy is not None:
+            self.phases = numpy.array(self.phases, dtype=numpy.float32)
+        self.reset()
+
+    def reset(self):
+        # the last `width` inputs, zeros before the start
+        if numpy is not None:
+            self.history = numpy.zeros(self.width, dtype=numpy.float32)
+        else:
+            self.history = [0.0] * self.width
+        self.consumed = 0
+        self.produced = 0
+
+    def process(self, samples):
+        ''' resample the next `samples` and return the outputs which are
+        complete so far
+        '''
+        self.consumed += len(samples)
+        up, down = self.up, self.down
+        end = (self.consumed * up - 1 - self.delay) // down + 1
+        first = self.produced
+        count = max(0, end - first)
+        if numpy is not None:
+            buffer = numpy.concatenate((
+                self.history, numpy.asarray(samples, dtype=numpy.float32)
+                ))
+            output = self._process_numpy(buffer, first, count)
+        else:
+            buffer = self.history + list(samples)
+            output = self._process_python(buffer, first, count)
+        self.history = buffer[len(buffer) - self.width:]
+        self.produced += count
+        return output
+
+    def _process_numpy(self, buffer, first, count):
+        output = numpy.empty(count, dtype=numpy.float32)
+        if not count:
+            return output
+        # windows[i] are the `width` inputs ending at buffer[i + width - 1]
+        windows = sliding_window_view(buffer, self.width)
+        origin = self.consumed - len(buffer) + self.width - 1
+        up, down = self.up, self.down
+        # outputs `up` apart share their phase and their inputs are
+        # `down` samples apart
+        for offset in range(min(up, count)):
+            t = (first + offset) * down + self.delay
+            index = t // up - origin
+            rows = (count - offset - 1) // up
+            output[offset::up] = \
+                windows[index:index + rows * down + 1:down] @ \
+                self.phases[t % up]
+        return output
+
+    def _process_python(self, buffer, first, count):
+        output = []
+        origin = self.consumed - len(buffer) + self.width - 1
+        width = self.width
+        for n in range(first, first + count):
+            t = n * self.down + self.delay
+            index = t // self.up - origin
+            window = buffer[index:index + width]
+            output.append(
+                sum(map(float.__mul__, self.phases[t % self.up], window))
+                )
+        return output
+
+    def flush(self):
+        ''' the outputs left in the filter at the end of the input
+        '''
+        total = -(-self.consumed * self.up // self.down)
+        remaining = total - self.produced
+        consumed = self.consumed
+        tail = -(-self.delay // self.up) + self.width
+        if numpy is not None:
+            output = self.process(numpy.zeros(tail, dtype=numpy.float32))
+        else:
+            output = self.process([0.0] * tail)
+        self.consumed = consumed
+        return output[:max(0, remaining)]
+
+
+class Converter():
+    ''' converts little endian pcm of `channels`, `rate` and `sampwidth` to
+    mono signed 16 bit little endian pcm at `target`
+    '''
+    def __init__(self, channels, rate, sampwidth=2, target=8000, zeros=8):
+        if sampwidth not in (1, 2):
+            raise ValueError(f'unsupported sample width {sampwidth}')
+        self.channels = channels
+        self.rate = rate
+        self.sampwidth = sampwidth
+        self.target = target
+        self.align = channels * sampwidth
+        self.rest = b''
+        self.resampler = Resampler(rate, target, zeros) \
+            if rate != target else None
+
+    def reset(self):
+        self.rest = b''
+        if self.resampler is not None:
+            self.resampler.reset()
+
+    def _samples(self, data):
+        ''' the mono samples of whole sample frames in `data`
+        '''
+        if numpy is not None:
+            if self.sampwidth == 1:
+                samples = numpy.frombuffer(data, dtype=numpy.uint8) \
+                    .astype(numpy.float32) - 128
+                samples *= 256
+            else:
+                samples = numpy.frombuffer(data, dtype='<i2') \
+                    .astype(numpy.float32)
+            if self.channels > 1:
+                samples = samples.reshape(-1, self.channels).mean(axis=1)
+            return samples
+
+        if self.sampwidth == 1:
+            values = [(value - 128) * 256 for value in data]
+        else:
+            values = array('h', data)
+            if sys.byteorder != 'little':
+                values.byteswap()
+        if self.channels == 1:
+            return [float(value) for value in values]
+        channels = self.channels
+        return [
+            sum(values[index:index + channels]) / channels
+            for index in range(0, len(values), channels)
+            ]
+
+    @staticmethod
+    def _pcm(samples):
+        if numpy is not None:
+            return numpy.clip(numpy.rint(samples), -0x8000, 0x7fff) \
+                .astype('<i2').tobytes()
+        values = array('h', (
+            max(-0x8000, min(0x7fff, round(sample))) for sample in samples
+            ))
+        if sys.byteorder != 'little':
+            values.byteswap()
+        return values.tobytes()
+
+    def convert(self, data):
+        ''' convert the next chunk, which may end within a sample frame
+        '''
+        data = self.rest + bytes(data)
+        usable = len(data) - len(data) % self.align
+        self.rest = data[usable:]
+        samples = self._samples(data[:usable])
+        if self.resampler is not None:
+            samples = self.resampler.process(samples)
+        return self._pcm(samples)
+
+    def flush(self):
+        ''' the rest of the converted audio at the end of the input
+        '''
+        self.rest = b''
+        if self.resampler is None:
+            return b''
+        return self._pcm(self.resampler.flush())
+
+
+def matches(source, rate):
+    ''' whether `source` already is mono 16 bit pcm at `rate`
+    '''
+    return source.rate == rate and source.channels == 1 and \
+        source.sampwidth == 2
+
+
+class ConvertedSource():
+    ''' a media source like WaveSource or Playlist converted to mono 16 bit
+    pcm at `rate` and cut into frames of `ptime` milliseconds
+    '''
+    def __init__(self, source, rate=8000, ptime=20):
+        self.source = source
+        self.rate = rate
+        self.ptime = ptime
+        self.channels = 1
+        self.sampwidth = 2
+        self.framesize = rate * ptime // 1000 * 2
+        self.converter = Converter(
+            source.channels, source.rate, source.sampwidth, rate
+            )
+        self.pending = bytearray()
+
+    @property
+    def duration(self):
+        return self.source.duration
+
+    def tell(self):
+        return self.source.tell()
+
+    def seek(self, seconds):
+        self.source.seek(seconds)
+        self.converter.reset()
+        self.pending.clear()
+
+    def __iter__(self):
+        return self.frames()
+
+    def frames(self):
+        size = self.framesize
+        for frame in self.source.frames():
+            self.pending += self.converter.convert(frame)
+            while len(self.pending) >= size:
+                yield bytes(self.pending[:size])
+                del self.pending[:size]
+        self.pending += self.converter.flush()
+        while self.pending:
+            frame = bytes(self.pending[:size]).ljust(size, b'\0')
+            del self.pending[:size]
+            yield frame
+
+    def encoded(self, codec):
+        for frame in self.frames():
+            yield codec.encode(frame, 2)
+
+    def close(self):
+        self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f'ConvertedSource({self.source} to {self.rate}Hz)'
+
+
+def read_converted(f, rate, chunk=1.0):
+    ''' yield the audio of the open wave file `f` converted to mono 16 bit
+    pcm at `rate` in chunks of `chunk` seconds
+    '''
+    converter = Converter(
+        f.getnchannels(), f.getframerate(), f.getsampwidth(), rate
+        )
+    frames = max(1, int(f.getframerate() * chunk))
+    while True:
+        data = f.readframes(frames)
+        if not data:
+            break
+        yield converter.convert(data)
+    yield converter.flush()
+
+
+def convert_file(source, target, rate=8000):
+    ''' write the wave file `source` converted to mono 16 bit pcm at
+    `rate` to `target`
+    '''
+    with wave.open(source, 'rb') as f, wave.open(target, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        for data in read_converted(f, rate):
+            out.writeframesraw(data)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description='convert wave files to mono 16 bit pcm'
+        )
+    parser.add_argument('source', nargs='+', help='wave files')
+    parser.add_argument('--rate', type=int, default=8000)
+    parser.add_argument('--output', default='.', help='output directory')
+    args = parser.parse_args(args)
+
+    if numpy is None:
+        logging.warning('numpy is not available, converting will be slow')
+    os.makedirs(args.output, exist_ok=True)
+    for source in args.source:
+        target = os.path.join(args.output, os.path.basename(source))
+        if os.path.abspath(target) == os.path.abspath(source):
+            raise SystemExit(f'{source} would be overwritten')
+        convert_file(source, target, args.rate)
+        print(target)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,491 @@
+''' rtcp sender and receiver reports (rfc 3550 section 6)
+
+every call sends reports on the rtcp port of its media pair, the rtp port
+plus one, to the rtcp port of the remote side. a report carries the
+reception statistics of the stream received from the remote side, and a
+sender report also counts the packets sent. reports of the remote side
+about our stream give the round trip time.
+
+reception statistics are kept incrementally as in appendix a.1, a.3 and
+a.8: every received packet updates the extended sequence number, the
+packet count and the interarrival jitter in constant time, the loss is
+derived from them when a report is built. reports are sent at randomized
+intervals scaled to the session bandwidth (section 6.3.1).
+
+at the end of a call `summary` sums up the quality of both directions.
+'''
+import logging
+import math
+import random
+import socket
+import struct
+import time
+
+from voip.metrics import REGISTRY
+
+REPORTS = REGISTRY.counter(
+    'rtcp_reports_total', 'rtcp packets by direction and type',
+    ('direction', 'type')
+    )
+RTT = REGISTRY.histogram(
+    'rtcp_rtt_seconds', 'mean round trip time of a call',
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.15, 0.2, 0.3, 0.5, 1.0)
+    )
+JITTER = REGISTRY.histogram(
+    'rtp_call_jitter_seconds', 'interarrival jitter at the end of a call',
+    ('direction',),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.02, 0.04, 0.08, 0.16)
+    )
+LOSS = REGISTRY.histogram(
+    'rtp_call_loss_ratio', 'lost packets of a call', ('direction',),
+    buckets=(0.0, 0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5)
+    )
+
+SR = 200
+RR = 201
+SDES = 202
+BYE = 203
+CNAME = 1
+
+HEADER = struct.Struct('!BBHI')
+SENDER_INFO = struct.Struct('!IIIII')
+REPORT_BLOCK = struct.Struct('!IIIIII')
+SSRC = struct.Struct('!I')
+
+# seconds from 1900 to 1970
+NTP_EPOCH = 2208988800
+# ip and udp headers counted in the average report size
+OVERHEAD = 28
+
+MAX_DROPOUT = 3000
+MAX_MISORDER = 100
+MIN_SEQUENTIAL = 2
+
+
+def ntp_time(now=None):
+    ''' the 64 bit ntp timestamp of the wall clock time `now`
+    '''
+    now = time.time() if now is None else now
+    seconds = int(now)
+    return (seconds + NTP_EPOCH) & 0xffffffff, \
+        int((now - seconds) * 0x100000000) & 0xffffffff
+
+
+def ntp_middle(now=None):
+    ''' the middle 32 bits of the ntp timestamp, as used for lsr and dlsr
+    '''
+    seconds, fraction = ntp_time(now)
+    return (seconds & 0xffff) << 16 | fraction >> 16
+
+
+class ReceptionStats():
+    ''' statistics of a received stream, updated in O(1) per packet
+    '''
+    __slots__ = (
+        'clockrate', 'ssrc', 'base_seq', 'max_seq', 'bad_seq', 'cycles',
+        'probation', 'received', 'expected_prior', 'received_prior',
+        'transit', 'jitter', 'last_sr', 'last_sr_time', 'duplicates',
+        )
+
+    def __init__(self, clockrate=8000):
+        self.clockrate = clockrate
+        self.ssrc = None
+        self.last_sr = 0
+        self.last_sr_time = None
+        self.reset(0)
+        self.probation = MIN_SEQUENTIAL
+
+    def reset(self, sequence):
+        self.base_seq = sequence
+        self.max_seq = sequence
+        self.bad_seq = 0x10001
+        self.cycles = 0
+        self.received = 0
+        self.expected_prior = 0
+        self.received_prior = 0
+        self.transit = None
+        self.jitter = 0.0
+        self.duplicates = 0
+        self.probation = 0
+
+    def update(self, ssrc, sequence, timestamp, arrival):
+        ''' account a packet which arrived at monotonic time `arrival`
+        returns False if it does not count as valid by appendix a.1
+        '''
+        if ssrc != self.ssrc:
+            self.ssrc = ssrc
+            self.reset(sequence)
+            self.max_seq = (sequence - 1) & 0xffff
+            self.probation = MIN_SEQUENTIAL
+        delta = (sequence - self.max_seq) & 0xffff
+        if self.probation:
+            # a new source needs sequential packets to be accepted
+            if sequence == (self.max_seq + 1) & 0xffff:
+                self.probation -= 1
+                self.max_seq = sequence
+                if self.probation == 0:
+                    self.reset(sequence)
+                    self.received += 1
+                    self._jitter(timestamp, arrival)
+                    return True
+            else:
+                self.probation = MIN_SEQUENTIAL - 1
+                self.max_seq = sequence
+            return False
+        elif delta == 0:
+            self.duplicates += 1
+            return False
+        elif delta < MAX_DROPOUT:
+            if sequence < self.max_seq:
+                self.cycles += 0x10000
+            self.max_seq = sequence
+        elif delta <= 0x10000 - MAX_MISORDER:
+            # a large jump, restart once the next packet follows it
+            if sequence == self.bad_seq:
+                self.reset(sequence)
+            else:
+                self.bad_seq = (sequence + 1) & 0xffff
+                return False
+        self.received += 1
+        self._jitter(timestamp, arrival)
+        return True
+
+    def _jitter(self, timestamp, arrival):
+        transit = int(arrival * self.clockrate) - timestamp
+        if self.transit is not None:
+            deviation = abs(transit - self.transit)
+            if deviation < 0x80000000:
+                self.jitter += (deviation - self.jitter) / 16
+        self.transit = transit
+
+    @property
+    def extended_max(self):
+        return self.cycles + self.max_seq
+
+    @property
+    def expected(self):
+        if self.ssrc is None or self.probation:
+            return 0
+        return self.extended_max - self.base_seq + 1
+
+    @property
+    def lost(self):
+        return self.expected - self.received
+
+    def report_block(self, buffer, offset, now=None):
+        ''' write a report block about this source and start the next
+        interval for the fraction lost
+        '''
+        expected = self.expected
+        interval = expected - self.expected_prior
+        received = self.received - self.received_prior
+        self.expected_prior = expected
+        self.received_prior = self.received
+        lost = interval - received
+        fraction = (lost << 8) // interval if interval > 0 and lost > 0 else 0
+        # cumulative loss is a signed 24 bit value
+        cumulative = max(-0x800000, min(0x7fffff, self.lost)) & 0xffffff
+        delay = 0
+        if self.last_sr_time is not None:
+            elapsed = (time.monotonic() if now is None else now) - \
+                self.last_sr_time
+            delay = int(elapsed * 65536) & 0xffffffff
+        REPORT_BLOCK.pack_into(
+            buffer, offset, self.ssrc,
+            min(fraction, 255) << 24 | cumulative,
+            self.extended_max & 0xffffffff, int(self.jitter),
+            self.last_sr, delay
+            )
+        return REPORT_BLOCK.size
+
+
+class ReportBlock():
+    ''' a parsed report block
+    '''
+    __slots__ = (
+        'ssrc', 'fraction_lost', 'lost', 'highest', 'jitter', 'lsr', 'dlsr'
+        )
+
+    def __init__(self, buffer, offset):
+        self.ssrc, loss, self.highest, self.jitter, self.lsr, self.dlsr = \
+            REPORT_BLOCK.unpack_from(buffer, offset)
+        self.fraction_lost = (loss >> 24) / 256
+        lost = loss & 0xffffff
+        self.lost = lost - 0x1000000 if lost & 0x800000 else lost
+
+    def __repr__(self):
+        return f'ReportBlock({self.ssrc:08x} lost={self.lost} ' + \
+            f'fraction={self.fraction_lost:.3f} jitter={self.jitter})'
+
+
+def parse(data):
+    ''' yield (type, ssrc, sender info or None, report blocks) for the
+    sender and receiver reports, and (type, ssrc, None, []) for the other
+    packets of a compound packet
+    '''
+    offset = 0
+    size = len(data)
+    while offset + HEADER.size <= size:
+        first, kind, length, ssrc = HEADER.unpack_from(data, offset)
+        if first >> 6 != 2:
+            raise ValueError('invalid rtcp version')
+        end = offset + 4 * (length + 1)
+        if end > size:
+            raise ValueError('truncated rtcp packet')
+        count = first & 0x1f
+        position = offset + HEADER.size
+        info = None
+        blocks = []
+        if kind == SR:
+            info = SENDER_INFO.unpack_from(data, position)
+            position += SENDER_INFO.size
+        if kind in (SR, RR):
+            for _ in range(count):
+                if position + REPORT_BLOCK.size > end:
+                    raise ValueError('truncated report block')
+                blocks.append(ReportBlock(data, position))
+                position += REPORT_BLOCK.size
+        yield kind, ssrc, info, blocks
+        offset = end
+
+
+def interval(members, senders, bandwidth, we_sent, average, initial=False):
+    ''' seconds to the next report by rfc 3550 section 6.3.1
+    `bandwidth` is the rtcp share of the session in bytes per second
+    '''
+    minimum = 2.5 if initial else 5.0
+    count = members
+    if senders <= members * 0.25:
+        if we_sent:
+            bandwidth *= 0.25
+            count = senders
+        else:
+            bandwidth *= 0.75
+            count = members - senders
+    deterministic = max(average * count / bandwidth, minimum)
+    # compensation for the timer reconsideration of the rfc
+    return deterministic * random.uniform(0.5, 1.5) / (math.e - 1.5)
+
+
+class RTCPSession():
+    ''' rtcp of one call, sent from `sock` to `address`
+    `receiver` is the RTPReceiver of the call, `packetizer` the
+    RTPPacketizer of its outbound stream, either may be None. `bandwidth`
+    is the session bandwidth in bits per second, 5% of it go to rtcp.
+    '''
+    def __init__(self, sock, address, ssrc, cname, receiver=None,
+            packetizer=None, bandwidth=80000, clock=time.monotonic):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.sock = sock
+        self.address = address
+        self.ssrc = ssrc
+        self.cname = cname.encode('utf8')[:255]
+        self.receiver = receiver
+        self.packetizer = packetizer
+        self.bandwidth = bandwidth * 0.05 / 8
+        self.clock = clock
+        self.average = 100.0
+        self.initial = True
+        self.timer = None
+        self.wheel = None
+        self.buffer = bytearray(1500)
+        # sent packets counted at the last report
+        self.last_sent = 0
+        self.sent_reports = 0
+        self.received_reports = 0
+        self.remote_ssrc = None
+        self.rtts = 0
+        self.rtt = None
+        self.rtt_total = 0.0
+        self.rtt_max = 0.0
+        # the last report of the remote side about our stream
+        self.remote = None
+
+    @property
+    def stats(self):
+        return self.receiver.stats if self.receiver is not None else None
+
+    def start(self, wheel):
+        ''' send reports from timers on `wheel`
+        '''
+        self.wheel = wheel
+        self._schedule()
+
+    def _schedule(self):
+        senders = 1 if self._sending() else 0
+        if self.stats is not None and self.stats.received:
+            senders += 1
+        delay = interval(
+            2, senders, self.bandwidth, self._sending(), self.average,
+            self.initial
+            )
+        self.initial = False
+        self.timer = self.wheel.call_later(delay, self._tick)
+
+    def _tick(self):
+        try:
+            self.send_report()
+        except OSError as e:
+            self.log.warning(f'sending rtcp to {self.address} failed: {e}')
+        self._schedule()
+
+    def _sending(self):
+        return self.packetizer is not None and \
+            self.packetizer.sent_packets > self.last_sent
+
+    def build(self, bye=False):
+        ''' a compound packet with a sender or receiver report, the cname
+        and a bye if `bye`, as memoryview of the reused buffer
+        '''
+        buffer = self.buffer
+        stats = self.stats
+        blocks = 1 if stats is not None and stats.expected else 0
+        position = HEADER.size
+        if self._sending():
+            kind = SR
+            packetizer = self.packetizer
+            # the rtp timestamp of the same instant as the ntp time, not
+            # the one of the next packet (rfc 3550 6.4.1)
+            timestamp = packetizer.timestamp_at(packetizer.clock())
+            seconds, fraction = ntp_time()
+            SENDER_INFO.pack_into(
+                buffer, position, seconds, fraction, timestamp,
+                packetizer.sent_packets & 0xffffffff,
+                packetizer.sent_octets & 0xffffffff
+                )
+            position += SENDER_INFO.size
+            self.last_sent = packetizer.sent_packets
+        else:
+            kind = RR
+        if blocks:
+            position += stats.report_block(buffer, position, self.clock())
+        HEADER.pack_into(
+            buffer, 0, 0x80 | blocks, kind, position // 4 - 1, self.ssrc
+            )
+
+        # sdes with the cname, padded with zeros to a 32 bit boundary
+        start = position
+        length = 4 + 2 + len(self.cname) + 1
+        length += -length % 4
+        item = position + HEADER.size
+        buffer[item:item + 2] = bytes((CNAME, len(self.cname)))
+        buffer[item + 2:item + 2 + len(self.cname)] = self.cname
+        end = start + 4 + length
+        buffer[item + 2 + len(self.cname):end] = \
+            bytes(end - item - 2 - len(self.cname))
+        HEADER.pack_into(buffer, start, 0x81, SDES, length // 4, self.ssrc)
+        position = end
+
+        if bye:
+            HEADER.pack_into(buffer, position, 0x81, BYE, 1, self.ssrc)
+            position += HEADER.size
+        self.average += (position + OVERHEAD - self.average) / 16
+        REPORTS.labels('sent', 'sr' if kind == SR else 'rr').inc()
+        return memoryview(buffer)[:position]
+
+    def send_report(self, bye=False):
+        self.sock.sendto(self.build(bye), self.address)
+        self.sent_reports += 1
+
+    def __call__(self, data, address):
+        ''' reactor handler of the rtcp socket
+        '''
+        now = self.clock()
+        try:
+            for kind, ssrc, info, blocks in parse(data):
+                self._received(kind, ssrc, info, blocks, now)
+        except (ValueError, struct.error) as e:
+            REPORTS.labels('received', 'invalid').inc()
+            self.log.debug(f'invalid rtcp from {address}: {e}')
+
+    def _received(self, kind, ssrc, info, blocks, now):
+        if kind == SR:
+            REPORTS.labels('received', 'sr').inc()
+            stats = self.stats
+            if stats is not None:
+                seconds, fraction = info[0], info[1]
+                stats.last_sr = (seconds & 0xffff) << 16 | fraction >> 16
+                stats.last_sr_time = now
+        elif kind == RR:
+            REPORTS.labels('received', 'rr').inc()
+        elif kind == BYE:
+            REPORTS.labels('received', 'bye').inc()
+            return
+        else:
+            return
+        self.received_reports += 1
+        self.remote_ssrc = ssrc
+        for block in blocks:
+            if block.ssrc != self.ssrc:
+                continue
+            self.remote = block
+            if block.lsr:
+                rtt = ((ntp_middle() - block.lsr - block.dlsr)
+                    & 0xffffffff) / 65536
+                # a clock step of the remote side makes it meaningless
+                if rtt < 60:
+                    self.rtt = rtt
+                    self.rtts += 1
+                    self.rtt_total += rtt
+                    self.rtt_max = max(self.rtt_max, rtt)
+
+    def stop(self, bye=True):
+        ''' stop sending reports, a last one is sent with a bye
+        '''
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if bye:
+            try:
+                self.send_report(bye=True)
+            except OSError as e:
+                self.log.debug(f'sending rtcp bye failed: {e}')
+
+    def summary(self):
+        ''' the quality of the call in both directions as dictionary
+        '''
+        stats = self.stats
+        clockrate = stats.clockrate if stats is not None else 8000
+        summary = {
+            'received': stats.received if stats is not None else 0,
+            'lost': max(0, stats.lost) if stats is not None else 0,
+            'loss': 0.0,
+            'jitter': stats.jitter / clockrate if stats is not None else 0.0,
+            'sent': self.packetizer.sent_packets
+                if self.packetizer is not None else 0,
+            'remote_lost': None,
+            'remote_loss': None,
+            'remote_jitter': None,
+            'rtt': self.rtt_total / self.rtts if self.rtts else None,
+            'rtt_max': self.rtt_max if self.rtts else None,
+            'reports_sent': self.sent_reports,
+            'reports_received': self.received_reports,
+            }
+        if stats is not None and stats.expected > 0:
+            summary['loss'] = summary['lost'] / stats.expected
+        if self.remote is not None:
+            summary['remote_lost'] = max(0, self.remote.lost)
+            summary['remote_jitter'] = self.remote.jitter / clockrate
+            if summary['sent']:
+                summary['remote_loss'] = summary['remote_lost'] / \
+                    summary['sent']
+        return summary
+
+    def observe(self, summary):
+        ''' record a summary in the metrics
+        '''
+        if summary['received']:
+            JITTER.labels('inbound').observe(summary['jitter'])
+            LOSS.labels('inbound').observe(summary['loss'])
+        if summary['remote_jitter'] is not None:
+            JITTER.labels('outbound').observe(summary['remote_jitter'])
+        if summary['remote_loss'] is not None:
+            LOSS.labels('outbound').observe(summary['remote_loss'])
+        if summary['rtt'] is not None:
+            RTT.observe(summary['rtt'])
+
+
+def cname(user, address=None):
+    ''' a canonical name as user@host
+    '''
+    return f'{user}@{address or socket.gethostname()}'
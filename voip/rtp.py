@@ -1,92 +1,449 @@
-import ctypes
+import logging
+import random
 import struct
+import time
+
+from voip.metrics import REGISTRY
+
+RTP_SENT = REGISTRY.counter('rtp_packets_sent_total', 'sent rtp packets')
+RTP_RESYNCS = REGISTRY.counter(
+    'rtp_pacing_resyncs_total', 'pacing deadlines given up as too late'
+    )
+RTP_LATENESS = REGISTRY.histogram(
+    'rtp_pacing_lateness_seconds', 'time packets left after their deadline',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.05)
+    )
 
 class RTPMessage():
+    ''' rtp header as described in rfc 3550
+    the header is kept as plain fields and packed with precompiled structs
+    in network byte order. csrc is a list of contributing sources, an
+    extension is given as `extension_profile` and `extension` bytes whose
+    length must be a multiple of four.
+    '''
+    HEADER = struct.Struct('!BBHII')
+    EXTENSION = struct.Struct('!HH')
+    WORD = struct.Struct('!I')
 
+    __slots__ = (
+        'version', 'padding', 'marker', 'payload_type', 'sequence_number',
+        'timestamp', 'ssrc', 'csrc', 'extension_profile', 'extension',
+        )
 
     def __init__(self, **kwargs):
-        self.mask = int(kwargs.get('mask', 0))
+        self.version = int(kwargs.get('version', 2))
+        self.padding = int(kwargs.get('padding', 0))
+        self.marker = int(kwargs.get('marker', 0))
+        self.payload_type = int(kwargs.get('payload_type', 0))
+        self.sequence_number = int(kwargs.get('sequence_number', 0))
         self.timestamp = int(kwargs.get('timestamp', 0))
         self.ssrc = int(kwargs.get('ssrc', 0))
-        self.csrc = int(kwargs.get('csrc', 0))
-        self.extension = int(kwargs.get('extension', 0))
+        self.csrc = list(kwargs.get('csrc', ()))
+        self.extension_profile = int(kwargs.get('extension_profile', 0))
+        self.extension = kwargs.get('extension')
 
         if 'values' in kwargs:
-            values = kwargs.get('values')
-            assert(isinstance(values, bytes))
-            assert(len(values) == 20)
-            self.mask, self.timestamp, self.ssrc, self.csrc, \
-            self.extension  = struct.unpack('IIIII', values)
+            self.unpack_from(kwargs.get('values'))
 
+    @staticmethod
     def from_bytes(values):
-        return RTPMessage(values=values)
+        msg = RTPMessage.__new__(RTPMessage)
+        msg.unpack_from(values)
+        return msg
 
-    def to_bytes(self):
-        return struct.pack(
-            'IIIII',
-            self.mask, self.timestamp,
-            self.ssrc, self.csrc,
-            self.extension
-            )
+    def unpack_from(self, buffer, offset=0):
+        ''' read the header from `buffer` and return the payload offset
+        '''
+        first, second, self.sequence_number, self.timestamp, self.ssrc = \
+            self.HEADER.unpack_from(buffer, offset)
+        self.version = first >> 6
+        self.padding = (first >> 5) & 0x01
+        self.marker = second >> 7
+        self.payload_type = second & 0x7f
+        position = offset + self.HEADER.size
 
-    @property
-    def version(self):
-        return (self.mask >> 30) & 0x0003
+        count = first & 0x0f
+        if count:
+            self.csrc = list(struct.unpack_from(f'!{count}I', buffer, position))
+            position += 4 * count
+        else:
+            self.csrc = []
 
-    @version.setter
-    def version(self, value):
-        version = (value & 0x0003) << 30 | (self.mask & 0x3fffffff)
-        self.mask = version
+        if first & 0x10:
+            self.extension_profile, length = \
+                self.EXTENSION.unpack_from(buffer, position)
+            position += self.EXTENSION.size
+            self.extension = bytes(buffer[position:position + 4 * length])
+            if len(self.extension) != 4 * length:
+                raise ValueError('rtp header extension is truncated')
+            position += 4 * length
+        else:
+            self.extension_profile = 0
+            self.extension = None
+        return position
 
     @property
-    def padding(self):
-        return (self.mask >> 29) & 0x0001
+    def size(self):
+        ''' size of the packed header in bytes
+        '''
+        size = self.HEADER.size + 4 * len(self.csrc)
+        if self.extension is not None:
+            size += self.EXTENSION.size + len(self.extension)
+        return size
+
+    def _first_bytes(self):
+        first = (self.version & 0x03) << 6 | (self.padding & 0x01) << 5 \
+            | len(self.csrc) & 0x0f
+        if self.extension is not None:
+            first |= 0x10
+        second = (self.marker & 0x01) << 7 | self.payload_type & 0x7f
+        return first, second
+
+    def pack_into(self, buffer, offset=0):
+        ''' write the header into a preallocated `buffer` at `offset`
+        returns the number of bytes written
+        '''
+        if not self.csrc and self.extension is None:
+            # fast path for the common plain header, the bound method of
+            # the module saves the lookups through the class
+            _pack_header(
+                buffer, offset,
+                (self.version & 0x03) << 6 | (self.padding & 0x01) << 5,
+                (self.marker & 0x01) << 7 | self.payload_type & 0x7f,
+                self.sequence_number & 0xffff,
+                self.timestamp & 0xffffffff,
+                self.ssrc
+                )
+            return self.HEADER.size
+
+        first, second = self._first_bytes()
+        self.HEADER.pack_into(
+            buffer, offset, first, second,
+            self.sequence_number & 0xffff,
+            self.timestamp & 0xffffffff,
+            self.ssrc
+            )
+        position = offset + self.HEADER.size
+        for csrc in self.csrc:
+            self.WORD.pack_into(buffer, position, csrc)
+            position += 4
+        if self.extension is not None:
+            if len(self.extension) % 4:
+                raise ValueError('rtp header extension must be 32 bit aligned')
+            self.EXTENSION.pack_into(
+                buffer, position,
+                self.extension_profile, len(self.extension) // 4
+                )
+            position += self.EXTENSION.size
+            buffer[position:position + len(self.extension)] = self.extension
+            position += len(self.extension)
+        return position - offset
+
+    def pack_many(self, buffer, count, timestep, stride=None, offset=0):
+        ''' write `count` consecutive headers into `buffer`, each `stride`
+        bytes apart. sequence number and timestamp are incremented per
+        header, the marker bit is only kept on the first one. afterwards the
+        message holds the values for the next header.
+        '''
+        size = self.size
+        stride = size if stride is None else stride
+        if offset + stride * (count - 1) + size > len(buffer):
+            raise ValueError('buffer too small for batch')
+        # csrc and extension are equal for every header, so pack them once
+        tail = self.to_bytes()[self.HEADER.size:] \
+            if self.csrc or self.extension is not None else None
+        first, second = self._first_bytes()
+        sequence = self.sequence_number & 0xffff
+        timestamp = self.timestamp & 0xffffffff
+        pack = self.HEADER.pack_into
+        position = offset
+        for _ in range(count):
+            pack(buffer, position, first, second, sequence, timestamp, self.ssrc)
+            if tail:
+                buffer[position + self.HEADER.size:position + size] = tail
+            second &= 0x7f
+            sequence = (sequence + 1) & 0xffff
+            timestamp = (timestamp + timestep) & 0xffffffff
+            position += stride
+        self.marker = 0
+        self.sequence_number = sequence
+        self.timestamp = timestamp
+        return count
+
+    def to_bytes(self):
+        ''' create the wire header in network byte order
+        '''
+        buffer = bytearray(self.size)
+        self.pack_into(buffer)
+        return bytes(buffer)
 
-    @padding.setter
-    def padding(self, value):
-        pad = (value & 0x0001) << 29 | (self.mask & 0xdfffffff)
-        self.mask = pad
     @property
     def has_extension(self):
-        return (self.mask >> 28) & 0x0001
-
-    @has_extension.setter
-    def has_extension(self, value):
-        ext = (value & 0x0001) << 28 | (self.mask & 0xefffffff)
-        self.mask = ext
+        return 0 if self.extension is None else 1
 
     @property
     def csrc_count(self):
-        return (self.mask >> 24) & 0x000f
+        return len(self.csrc)
+
+    @property
+    def mask(self):
+        ''' the first header word as one integer
+        '''
+        first, second = self._first_bytes()
+        return first << 24 | second << 16 | self.sequence_number & 0xffff
+
+
+_pack_header = RTPMessage.HEADER.pack_into
+
 
-    @csrc_count.setter
-    def csrc_count(self, value):
-        csrc = (value & 0x000f) << 24 | (self.mask & 0xf0ffffff)
-        self.mask = csrc
+class PacingStats():
+    ''' statistics about how punctual packets left the host
+    '''
+    def __init__(self, late_threshold=0.005):
+        self.late_threshold = late_threshold
+        self.sent = 0
+        self.late = 0
+        self.resyncs = 0
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+
+    def add(self, lateness):
+        ''' account a single packet which was sent `lateness` seconds after
+        its deadline
+        '''
+        self.sent += 1
+        RTP_SENT.inc()
+        RTP_LATENESS.observe(lateness)
+        if lateness > 0:
+            self.total_lateness += lateness
+            if lateness > self.max_lateness:
+                self.max_lateness = lateness
+            if lateness > self.late_threshold:
+                self.late += 1
 
     @property
-    def marker(self):
-        return (self.mask >> 23) & 0x0001
+    def mean_lateness(self):
+        return self.total_lateness / self.sent if self.sent else 0.0
+
+    def __repr__(self):
+        return f'sent={self.sent} late={self.late} resyncs={self.resyncs} ' + \
+            f'mean={self.mean_lateness * 1000:.3f}ms ' + \
+            f'max={self.max_lateness * 1000:.3f}ms'
+
 
-    @marker.setter
-    def marker(self, value):
-        marker = (value & 0x0001) << 23 | (self.mask & 0xffefffff)
-        self.mask = marker
+class RTPPacketizer():
+    ''' cuts an encoded payload into frames of `ptime` milliseconds and
+    stamps every frame with an rtp header
+    '''
+    PTIMES = (10, 20, 30, 60)
+    # frames packed at once by `packets`
+    CHUNK = 50
+
+    def __init__(
+            self,
+            payload_type=0,
+            clockrate=8000,
+            ptime=20,
+            sampwidth=1,
+            ssrc=None,
+            clock=time.monotonic
+            ):
+        if ptime not in self.PTIMES:
+            raise ValueError(f'ptime must be one of {self.PTIMES}')
+        self.payload_type = payload_type
+        self.clockrate = clockrate
+        self.ptime = ptime
+        self.sampwidth = sampwidth
+        # random start values as recommended in rfc 3550
+        self.message = RTPMessage(
+            payload_type=payload_type,
+            sequence_number=random.getrandbits(16),
+            timestamp=random.getrandbits(32),
+            ssrc=ssrc if ssrc is not None else random.getrandbits(32),
+            )
+        # counted as packets are handed out, for rtcp sender reports
+        self.sent_packets = 0
+        self.sent_octets = 0
+        # rtp timestamp and `clock` time of the last packet handed out
+        self.clock = clock
+        self.sent_timestamp = None
+        self.sent_at = None
+        # called with the payload of every packet handed out, e.g. to
+        # record the outbound leg of a call
+        self.monitor = None
 
     @property
-    def payload_type(self):
-        return (self.mask >> 16) & 0x007f
+    def ssrc(self):
+        return self.message.ssrc
 
-    @payload_type.setter
-    def payload_type(self, value):
-        pt = (value & 0x007f) << 16 | (self.mask & 0xff8fffff)
-        self. mask = pt
+    @property
+    def samples(self):
+        ''' samples per frame
+        '''
+        return self.clockrate * self.ptime // 1000
 
     @property
-    def sequence_number(self):
-        return (self.mask & 0x0000ffff)
+    def framesize(self):
+        ''' payload bytes per frame
+        '''
+        return self.samples * self.sampwidth
+
+    def timestamp_at(self, now):
+        ''' the rtp timestamp of the `clock` time `now`, extrapolated from
+        the last packet handed out as sender reports require
+        '''
+        if self.sent_at is None:
+            return self.message.timestamp & 0xffffffff
+        elapsed = round((now - self.sent_at) * self.clockrate)
+        return (self.sent_timestamp + elapsed) & 0xffffffff
+
+    def packets(self, data):
+        ''' yield complete rtp packets for `data`
+        the packets of every `CHUNK` frames are built in one buffer and
+        handed out as memoryview slices of it, so memory does not grow with
+        the length of `data`. the first packet carries the marker bit, the
+        last frame is padded with the payload's last byte to keep the frame
+        size constant.
+        '''
+        size = self.framesize
+        samples = self.samples
+        clock = self.clock
+        message = self.message
+        header = message.size
+        stride = header + size
+        data = memoryview(data).cast('B')
+        message.marker = 1
+        for start in range(0, len(data), size * self.CHUNK):
+            chunk = data[start:start + size * self.CHUNK]
+            count = -(-len(chunk) // size)
+            buffer = bytearray(stride * count)
+            timestamp = message.timestamp
+            message.pack_many(buffer, count, samples, stride)
+
+            position = header
+            for index in range(0, len(chunk), size):
+                payload = chunk[index:index + size]
+                buffer[position:position + len(payload)] = payload
+                if len(payload) < size:
+                    fill = bytes(payload[-1:]) * (size - len(payload))
+                    buffer[position + len(payload):position + size] = fill
+                position += stride
+
+            view = memoryview(buffer)
+            for position in range(0, len(buffer), stride):
+                self.sent_packets += 1
+                self.sent_octets += size
+                self.sent_timestamp = timestamp
+                self.sent_at = clock()
+                timestamp = (timestamp + samples) & 0xffffffff
+                if self.monitor is not None:
+                    self.monitor(view[position + header:position + stride])
+                yield view[position:position + stride]
+
+    def frames(self, frames):
+        ''' yield (header, payload) pairs for payloads which are already cut
+        into frames. the header buffer is reused, so every pair has to be
+        sent before the next one is requested.
+        '''
+        message = self.message
+        header = bytearray(message.size)
+        message.marker = 1
+        # csrc and extension are packed once, per packet only the fields
+        # which change
+        message.pack_into(header)
+        first, second = message._first_bytes()
+        message.marker = 0
+        pack = message.HEADER.pack_into
+        ssrc = message.ssrc
+        samples = self.samples
+        for payload in frames:
+            sequence = message.sequence_number & 0xffff
+            timestamp = message.timestamp & 0xffffffff
+            pack(header, 0, first, second, sequence, timestamp, ssrc)
+            second &= 0x7f
+            message.sequence_number = (sequence + 1) & 0xffff
+            message.timestamp = (timestamp + samples) & 0xffffffff
+            self.sent_timestamp = timestamp
+            self.sent_at = self.clock()
+            self.sent_packets += 1
+            self.sent_octets += len(payload)
+            if self.monitor is not None:
+                self.monitor(payload)
+            yield header, payload
+
+
+class RTPSender():
+    ''' sends packets from a packetizer on a monotonic clock schedule
+    every packet has an absolute deadline derived from the start time, so
+    sleep inaccuracies do not add up. if sending falls behind more than
+    `resync` packets, the schedule is restarted instead of bursting.
+    '''
+    def __init__(self, client, packetizer, resync=5, late_threshold=0.005):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.client = client
+        self.packetizer = packetizer
+        self.resync = resync
+        self.stats = PacingStats(late_threshold)
+
+    def send(self, data):
+        ''' send `data` in real time and return the pacing statistics
+        '''
+        return self.pace(self.packetizer.packets(data), self.client.write)
+
+    def send_frames(self, frames):
+        ''' send already framed payloads in real time without copying them
+        '''
+        return self.pace(self.packetizer.frames(frames), self.client.writev)
+
+    def start(self, wheel, packets, send, done=None):
+        ''' like `pace`, but without blocking. every packet is sent from a
+        timer on `wheel`, `done` is called with the statistics at the end
+        '''
+        interval = self.packetizer.ptime / 1000
+        packets = iter(packets)
+
+        def tick(deadline):
+            packet = next(packets, None)
+            if packet is None:
+                self.log.debug(f'pacing {self.stats}')
+                if done is not None:
+                    done(self.stats)
+                return
+            send(packet)
+            lateness = wheel.clock() - deadline
+            self.stats.add(lateness)
+            deadline += interval
+            if lateness > self.resync * interval:
+                self.log.warning(f'sender {lateness:.3f}s late, resyncing')
+                self.stats.resyncs += 1
+                RTP_RESYNCS.inc()
+                deadline = wheel.clock() + interval
+            wheel.call_at(deadline, tick, deadline)
 
-    @sequence_number.setter
-    def sequence_number(self, value):
-        self.mask = (value & 0xffff) | (self.mask & 0xffff0000)
+        start = wheel.next_tick()
+        wheel.call_at(start, tick, start)
 
+    def pace(self, packets, send):
+        ''' hand every item of `packets` to `send` at its deadline
+        '''
+        interval = self.packetizer.ptime / 1000
+        clock = time.monotonic
+        start = clock()
+        index = 0
+        for packet in packets:
+            deadline = start + index * interval
+            delay = deadline - clock()
+            if delay > 0:
+                time.sleep(delay)
+            send(packet)
+            lateness = clock() - deadline
+            self.stats.add(lateness)
+            if lateness > self.resync * interval:
+                self.log.warning(f'sender {lateness:.3f}s late, resyncing')
+                self.stats.resyncs += 1
+                RTP_RESYNCS.inc()
+                start = clock()
+                index = 0
+            index += 1
+        self.log.debug(f'pacing {self.stats}')
+        return self.stats
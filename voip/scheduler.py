@@ -0,0 +1,408 @@
+''' single threaded scheduler for many outbound rtp streams
+
+instead of pacing every stream on its own, one thread wakes up every
+`tick` seconds, takes the next packet of every stream which is due and
+sends them all, one `sendto` per packet. with `batch` the packets for the
+same socket leave in one `sendmmsg` call where the c library provides it.
+copying every packet into the message buffers from python costs more than
+the system calls it saves, so batching is off by default. it only applies
+to streams sharing a socket, the calls of VoIPCall each send from a socket
+of their own.
+
+a stream whose packets raise is logged and finished, the others go on.
+
+the lateness of every tick and the number of packets it sent are kept,
+the statistics of a stream are handed to its `done` callback.
+'''
+import logging
+import socket
+import struct
+import time
+from threading import Lock, Thread
+
+from voip.metrics import REGISTRY
+from voip.rtp import RTP_SENT
+
+try:
+    import ctypes
+    import ctypes.util
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _sendmmsg = _libc.sendmmsg
+except (ImportError, OSError, AttributeError):
+    _sendmmsg = None
+
+TICK_LATENESS = REGISTRY.histogram(
+    'rtp_tick_lateness_seconds', 'time ticks of the media scheduler ran '
+    'after their deadline',
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.02, 0.05)
+    )
+BATCH_SIZE = REGISTRY.histogram(
+    'rtp_tick_packets', 'packets sent per tick of the media scheduler',
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 2500, 5000)
+    )
+STREAMS = REGISTRY.gauge('rtp_streams', 'streams of the media scheduler')
+
+
+if _sendmmsg is not None:
+    class _IOVec(ctypes.Structure):
+        _fields_ = [
+            ('iov_base', ctypes.c_void_p),
+            ('iov_len', ctypes.c_size_t),
+            ]
+
+    class _MsgHdr(ctypes.Structure):
+        _fields_ = [
+            ('msg_name', ctypes.c_void_p),
+            ('msg_namelen', ctypes.c_uint32),
+            ('msg_iov', ctypes.c_void_p),
+            ('msg_iovlen', ctypes.c_size_t),
+            ('msg_control', ctypes.c_void_p),
+            ('msg_controllen', ctypes.c_size_t),
+            ('msg_flags', ctypes.c_int),
+            ]
+
+    class _MMsgHdr(ctypes.Structure):
+        _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+def sockaddr(address):
+    ''' a struct sockaddr_in for the ipv4 `address` as ctypes buffer
+    it has to be kept alive as long as its address is used
+    '''
+    host, port = address
+    raw = struct.pack('=H', socket.AF_INET) + struct.pack('!H', port) + \
+        socket.inet_aton(socket.gethostbyname(host)) + bytes(8)
+    return ctypes.create_string_buffer(raw, len(raw))
+
+
+class MessageBatch():
+    ''' pre-allocated messages for `sendmmsg`
+    packets are copied into fixed buffers of `size` bytes. the length and
+    destination of every message are packed straight into the message
+    arrays, setting ctypes fields one by one costs more than the system
+    calls it saves.
+    '''
+    # address of a destination and its length, length of a buffer
+    NAME = struct.Struct('@PI')
+    LENGTH = struct.Struct('@N')
+
+    def __init__(self, capacity=1024, size=1500):
+        self.capacity = capacity
+        self.size = size
+        self.buffers = (ctypes.c_char * (capacity * size))()
+        self.view = memoryview(self.buffers).cast('B')
+        self.iovecs = (_IOVec * capacity)()
+        self.messages = (_MMsgHdr * capacity)()
+        self.iovec_view = memoryview(self.iovecs).cast('B')
+        self.message_view = memoryview(self.messages).cast('B')
+        base = ctypes.addressof(self.buffers)
+        iovecs = ctypes.addressof(self.iovecs)
+        for index in range(capacity):
+            self.iovecs[index].iov_base = base + index * size
+            header = self.messages[index].msg_hdr
+            header.msg_iov = iovecs + index * ctypes.sizeof(_IOVec)
+            header.msg_iovlen = 1
+
+    def fits(self, packet):
+        ''' whether `packet` fits into a message buffer
+        '''
+        if isinstance(packet, (tuple, list)):
+            return sum(len(part) for part in packet) <= self.size
+        return len(packet) <= self.size
+
+    def send(self, sock, items):
+        ''' send all (packet, sockaddr) `items` on `sock`
+        a packet can be a sequence of buffers which are sent as one datagram.
+        returns the number of items sent, which stops short at the first
+        message the kernel refused after others went out
+        '''
+        view = self.view
+        size = self.size
+        pack_name = self.NAME.pack_into
+        pack_length = self.LENGTH.pack_into
+        messages = self.message_view
+        iovecs = self.iovec_view
+        message_size = ctypes.sizeof(_MMsgHdr)
+        iovec_size = ctypes.sizeof(_IOVec)
+        length_offset = _IOVec.iov_len.offset
+        fileno = sock.fileno()
+        sent = 0
+        while sent < len(items):
+            count = min(len(items) - sent, self.capacity)
+            for index in range(count):
+                packet, name = items[sent + index]
+                offset = index * size
+                # checked here instead of with fits(), the length is needed
+                # for the message anyway
+                if isinstance(packet, (tuple, list)):
+                    length = sum(len(part) for part in packet)
+                else:
+                    length = len(packet)
+                if length > size:
+                    # it would overwrite the next buffer
+                    raise ValueError(
+                        f'packet larger than the {size} byte buffers'
+                        )
+                if isinstance(packet, (tuple, list)):
+                    start = offset
+                    for part in packet:
+                        view[start:start + len(part)] = part
+                        start += len(part)
+                else:
+                    view[offset:offset + length] = packet
+                pack_length(
+                    iovecs, index * iovec_size + length_offset, length
+                    )
+                pack_name(messages, index * message_size, *name)
+            result = _sendmmsg(fileno, self.messages, count, 0)
+            if result < 0:
+                if sent:
+                    return sent
+                errno = ctypes.get_errno()
+                raise OSError(errno, f'sendmmsg: {errno}')
+            sent += result
+        return sent
+
+
+class Stream():
+    ''' an outbound stream of the scheduler
+    '''
+    __slots__ = (
+        'sock', 'address', 'sockaddr', 'name', 'packets', 'ticks', 'done',
+        'sent', 'late', 'resyncs', 'total_lateness', 'max_lateness',
+        'active',
+        )
+
+    def __init__(self, sock, address, packets, ticks, done=None,
+            batched=False):
+        self.sock = sock
+        self.address = address
+        # only batches need the resolved address
+        self.sockaddr = sockaddr(address) if batched else None
+        # address and length of the sockaddr for MessageBatch
+        self.name = (ctypes.addressof(self.sockaddr), len(self.sockaddr)) \
+            if self.sockaddr is not None else None
+        self.packets = iter(packets)
+        self.ticks = ticks
+        self.done = done
+        self.sent = 0
+        self.late = 0
+        self.resyncs = 0
+        self.total_lateness = 0.0
+        self.max_lateness = 0.0
+        self.active = True
+
+    @property
+    def mean_lateness(self):
+        return self.total_lateness / self.sent if self.sent else 0.0
+
+    def __repr__(self):
+        return f'sent={self.sent} late={self.late} resyncs={self.resyncs} ' + \
+            f'mean={self.mean_lateness * 1000:.3f}ms ' + \
+            f'max={self.max_lateness * 1000:.3f}ms'
+
+
+class MediaScheduler():
+    ''' paces any number of streams from a single thread
+    the packet interval of every stream has to be a multiple of `tick`
+    '''
+    def __init__(self,
+            tick=0.02, resync=5, late_threshold=0.005, batch=False,
+            clock=time.monotonic):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.tick = tick
+        self.resync = resync
+        self.late_threshold = late_threshold
+        self.batch = MessageBatch() if batch and _sendmmsg is not None \
+            else None
+        self.clock = clock
+        self.start_time = clock()
+        self.current = 0
+        # streams by the tick they are due at
+        self.slots = {}
+        self.count = 0
+        self.lock = Lock()
+        self.thread = None
+        self.running = False
+        # statistics of the last tick
+        self.lateness = 0.0
+        self.batch_size = 0
+        self.ticks = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, sock, address, packets, ptime=20, done=None):
+        ''' send `packets` to `address` from `sock` every `ptime` ms
+        `done` is called with the Stream when the packets are exhausted
+        '''
+        ticks = round(ptime / 1000 / self.tick)
+        if ticks < 1 or abs(ticks * self.tick - ptime / 1000) > 1e-9:
+            raise ValueError(f'ptime {ptime} is no multiple of {self.tick}')
+        stream = Stream(
+            sock, address, packets, ticks, done, self.batch is not None
+            )
+        with self.lock:
+            self.slots.setdefault(self.current + 1, []).append(stream)
+            self.count += 1
+        STREAMS.inc()
+        return stream
+
+    def remove(self, stream):
+        ''' stop a stream, its `done` callback is not called
+        '''
+        with self.lock:
+            if stream.active:
+                stream.active = False
+                self.count -= 1
+                STREAMS.dec()
+
+    def next_tick(self):
+        ''' clock time of the next tick
+        '''
+        return self.start_time + (self.current + 1) * self.tick
+
+    def run_tick(self, now=None):
+        ''' send the packets of all streams which are due at `now`
+        returns the number of sent packets
+        '''
+        now = self.clock() if now is None else now
+        target = int((now - self.start_time) / self.tick)
+        if target <= self.current:
+            return 0
+        with self.lock:
+            if target - self.current > self.resync:
+                # too late to catch up, every stream sends once now
+                self.log.warning(
+                    f'scheduler {(target - self.current) * self.tick:.3f}s '
+                    'late, resyncing'
+                    )
+                due = []
+                for index in range(self.current + 1, target + 1):
+                    due.extend(self.slots.pop(index, ()))
+                for stream in due:
+                    stream.resyncs += 1
+            else:
+                due = self.slots.pop(self.current + 1, [])
+                target = self.current + 1
+            self.current = target
+
+        deadline = self.start_time + target * self.tick
+        lateness = now - deadline
+        late = lateness > self.late_threshold
+        groups = {}
+        finished = []
+        reschedule = []
+        for stream in due:
+            if not stream.active:
+                continue
+            try:
+                packet = next(stream.packets, None)
+            except Exception:
+                # e.g. a source closed under the stream, only this one ends
+                self.log.exception(f'stream to {stream.address} failed')
+                packet = None
+            if packet is None:
+                finished.append(stream)
+                continue
+            group = groups.get(stream.sock)
+            if group is None:
+                group = groups[stream.sock] = []
+            group.append((stream, packet))
+            reschedule.append(stream)
+
+        sent = []
+        for sock, items in groups.items():
+            sent.extend(self._send(sock, items))
+
+        with self.lock:
+            for stream in reschedule:
+                self.slots.setdefault(target + stream.ticks, []).append(stream)
+            # streams removed meanwhile were already accounted by remove
+            finished = [stream for stream in finished if stream.active]
+            for stream in finished:
+                stream.active = False
+                self.count -= 1
+        # only packets which left count, failed ones were logged
+        for stream in sent:
+            stream.sent += 1
+            stream.total_lateness += lateness
+            if lateness > stream.max_lateness:
+                stream.max_lateness = lateness
+            if late:
+                stream.late += 1
+        for stream in finished:
+            STREAMS.dec()
+            if stream.done is not None:
+                try:
+                    stream.done(stream)
+                except Exception:
+                    self.log.exception(f'stream callback {stream.done}')
+
+        sent = len(sent)
+        self.lateness = lateness
+        self.batch_size = sent
+        self.ticks += 1
+        TICK_LATENESS.observe(lateness)
+        BATCH_SIZE.observe(sent)
+        RTP_SENT.inc(sent)
+        return sent
+
+    def _send(self, sock, items):
+        ''' send the (stream, packet) `items` on `sock`
+        returns the streams whose packet was sent
+        '''
+        count = 0
+        if self.batch is not None and len(items) > 1:
+            # packets too large for the batch buffers are sent on their own
+            fits = self.batch.fits
+            batched = []
+            single = []
+            for item in items:
+                (batched if fits(item[1]) else single).append(item)
+            items = batched + single
+            try:
+                count = self.batch.send(sock, [
+                    (packet, stream.name) for stream, packet in batched
+                    ])
+            except OSError as e:
+                self.log.error(f'batched send failed: {e}')
+        sent = [stream for stream, _ in items[:count]]
+        # what the batch did not send goes out one by one, so a failure
+        # only costs the packets it concerns
+        for stream, packet in items[count:]:
+            try:
+                if isinstance(packet, (tuple, list)):
+                    sock.sendmsg(packet, [], 0, stream.address)
+                else:
+                    sock.sendto(packet, stream.address)
+                sent.append(stream)
+            except OSError as e:
+                self.log.error(f'sending to {stream.address} failed: {e}')
+        return sent
+
+    def start(self):
+        ''' run the scheduler in a background thread
+        '''
+        # ticks start now instead of at construction
+        self.start_time = self.clock() - self.current * self.tick
+        self.running = True
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            delay = self.next_tick() - self.clock()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                self.run_tick()
+            except Exception:
+                # a broken tick must not silence every call
+                self.log.exception('scheduler tick failed')
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
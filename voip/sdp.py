@@ -0,0 +1,262 @@
+''' session description protocol (rfc 4566) and offer/answer (rfc 3264)
+
+a parsed session description consists of a Session with its Media
+sections. only the parts needed for audio calls are interpreted, all
+other attributes are kept as (name, value) pairs.
+
+offers are rendered from templates which are compiled once per codec list
+and ptime, only address, port and session id are filled in per call.
+'''
+import random
+
+from voip.codec import CODECS
+
+DIRECTIONS = ('sendrecv', 'sendonly', 'recvonly', 'inactive')
+
+# compiled offer templates by (payload types, ptime, direction)
+TEMPLATES = {}
+
+
+class RTPMap():
+    ''' an rtpmap attribute
+    '''
+    __slots__ = ('payload_type', 'encoding', 'clockrate', 'channels')
+
+    def __init__(self, payload_type, encoding, clockrate, channels=1):
+        self.payload_type = payload_type
+        self.encoding = encoding
+        self.clockrate = clockrate
+        self.channels = channels
+
+    @classmethod
+    def parse(cls, value):
+        payload_type, _, value = value.partition(' ')
+        encoding, clockrate, channels = (value.strip().split('/') + [1])[:3]
+        return cls(
+            int(payload_type), encoding, int(clockrate), int(channels or 1)
+            )
+
+    def __str__(self):
+        text = f'{self.payload_type} {self.encoding}/{self.clockrate}'
+        return text + (f'/{self.channels}' if self.channels != 1 else '')
+
+    def __repr__(self):
+        return f'RTPMap({self})'
+
+
+class Media():
+    ''' a media section
+    '''
+    __slots__ = (
+        'media', 'port', 'protocol', 'formats', 'connection', 'rtpmap',
+        'fmtp', 'ptime', 'direction', 'attributes',
+        )
+
+    def __init__(self, media='audio', port=0, protocol='RTP/AVP',
+            formats=()):
+        self.media = media
+        self.port = port
+        self.protocol = protocol
+        self.formats = list(formats)
+        self.connection = None
+        self.rtpmap = {}
+        self.fmtp = {}
+        self.ptime = None
+        self.direction = None
+        self.attributes = []
+
+    @property
+    def payload_types(self):
+        ''' the numeric formats in order of preference
+        '''
+        return [int(fmt) for fmt in self.formats if fmt.isdigit()]
+
+    def encoding(self, payload_type):
+        ''' (encoding, clockrate) of `payload_type` from its rtpmap or the
+        static assignments of rfc 3551
+        '''
+        rtpmap = self.rtpmap.get(payload_type)
+        if rtpmap is not None:
+            return rtpmap.encoding.upper(), rtpmap.clockrate
+        codec = CODECS.get(payload_type)
+        if codec is not None:
+            return codec.name, codec.clockrate
+        return None, None
+
+    def add_attribute(self, name, value):
+        if name == 'rtpmap':
+            rtpmap = RTPMap.parse(value)
+            self.rtpmap[rtpmap.payload_type] = rtpmap
+        elif name == 'fmtp':
+            payload_type, _, params = value.partition(' ')
+            self.fmtp[int(payload_type)] = params.strip()
+        elif name == 'ptime':
+            self.ptime = int(float(value))
+        elif name in DIRECTIONS:
+            self.direction = name
+        else:
+            self.attributes.append((name, value))
+
+    def __repr__(self):
+        return f'Media({self.media} {self.port} {self.protocol} ' + \
+            f'{" ".join(self.formats)})'
+
+
+class Session():
+    ''' a session description
+    '''
+    __slots__ = (
+        'version', 'origin', 'name', 'connection', 'timing', 'direction',
+        'attributes', 'media',
+        )
+
+    def __init__(self):
+        self.version = 0
+        # username, session id, version, network type, address type, address
+        self.origin = None
+        self.name = '-'
+        self.connection = None
+        self.timing = '0 0'
+        self.direction = None
+        self.attributes = []
+        self.media = []
+
+    @classmethod
+    def parse(cls, text):
+        ''' parse a session description, lines may end in CRLF or LF
+        values are split at the first `=` only
+        '''
+        session = cls()
+        current = None
+        for line in text.splitlines():
+            kind, sep, value = line.partition('=')
+            if not sep or len(kind) != 1:
+                continue
+            value = value.strip()
+            if kind == 'v':
+                session.version = int(value)
+            elif kind == 'o':
+                session.origin = value.split()
+            elif kind == 's':
+                session.name = value
+            elif kind == 't':
+                session.timing = value
+            elif kind == 'c':
+                address = value.split()[-1].partition('/')[0]
+                if current is None:
+                    session.connection = address
+                else:
+                    current.connection = address
+            elif kind == 'm':
+                parts = value.split()
+                if len(parts) < 3:
+                    raise ValueError(f'invalid media line "{value}"')
+                current = Media(
+                    parts[0], int(parts[1].partition('/')[0]), parts[2],
+                    parts[3:]
+                    )
+                session.media.append(current)
+            elif kind == 'a':
+                name, _, attribute = value.partition(':')
+                if current is not None:
+                    current.add_attribute(name, attribute)
+                elif name in DIRECTIONS:
+                    session.direction = name
+                else:
+                    session.attributes.append((name, attribute))
+        return session
+
+    @property
+    def audio(self):
+        ''' the first audio section or None
+        '''
+        for media in self.media:
+            if media.media == 'audio':
+                return media
+        return None
+
+    def address(self, media):
+        ''' the address to send `media` to
+        '''
+        if media.connection is not None:
+            return media.connection
+        if self.connection is not None:
+            return self.connection
+        return self.origin[-1] if self.origin else None
+
+    def direction_of(self, media):
+        return media.direction or self.direction or 'sendrecv'
+
+    def __repr__(self):
+        return f'Session({self.origin} {self.media})'
+
+
+def negotiate(media, codecs=None):
+    ''' codecs of `codecs` supported by the remote `media`, in the order
+    of the remote preference, as (payload type, codec) pairs
+    a remote answer may use other payload type numbers for a codec, the
+    encoding name and clockrate decide
+    '''
+    codecs = codecs if codecs is not None else list(CODECS.values())
+    names = {(codec.name.upper(), codec.clockrate): codec for codec in codecs}
+    supported = []
+    if media is None or media.port == 0:
+        return supported
+    for payload_type in media.payload_types:
+        codec = names.get(media.encoding(payload_type))
+        if codec is not None:
+            supported.append((payload_type, codec))
+    return supported
+
+
+class OfferTemplate():
+    ''' an sdp offer compiled for a codec list and ptime
+    '''
+    __slots__ = ('codecs', 'ptime', 'direction', 'template')
+
+    def __init__(self, codecs, ptime=20, direction='sendrecv'):
+        self.codecs = list(codecs)
+        self.ptime = ptime
+        self.direction = direction
+        payload_types = ' '.join(str(codec.payload_type) for codec in codecs)
+        lines = [
+            'v=0',
+            'o=- %(session)d %(session)d IN IP4 %(address)s',
+            's=T3cPh0n3',
+            'c=IN IP4 %(address)s',
+            't=0 0',
+            f'm=audio %(port)d RTP/AVP {payload_types}',
+            ]
+        for codec in codecs:
+            lines.append(
+                f'a=rtpmap:{codec.payload_type} {codec.name}/{codec.clockrate}'
+                )
+        lines.append(f'a=ptime:{ptime}')
+        lines.append(f'a={direction}')
+        self.template = '\r\n'.join(lines) + '\r\n'
+
+    def render(self, address, port, session=None):
+        ''' the offer for `address`:`port`
+        '''
+        if session is None:
+            session = random.getrandbits(32)
+        return self.template % {
+            'address': address, 'port': port, 'session': session
+            }
+
+
+def offer_template(codecs=None, ptime=20, direction='sendrecv'):
+    ''' the cached OfferTemplate for `codecs`
+    '''
+    codecs = codecs if codecs is not None else list(CODECS.values())
+    key = (tuple(codec.payload_type for codec in codecs), ptime, direction)
+    template = TEMPLATES.get(key)
+    if template is None:
+        template = TEMPLATES[key] = OfferTemplate(codecs, ptime, direction)
+    return template
+
+
+def offer(address, port, codecs=None, ptime=20, session=None):
+    ''' render an sdp offer for audio at `address`:`port`
+    '''
+    return offer_template(codecs, ptime).render(address, port, session)
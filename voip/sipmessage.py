@@ -1,5 +1,6 @@
 import logging
 import uuid
+from voip.sdp import Session
 
 def get_values(line):
     ''' splits a text into key-value pairs
@@ -62,6 +63,9 @@ class SIPMessage():
         '''
         return self.generate(True)
 
+    def __bytes__(self):
+        return self.generate(True).encode('utf8')
+
     def set_content(self, content):
         ''' set the message content
         '''
@@ -109,8 +113,11 @@ class SIPMessage():
 
         # add content if neccessary
         if with_content is True:
-            s += f'Content-Length: {len(self.content)}{self.ENDL}'
-            s += str(self.content)
+            content = str(self.content)
+            s += f'Content-Length: {len(content.encode())}{self.ENDL}'
+            if content:
+                s += f'{self.ENDL}{content}'
+                return s
 
         s += self.ENDL
 
@@ -133,12 +140,37 @@ class SIPMessage():
         return f'SIP/{self.SIPVERSION}'
 
     @property
-    def sdpcontent(self):
-        if not '_sdpcontent' in self.__dict__:
-            self._sdpcontent = {}
-            lines = self.content.splitlines()
+    def branch(self):
+        ''' branch parameter of the via header
+        '''
+        via = self.get('Via')
+        if via is None:
+            return None
+        if type(via) in [list, tuple]:
+            via = ' '.join(via)
+        for param in via.split(';')[1:]:
+            name, _, value = param.partition('=')
+            if name.strip() == 'branch':
+                return value.strip()
+        return None
 
+    @property
+    def method(self):
+        ''' method of the CSeq header
+        '''
+        cseq = self.get('CSeq')
+        if cseq is None:
+            return None
+        if type(cseq) not in [list, tuple]:
+            cseq = str(cseq).split(' ')
+        return cseq[-1]
 
+    @property
+    def sdpcontent(self):
+        ''' the content parsed as session description
+        '''
+        if not '_sdpcontent' in self.__dict__:
+            self._sdpcontent = Session.parse(self.content)
         return self._sdpcontent
 
 
@@ -157,7 +189,7 @@ class SIPRequest(SIPMessage):
 
         self.headsip = server
         self.userip = userip
-        self.set_via(f'z9hG4bKt3cDr01d{uuid.uuid4().hex[:25]}')
+        self.new_branch()
         self.set_expires()
         self.set('User-Agent', 'T3cPh0n3 0.1')
         self.set('Allow', 'INVITE, ACK, BYE, CANCEL')
@@ -197,6 +229,12 @@ class SIPRequest(SIPMessage):
         x = f'{self.sipversion}/UDP {self.userip}:{self.port};branch={branch};rport'
         self.set('Via', x)
 
+    def new_branch(self):
+        ''' set a via entry with a new branch, which makes the request a
+        new transaction
+        '''
+        self.set_via(f'z9hG4bKt3cDr01d{uuid.uuid4().hex[:25]}')
+
     def set_contact(self, contact):
         ''' set a contact
         '''
@@ -251,6 +289,19 @@ class Ack(SIPRequest):
         self.create_to(receiver)
         self.set_callid(call_id)
         self.set_sequence(cseq)
+
+
+class Bye(SIPRequest):
+    ''' Bye - ends a dialog
+    '''
+    def __init__(self, server, caller, call_id, receiver, cseq=1):
+        super().__init__('BYE', server)
+        self.set_from(caller)
+        self.create_to(receiver)
+        self.set_callid(call_id)
+        self.set_sequence(cseq)
+        self.headsip=self.callee(receiver)
+
 if __name__ == '__main__':
     req = SIPRequest('REGISTER', 'fritz.box')
     print(req)
@@ -0,0 +1,323 @@
+''' lazy sip message parser
+
+a received datagram is not split into header lines at all. accessing a
+header searches the datagram for its lines with a compiled expression per
+header name, in long and compact form and case insensitive, and only these
+values get decoded. Via, CSeq, From and To can
+be accessed as parsed objects.
+'''
+import re
+
+# compact header forms of rfc 3261 section 7.3.3 and extensions
+COMPACT = {
+    b'a': b'accept-contact',
+    b'c': b'content-type',
+    b'e': b'content-encoding',
+    b'f': b'from',
+    b'i': b'call-id',
+    b'k': b'supported',
+    b'l': b'content-length',
+    b'm': b'contact',
+    b'o': b'event',
+    b'r': b'refer-to',
+    b's': b'subject',
+    b't': b'to',
+    b'u': b'allow-events',
+    b'v': b'via',
+    }
+LONG = {name: compact for compact, name in COMPACT.items()}
+
+# header names as given by the caller mapped to their normalized form and
+# normalized names mapped to the expression finding their values
+NAMES = {}
+PATTERNS = {}
+
+
+def split_list(value):
+    ''' split a comma separated header value, commas within quotes or angle
+    brackets are kept
+    '''
+    if ',' not in value:
+        return [value.strip()]
+    items = []
+    start = 0
+    quoted = False
+    angle = False
+    for position, char in enumerate(value):
+        if char == '"':
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == '<':
+            angle = True
+        elif char == '>':
+            angle = False
+        elif char == ',' and not angle:
+            items.append(value[start:position].strip())
+            start = position + 1
+    items.append(value[start:].strip())
+    return items
+
+
+def split_params(text):
+    ''' split `;name=value` parameters into a dict with lower case names
+    '''
+    params = {}
+    for param in text.split(';'):
+        name, _, value = param.partition('=')
+        name = name.strip().lower()
+        if name:
+            params[name] = value.strip().strip('"') if value else None
+    return params
+
+
+class Via():
+    ''' a single via entry
+    '''
+    __slots__ = ('protocol', 'transport', 'host', 'port', 'params')
+
+    def __init__(self, value):
+        sent, _, rest = value.strip().partition(' ')
+        self.protocol, _, self.transport = sent.rpartition('/')
+        hostport, _, params = rest.strip().partition(';')
+        hostport = hostport.strip()
+        if hostport.startswith('['):
+            # ipv6 reference
+            host, _, port = hostport.partition(']')
+            host += ']'
+            port = port.lstrip(':')
+        else:
+            host, _, port = hostport.partition(':')
+        self.host = host
+        self.port = int(port) if port.isdigit() else None
+        self.params = split_params(params)
+
+    @property
+    def branch(self):
+        return self.params.get('branch')
+
+    def __repr__(self):
+        return f'Via({self.transport} {self.host}:{self.port} {self.params})'
+
+
+class CSeq():
+    ''' a CSeq header
+    '''
+    __slots__ = ('number', 'method')
+
+    def __init__(self, value):
+        number, _, method = value.strip().partition(' ')
+        self.number = int(number)
+        self.method = method.strip()
+
+    def __repr__(self):
+        return f'CSeq({self.number} {self.method})'
+
+
+class Address():
+    ''' a name-addr or addr-spec as used in From, To and Contact
+    '''
+    __slots__ = ('display', 'uri', 'params')
+
+    def __init__(self, value):
+        value = value.strip()
+        if '<' in value:
+            display, _, rest = value.partition('<')
+            self.uri, _, params = rest.partition('>')
+            self.display = display.strip().strip('"')
+            params = params.partition(';')[2]
+        else:
+            self.display = ''
+            self.uri, _, params = value.partition(';')
+        self.params = split_params(params)
+
+    @property
+    def tag(self):
+        return self.params.get('tag')
+
+    def __repr__(self):
+        return f'Address({self.display!r} <{self.uri}> {self.params})'
+
+
+class SIPView():
+    ''' a lazy view of a received sip message
+    `method` is the request method, or the CSeq method of a response as
+    both are used to match transactions
+    '''
+    __slots__ = (
+        'data', 'startline', 'body_offset', 'cache',
+        'code', 'message', 'uri', '_method',
+        )
+
+    def __init__(self, data):
+        self.data = bytes(data)
+        self.cache = {}
+        data = self.data
+
+        end = data.find(b'\r\n\r\n')
+        if end < 0:
+            raise ValueError('sip message without end of headers')
+        self.body_offset = end + 4
+
+        eol = data.find(b'\r\n')
+        first = data[:eol].decode('utf8')
+        parts = first.split(' ', 2)
+        if len(parts) != 3:
+            raise ValueError(f'invalid start line "{first}"')
+        if parts[0].startswith('SIP/'):
+            self.code = int(parts[1])
+            self.message = parts[2]
+            self.uri = None
+            self._method = None
+        else:
+            self.code = None
+            self.message = None
+            self._method, self.uri = parts[0], parts[1]
+        self.startline = first
+
+    @staticmethod
+    def _name(name):
+        key = NAMES.get(name)
+        if key is None:
+            key = name.lower().encode('utf8')
+            key = NAMES[name] = COMPACT.get(key, key)
+        return key
+
+    @staticmethod
+    def _pattern(name):
+        ''' compiled expression matching the values of header `name`
+        '''
+        pattern = PATTERNS.get(name)
+        if pattern is None:
+            names = re.escape(name)
+            if name in LONG:
+                names += b'|' + re.escape(LONG[name])
+            pattern = PATTERNS[name] = re.compile(
+                rb'\r\n(?:' + names + rb')[ \t]*:[ \t]*' +
+                rb'([^\r\n]*(?:\r\n[ \t][^\r\n]*)*)',
+                re.IGNORECASE
+                )
+        return pattern
+
+    def _values(self, name):
+        ''' decoded values of all lines of header `name`
+        '''
+        values = self.cache.get(name)
+        if values is None:
+            values = []
+            raw = self._pattern(name).findall(self.data, 0, self.body_offset)
+            for value in raw:
+                value = value.decode('utf8').strip()
+                if '\r\n' in value:
+                    # unfold continuation lines
+                    value = ' '.join(
+                        part.strip() for part in value.split('\r\n')
+                        )
+                values.append(value)
+            self.cache[name] = values
+        return values
+
+    def __contains__(self, name):
+        return len(self._values(self._name(name))) > 0
+
+    def get(self, name, default=None):
+        ''' the first line of header `name`, names are case insensitive and
+        compact forms are accepted
+        '''
+        values = self._values(self._name(name))
+        return values[0] if values else default
+
+    def get_all(self, name):
+        ''' all values of header `name`, comma separated lists are split
+        '''
+        items = []
+        for value in self._values(self._name(name)):
+            items.extend(split_list(value))
+        return items
+
+    def _parsed(self, key, name, cls):
+        value = self.cache.get(key)
+        if value is None:
+            text = self.get(name)
+            value = cls(text) if text is not None else None
+            self.cache[key] = value
+        return value
+
+    @property
+    def headers(self):
+        ''' decoded dict of all headers, mainly for debugging
+        '''
+        headers = {}
+        head = self.data[:self.body_offset - 4].lower()
+        for line in head.split(b'\r\n')[1:]:
+            name = line.partition(b':')[0].strip()
+            if name and line[:1] not in (b' ', b'\t'):
+                name = COMPACT.get(name, name)
+                headers[name.decode('utf8')] = self._values(name)
+        return headers
+
+    @property
+    def via(self):
+        ''' the topmost via entry
+        '''
+        value = self.cache.get('via')
+        if value is None:
+            vias = self.get_all('via')
+            value = Via(vias[0]) if vias else None
+            self.cache['via'] = value
+        return value
+
+    @property
+    def vias(self):
+        return [Via(value) for value in self.get_all('via')]
+
+    @property
+    def cseq(self):
+        return self._parsed('cseq', 'cseq', CSeq)
+
+    @property
+    def from_(self):
+        return self._parsed('from', 'from', Address)
+
+    @property
+    def to(self):
+        return self._parsed('to', 'to', Address)
+
+    @property
+    def branch(self):
+        ''' branch of the topmost via, found without parsing the via
+        '''
+        value = self.get('via')
+        if value is None:
+            return None
+        value = value.partition(',')[0]
+        start = value.find(';branch=')
+        if start < 0:
+            return self.via.branch
+        return value[start + 8:].partition(';')[0].strip()
+
+    @property
+    def method(self):
+        if self._method is not None:
+            return self._method
+        value = self.get('cseq')
+        return value.partition(' ')[2].strip() if value is not None else None
+
+    @property
+    def is_response(self):
+        return self.code is not None
+
+    @property
+    def body(self):
+        ''' the message body as memoryview
+        '''
+        return memoryview(self.data)[self.body_offset:]
+
+    @property
+    def content(self):
+        ''' the message body as text
+        '''
+        return self.data[self.body_offset:].decode('utf8')
+
+    def __repr__(self):
+        return self.data.decode('utf8', 'replace')
@@ -0,0 +1,299 @@
+''' streaming media sources
+
+a media source yields the linear pcm of a wave file lazily in frames of
+`ptime` milliseconds instead of reading the whole file. the samples are
+memory mapped where possible and read in chunks of `readahead` seconds
+otherwise. with mmap the kernel is asked to read the next `readahead`
+seconds in advance, so a cold file does not block the pacing clock.
+
+frames are views of the mapping or of a reused chunk buffer, so every
+frame has to be consumed before the next one is requested, as the media
+scheduler and the rtp sender do. a short last frame is padded with silence.
+
+sources can loop, seek and be concatenated to playlists:
+
+    source = Playlist([WaveSource('greeting.wav'), WaveSource('menu.wav')])
+    call.stream_source(source, scheduler)
+'''
+import logging
+import mmap
+import struct
+
+CHUNK = struct.Struct('<4sI')
+FORMAT = struct.Struct('<HHIIHH')
+
+# wave format tags of integer pcm
+PCM = 1
+EXTENSIBLE = 0xfffe
+
+
+def read_header(f):
+    ''' (channels, rate, sampwidth, data offset, data size) of the wave
+    file `f`, the file position is left at the start of the samples
+    '''
+    riff, _, kind = struct.unpack('<4sI4s', f.read(12))
+    if riff != b'RIFF' or kind != b'WAVE':
+        raise ValueError(f'{f.name} is no wave file')
+    fmt = None
+    while True:
+        header = f.read(CHUNK.size)
+        if len(header) < CHUNK.size:
+            raise ValueError(f'{f.name} has no data chunk')
+        name, size = CHUNK.unpack(header)
+        if name == b'fmt ':
+            fmt = FORMAT.unpack(f.read(size)[:FORMAT.size])
+            if size % 2:
+                f.seek(1, 1)
+        elif name == b'data':
+            break
+        else:
+            # chunks are padded to an even size
+            f.seek(size + size % 2, 1)
+    if fmt is None:
+        raise ValueError(f'{f.name} has no format chunk')
+    tag, channels, rate, _, align, bits = fmt
+    if tag not in (PCM, EXTENSIBLE) or bits not in (8, 16):
+        raise ValueError(f'{f.name} is no 8 or 16 bit pcm')
+    offset = f.tell()
+    # files still being written may carry a size of zero or the maximum
+    f.seek(0, 2)
+    available = f.tell() - offset
+    size = available if size in (0, 0xffffffff) else min(size, available)
+    size -= size % align
+    f.seek(offset)
+    return channels, rate, bits // 8, offset, size
+
+
+class WaveSource():
+    ''' frames of `ptime` milliseconds of the wave file `path`
+    with `loop` the file starts over at its end until the source is closed
+    '''
+    def __init__(self, path, ptime=20, loop=False, readahead=1.0,
+            use_mmap=True):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        self.ptime = ptime
+        self.loop = loop
+        self.file = open(path, 'rb')
+        try:
+            self.channels, self.rate, self.sampwidth, self.offset, \
+                self.size = read_header(self.file)
+        except (ValueError, struct.error):
+            self.file.close()
+            raise
+        self.framesize = self.rate * ptime // 1000 * \
+            self.channels * self.sampwidth
+        self.count = -(-self.size // self.framesize)
+        self.position = 0
+        # frames read or advised in advance
+        self.readahead = max(1, int(readahead * 1000 / ptime))
+        self.pad = bytearray(self.framesize)
+        self.silence = b'\x80' if self.sampwidth == 1 else b'\0'
+
+        self.map = None
+        if use_mmap and self.size:
+            try:
+                self.map = mmap.mmap(
+                    self.file.fileno(), 0, access=mmap.ACCESS_READ
+                    )
+            except (OSError, ValueError) as e:
+                self.log.debug(f'reading {path} in chunks: {e}')
+        if self.map is not None:
+            self.mapped = memoryview(self.map)
+            self.view = self.mapped[self.offset:self.offset + self.size]
+            self.chunk = None
+        else:
+            self.view = None
+            self.chunk = bytearray(self.readahead * self.framesize)
+            self.chunk_view = memoryview(self.chunk)
+            # first frame and frame count held by the chunk
+            self.chunk_start = 0
+            self.chunk_count = 0
+
+    @property
+    def duration(self):
+        ''' length in seconds
+        '''
+        return self.count * self.ptime / 1000
+
+    def tell(self):
+        ''' position in seconds
+        '''
+        return self.position * self.ptime / 1000
+
+    def seek(self, seconds):
+        ''' continue at `seconds` from the start, within the file
+        '''
+        frame = int(seconds * 1000 / self.ptime)
+        self.position = max(0, min(self.count, frame))
+
+    def __iter__(self):
+        return self.frames()
+
+    def frames(self):
+        ''' yield the frames from the current position
+        '''
+        while True:
+            while self.position < self.count:
+                frame = self._frame(self.position)
+                self.position += 1
+                yield frame
+            if not self.loop or self.count == 0:
+                return
+            self.position = 0
+
+    def encoded(self, codec):
+        ''' yield the frames encoded with `codec`
+        '''
+        for frame in self.frames():
+            yield codec.encode(frame, self.sampwidth)
+
+    def _frame(self, index):
+        start = index * self.framesize
+        end = min(start + self.framesize, self.size)
+        if self.view is not None:
+            if index % self.readahead == 0:
+                self._advise(start)
+            data = self.view[start:end]
+        else:
+            if not self.chunk_start <= index < \
+                    self.chunk_start + self.chunk_count:
+                self._read_chunk(index)
+            position = (index - self.chunk_start) * self.framesize
+            data = self.chunk_view[position:position + end - start]
+        if end - start == self.framesize:
+            return data
+        length = end - start
+        self.pad[:length] = data
+        self.pad[length:] = self.silence * (self.framesize - length)
+        return memoryview(self.pad)
+
+    def _advise(self, start):
+        ''' ask the kernel to read the next frames in the background
+        '''
+        if not hasattr(self.map, 'madvise'):
+            return
+        begin = self.offset + start
+        begin -= begin % mmap.PAGESIZE
+        length = min(
+            self.readahead * self.framesize + self.offset + start - begin,
+            len(self.map) - begin
+            )
+        if length > 0:
+            try:
+                self.map.madvise(mmap.MADV_WILLNEED, begin, length)
+            except (OSError, ValueError):
+                pass
+
+    def _read_chunk(self, index):
+        self.file.seek(self.offset + index * self.framesize)
+        length = min(len(self.chunk), self.size - index * self.framesize)
+        read = self.file.readinto(self.chunk_view[:length])
+        self.chunk_start = index
+        self.chunk_count = -(-read // self.framesize)
+
+    def close(self):
+        if self.map is not None:
+            self.view.release()
+            self.mapped.release()
+            self.view = None
+            try:
+                self.map.close()
+            except BufferError:
+                # a frame is still referenced, the mapping goes with it
+                pass
+            self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f'WaveSource({self.path} {self.rate}Hz ' + \
+            f'{self.channels}ch {self.tell():.2f}/{self.duration:.2f}s)'
+
+
+class Playlist():
+    ''' the frames of several sources of the same format one after another
+    with `loop` the playlist starts over after its last source
+    '''
+    def __init__(self, sources, loop=False):
+        self.sources = list(sources)
+        if not self.sources:
+            raise ValueError('empty playlist')
+        first = self.sources[0]
+        for source in self.sources[1:]:
+            if (source.rate, source.channels, source.sampwidth,
+                    source.ptime) != (first.rate, first.channels,
+                    first.sampwidth, first.ptime):
+                raise ValueError(f'{source} differs in format from {first}')
+        self.rate = first.rate
+        self.channels = first.channels
+        self.sampwidth = first.sampwidth
+        self.ptime = first.ptime
+        self.framesize = first.framesize
+        self.loop = loop
+        self.index = 0
+
+    @property
+    def duration(self):
+        return sum(source.duration for source in self.sources)
+
+    def tell(self):
+        if self.index >= len(self.sources):
+            return self.duration
+        return sum(source.duration for source in self.sources[:self.index]) \
+            + self.sources[self.index].tell()
+
+    def seek(self, seconds):
+        ''' continue at `seconds` from the start of the first source
+        '''
+        for index, source in enumerate(self.sources):
+            if seconds < source.duration or index == len(self.sources) - 1:
+                self.index = index
+                source.seek(seconds)
+                for later in self.sources[index + 1:]:
+                    later.seek(0)
+                return
+            seconds -= source.duration
+
+    def __iter__(self):
+        return self.frames()
+
+    def frames(self):
+        while True:
+            while self.index < len(self.sources):
+                source = self.sources[self.index]
+                # looping sources would never end
+                while source.position < source.count:
+                    frame = source._frame(source.position)
+                    source.position += 1
+                    yield frame
+                self.index += 1
+                if self.index < len(self.sources):
+                    self.sources[self.index].seek(0)
+            if not self.loop:
+                return
+            self.index = 0
+            self.sources[0].seek(0)
+
+    def encoded(self, codec):
+        for frame in self.frames():
+            yield codec.encode(frame, self.sampwidth)
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __repr__(self):
+        return f'Playlist({len(self.sources)} sources ' + \
+            f'{self.tell():.2f}/{self.duration:.2f}s)'
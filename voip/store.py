@@ -0,0 +1,247 @@
+''' pre-encoded announcement store
+
+an announcement is converted once into a file that holds its encoded rtp
+payloads for one (codec, ptime) pair. the file is opened with mmap, so every
+call and every process playing it sends slices of the same pages.
+
+the store file consists of a fixed header followed by equally sized frames:
+
+    magic, version, payload type, ptime, clock rate, frame size, frame count,
+    source mtime in ns, source size, sha1 of the source
+'''
+import argparse
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import wave
+from concurrent.futures import ProcessPoolExecutor
+
+from voip.codec import CODECS
+from voip.resample import read_converted
+
+
+def file_hash(path):
+    ''' sha1 of the file at `path`
+    '''
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+class Announcement():
+    ''' a memory mapped announcement
+    '''
+    MAGIC = b'SVAN'
+    VERSION = 1
+    HEADER = struct.Struct('!4sBBHHIIQQ20s')
+
+    def __init__(self, path):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if len(self.map) < self.HEADER.size:
+                raise ValueError(f'{path} is truncated')
+            magic, version, self.payload_type, self.ptime, self.clockrate, \
+                self.framesize, self.count, self.mtime, self.size, \
+                self.sha1 = self.HEADER.unpack_from(self.map)
+            if magic != self.MAGIC or version != self.VERSION:
+                raise ValueError(f'{path} is no announcement store file')
+            # frame() trusts the header, a short file would serve garbage
+            if len(self.map) < self.HEADER.size + self.count * self.framesize:
+                raise ValueError(f'{path} is truncated')
+        except ValueError:
+            self.map.close()
+            raise
+        self.view = memoryview(self.map)
+
+    @classmethod
+    def write(cls, path, source, payload, payload_type, ptime, clockrate):
+        ''' cut `payload` into frames and write the store file atomically
+        '''
+        framesize = clockrate * ptime // 1000
+        count = -(-len(payload) // framesize)
+        if count and len(payload) % framesize:
+            payload += payload[-1:] * (count * framesize - len(payload))
+
+        stat = os.stat(source)
+        header = cls.HEADER.pack(
+            cls.MAGIC, cls.VERSION, payload_type, ptime, clockrate,
+            framesize, count, stat.st_mtime_ns, stat.st_size,
+            file_hash(source)
+            )
+        temp = f'{path}.{os.getpid()}.tmp'
+        with open(temp, 'wb') as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(temp, path)
+
+    def frame(self, index):
+        ''' a zero copy view of frame `index`
+        '''
+        position = self.HEADER.size + index * self.framesize
+        return self.view[position:position + self.framesize]
+
+    @property
+    def frames(self):
+        ''' iterate all frames as zero copy views
+        '''
+        for index in range(self.count):
+            yield self.frame(index)
+
+    @property
+    def duration(self):
+        return self.count * self.ptime / 1000
+
+    def is_current(self, source):
+        ''' check whether the announcement still matches its source file
+        '''
+        stat = os.stat(source)
+        if stat.st_size != self.size:
+            return False
+        if stat.st_mtime_ns == self.mtime:
+            return True
+        # touched but maybe unchanged, remember the new time if it is
+        if file_hash(source) != self.sha1:
+            return False
+        self.mtime = stat.st_mtime_ns
+        return True
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+
+    def __repr__(self):
+        return f'{self.path}: {self.count} frames of {self.ptime}ms'
+
+
+class AnnouncementStore():
+    ''' builds and opens announcement files within `directory`
+    opened announcements are kept, so all calls of a process share them
+    '''
+    EXTENSION = '.sva'
+
+    def __init__(self, directory):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.directory = directory
+        self.announcements = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def filename(self, source, codec, ptime):
+        ''' name of the store file for `source` with `codec` and `ptime`
+        '''
+        name = os.path.splitext(os.path.basename(source))[0]
+        key = hashlib.sha1(os.path.abspath(source).encode('utf8')).hexdigest()
+        return os.path.join(
+            self.directory,
+            f'{name}-{key[:8]}-{codec.name}-{ptime}{self.EXTENSION}'
+            )
+
+    def build(self, source, codec, ptime=20):
+        ''' encode the wave file `source` and write its store file
+        other formats than mono at the codec's clock rate are converted
+        '''
+        with wave.open(source, 'rb') as f:
+            if f.getnchannels() == 1 and f.getframerate() == codec.clockrate:
+                sampwidth = f.getsampwidth()
+                data = f.readframes(f.getnframes())
+            else:
+                sampwidth = 2
+                data = b''.join(read_converted(f, codec.clockrate))
+
+        path = self.filename(source, codec, ptime)
+        Announcement.write(
+            path, source, codec.encode(data, sampwidth),
+            codec.payload_type, ptime, codec.clockrate
+            )
+        self.log.debug(f'built {path} from {source}')
+        return path
+
+    def get(self, source, codec, ptime=20):
+        ''' return the announcement for `source`, rebuilding it if the
+        source file changed since it was built
+        '''
+        path = self.filename(source, codec, ptime)
+        announcement = self.announcements.get(path)
+        if announcement is not None and announcement.is_current(source):
+            return announcement
+
+        if announcement is None and os.path.exists(path):
+            try:
+                announcement = Announcement(path)
+            except ValueError as e:
+                # e.g. cut short by a full disk, it is encoded again
+                self.log.warning(f'rebuilding {path}: {e}')
+            else:
+                if announcement.is_current(source):
+                    self.announcements[path] = announcement
+                    return announcement
+                announcement.close()
+
+        # announcements still in use by other calls are left to the
+        # garbage collector, their pages stay valid until released
+        self.announcements.pop(path, None)
+        self.build(source, codec, ptime)
+        announcement = Announcement(path)
+        self.announcements[path] = announcement
+        return announcement
+
+    def close(self):
+        for announcement in self.announcements.values():
+            announcement.close()
+        self.announcements = {}
+
+
+def _build(directory, source, payload_type, ptime):
+    store = AnnouncementStore(directory)
+    return store.build(source, CODECS[payload_type](), ptime)
+
+
+def build_directory(source, directory, codecs, ptime=20, jobs=None):
+    ''' convert every wave file in `source` for every codec in `codecs` in
+    parallel worker processes and return the written paths
+    '''
+    sources = [
+        os.path.join(source, name) for name in sorted(os.listdir(source))
+        if name.lower().endswith('.wav')
+        ]
+    os.makedirs(directory, exist_ok=True)
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = [
+            executor.submit(_build, directory, path, codec.payload_type, ptime)
+            for path in sources for codec in codecs
+            ]
+        return [future.result() for future in futures]
+
+
+def main(args=None):
+    names = {codec.name: codec for codec in CODECS.values()}
+    parser = argparse.ArgumentParser(
+        description='pre-encode a directory of announcements'
+        )
+    parser.add_argument('source', help='directory with wave files')
+    parser.add_argument('directory', help='store directory')
+    parser.add_argument(
+        '--codec', action='append', choices=sorted(names),
+        help='codec to encode for, may be given multiple times'
+        )
+    parser.add_argument('--ptime', type=int, default=20)
+    parser.add_argument('--jobs', type=int, default=None)
+    args = parser.parse_args(args)
+
+    codecs = [names[name]() for name in args.codec or sorted(names)]
+    for path in build_directory(
+            args.source, args.directory, codecs, args.ptime, args.jobs
+            ):
+        print(path)
+    return 0
+
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
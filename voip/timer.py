@@ -0,0 +1,218 @@
+''' hashed timer wheel
+
+all protocol timers (transaction retransmissions, registration refreshes,
+rtp pacing and call timeouts) are armed on a wheel instead of getting a
+thread or event loop handle each. inserting and cancelling a timer is O(1),
+every tick only looks at the timers of a single slot.
+
+the wheel is either driven by its own thread (`start`) or by an asyncio
+event loop (`attach`). callbacks run in the driving thread. an attached wheel
+only asks the loop for a tick while timers are pending, so an idle process
+does not wake up every few milliseconds. `loop_wheel` returns the wheel
+shared by everything running on a loop.
+'''
+import asyncio
+import logging
+import math
+import time
+import weakref
+from threading import Lock, Thread
+
+
+class TimerHandle():
+    ''' an armed timer, returned by `TimerWheel.call_at`
+    '''
+    __slots__ = ('wheel', 'deadline', 'callback', 'args', 'slot', 'rounds',
+        '_cancelled')
+
+    def __init__(self, wheel, deadline, callback, args):
+        self.wheel = wheel
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.slot = None
+        self.rounds = 0
+        self._cancelled = False
+
+    def cancel(self):
+        ''' disarm the timer, cancelling a fired timer does nothing
+        '''
+        # the driving thread may have taken it off its slot already
+        self._cancelled = True
+        self.wheel._remove(self)
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+
+class TimerWheel():
+    ''' a hashed timer wheel with `slots` slots of `tick` seconds
+    timers beyond one revolution are kept in their slot with a round count
+    '''
+    def __init__(self, tick=0.005, slots=4096, clock=time.monotonic):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.tick = tick
+        self.slots = [dict() for _ in range(slots)]
+        self.clock = clock
+        self.start_time = clock()
+        self.current = 0
+        self.count = 0
+        self.lock = Lock()
+        self.thread = None
+        # the loop is only referenced weakly, see loop_wheel
+        self._loop = None
+        self.ticking = False
+        self.running = False
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def loop(self):
+        ''' the event loop driving the wheel, if any
+        '''
+        return self._loop() if self._loop is not None else None
+
+    def _catch_up(self):
+        ''' skip the ticks an empty wheel slept through, holding the lock
+        '''
+        if not self.count:
+            target = math.floor((self.clock() - self.start_time) / self.tick)
+            self.current = max(self.current, target)
+
+    def call_at(self, deadline, callback, *args):
+        ''' call `callback(*args)` at the first tick after `deadline`
+        '''
+        handle = TimerHandle(self, deadline, callback, args)
+        with self.lock:
+            self._catch_up()
+            # deadlines on a tick boundary must not slip to the next tick
+            ticks = (deadline - self.start_time) / self.tick
+            target = math.ceil(ticks - 1e-6)
+            offset = max(target - self.current, 1)
+            index = (self.current + offset) % len(self.slots)
+            handle.rounds = (offset - 1) // len(self.slots)
+            handle.slot = self.slots[index]
+            handle.slot[handle] = None
+            self.count += 1
+            loop = self.loop if self.running else None
+            if loop is not None and not loop.is_closed() and not self.ticking:
+                # call_at may run in any thread, so the loop arms the tick
+                self.ticking = True
+                loop.call_soon_threadsafe(self._arm)
+        return handle
+
+    def call_later(self, delay, callback, *args):
+        ''' call `callback(*args)` after `delay` seconds
+        '''
+        return self.call_at(self.clock() + delay, callback, *args)
+
+    def _remove(self, handle):
+        with self.lock:
+            if handle.slot is not None:
+                del handle.slot[handle]
+                handle.slot = None
+                self.count -= 1
+
+    def advance(self, now=None):
+        ''' fire all timers which are due at `now`
+        returns the number of fired timers
+        '''
+        now = self.clock() if now is None else now
+        target = math.floor((now - self.start_time) / self.tick)
+        fired = 0
+        while self.current < target:
+            due = []
+            with self.lock:
+                self.current += 1
+                slot = self.slots[self.current % len(self.slots)]
+                for handle in list(slot):
+                    if handle.rounds:
+                        handle.rounds -= 1
+                        continue
+                    del slot[handle]
+                    handle.slot = None
+                    self.count -= 1
+                    due.append(handle)
+
+            for handle in due:
+                if handle._cancelled:
+                    continue
+                try:
+                    handle.callback(*handle.args)
+                except Exception:
+                    self.log.exception(f'timer callback {handle.callback}')
+            fired += len(due)
+        return fired
+
+    def next_tick(self):
+        ''' clock time of the next tick
+        '''
+        with self.lock:
+            self._catch_up()
+            return self.start_time + (self.current + 1) * self.tick
+
+    def start(self):
+        ''' drive the wheel from a background thread
+        '''
+        self.running = True
+        self.thread = Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            delay = self.next_tick() - self.clock()
+            if delay > 0:
+                time.sleep(delay)
+            self.advance()
+
+    def attach(self, loop):
+        ''' drive the wheel from an asyncio event loop
+        the loop has to use the same clock as the wheel
+        '''
+        with self.lock:
+            self.running = True
+            self._loop = weakref.ref(loop)
+            self.ticking = bool(self.count)
+        if self.ticking:
+            self._arm()
+
+    def _arm(self):
+        loop = self.loop
+        if self.running and loop is not None:
+            loop.call_at(self.next_tick(), self._loop_tick)
+
+    def _loop_tick(self):
+        if not self.running:
+            return
+        self.advance()
+        with self.lock:
+            self.ticking = self.count > 0
+        if self.ticking:
+            self._arm()
+
+    def stop(self):
+        ''' stop driving the wheel
+        '''
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self._loop = None
+        self.ticking = False
+
+
+_loop_wheels = weakref.WeakKeyDictionary()
+
+
+def loop_wheel(loop=None):
+    ''' the wheel shared by everything running on `loop`, by default the
+    running loop. it is attached on first use and lives as long as the loop
+    '''
+    loop = asyncio.get_running_loop() if loop is None else loop
+    wheel = _loop_wheels.get(loop)
+    if wheel is None:
+        wheel = _loop_wheels[loop] = TimerWheel()
+        wheel.attach(loop)
+    return wheel
@@ -0,0 +1,204 @@
+''' sip client transactions as described in rfc 3261 section 17.1
+
+a transaction is identified by the branch of its via header and the method
+of its CSeq header. responses are matched by both, so any number of
+transactions can share one socket. requests are retransmitted over udp
+until a response arrives and retransmitted responses are absorbed.
+'''
+import asyncio
+import logging
+
+from voip.sipmessage import SIPRequest
+from voip.metrics import REGISTRY
+
+RETRANSMISSIONS = REGISTRY.counter(
+    'sip_retransmissions_total', 'retransmitted requests', ('method',)
+    )
+TIMEOUTS = REGISTRY.counter(
+    'sip_transaction_timeouts_total', 'transactions without final response',
+    ('method',)
+    )
+
+# timer values in seconds
+T1 = 0.5
+T2 = 4.0
+T4 = 5.0
+
+
+def ack_for(request, response):
+    ''' create the ACK for a non 2xx final response to the INVITE `request`
+    it uses the branch of the INVITE and the To of the response
+    '''
+    ack = SIPRequest('ACK', request.server, port=request.port)
+    ack.headsip = request.headsip
+    for key in ('Via', 'From', 'Call-ID'):
+        ack.set(key, request.get(key))
+    ack.set('To', response.get('To'))
+    ack.set('CSeq', f'{request.get("CSeq").split(" ")[0]} ACK')
+    return ack
+
+
+def cancel_for(request):
+    ''' create the CANCEL for a pending INVITE `request`
+    '''
+    cancel = SIPRequest('CANCEL', request.server, port=request.port)
+    cancel.headsip = request.headsip
+    for key in ('Via', 'From', 'To', 'Call-ID'):
+        cancel.set(key, request.get(key))
+    cancel.set('CSeq', f'{request.get("CSeq").split(" ")[0]} CANCEL')
+    return cancel
+
+
+class ClientTransaction():
+    ''' a single client transaction
+    the transaction user awaits `response()` for every provisional and the
+    final response. if no final response arrives in time, TimeoutError is
+    raised (timer B/F).
+    '''
+    def __init__(self, protocol, request, addr=None):
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.protocol = protocol
+        self.request = request
+        self.addr = addr
+        self.method = request.function
+        self.key = (request.branch, self.method)
+        self.invite = self.method == 'INVITE'
+        self.state = 'calling' if self.invite else 'trying'
+        self.responses = asyncio.Queue()
+        self.provisional = set()
+        self.final = None
+        self.ack = None
+        self.interval = T1
+        self.wheel = protocol.wheel
+        self.retransmit_timer = None
+        self.timeout_timer = None
+
+    def start(self):
+        ''' send the request and arm timer A/E and B/F
+        '''
+        self.protocol.send(self.request, self.addr)
+        self.retransmit_timer = self.wheel.call_later(T1, self._retransmit)
+        self.timeout_timer = self.wheel.call_later(64 * T1, self._timeout)
+
+    def _retransmit(self):
+        ''' timer A/E fired
+        '''
+        if self.invite:
+            if self.state != 'calling':
+                return
+            self.interval *= 2
+        elif self.state == 'proceeding':
+            self.interval = T2
+        elif self.state == 'trying':
+            self.interval = min(self.interval * 2, T2)
+        else:
+            return
+        self.log.debug(f'retransmitting {self.method} {self.key[0]}')
+        RETRANSMISSIONS.labels(self.method).inc()
+        self.protocol.send(self.request, self.addr)
+        self.retransmit_timer = self.wheel.call_later(
+            self.interval, self._retransmit
+            )
+
+    def _timeout(self):
+        ''' timer B/F fired
+        '''
+        if self.invite and self.state != 'calling':
+            # timer B only runs until the first provisional response
+            return
+        self._expire()
+
+    def expire(self, delay):
+        ''' end the transaction with TimeoutError unless a final response
+        arrives within `delay` seconds, e.g. 64*T1 after the CANCEL of a
+        ringing INVITE (rfc 3261 section 9.1). 0 ends it right away.
+        '''
+        if self.final is not None or self.state == 'terminated':
+            return
+        if delay <= 0:
+            self._expire()
+            return
+        if self.timeout_timer is not None:
+            self.timeout_timer.cancel()
+        self.timeout_timer = self.wheel.call_later(delay, self._expire)
+
+    def _expire(self):
+        self.log.error(f'{self.method} transaction timed out')
+        TIMEOUTS.labels(self.method).inc()
+        self.responses.put_nowait(
+            TimeoutError(f'{self.method} transaction timed out')
+            )
+        self.terminate()
+
+    def receive(self, response):
+        ''' handle a response matched to this transaction
+        '''
+        code = response.code
+        if self.final is not None:
+            # retransmitted final response, acknowledge it again
+            if self.ack is not None:
+                self.protocol.send(self.ack, self.addr)
+            return
+
+        if code < 200:
+            if code in self.provisional:
+                return
+            self.provisional.add(code)
+            if self.invite and self.state == 'calling':
+                # a ringing INVITE waits for the transaction user to
+                # cancel it, timer B stops with the first provisional
+                if self.timeout_timer is not None:
+                    self.timeout_timer.cancel()
+                    self.timeout_timer = None
+            self.state = 'proceeding'
+            self.responses.put_nowait(response)
+            return
+
+        self.final = response
+        self._cancel()
+        if not self.invite:
+            # timer K
+            self.state = 'completed'
+            linger = T4
+        elif code >= 300:
+            # the transaction acknowledges failures itself, timer D
+            self.ack = ack_for(self.request, response)
+            self.protocol.send(self.ack, self.addr)
+            self.state = 'completed'
+            linger = 32
+        else:
+            # the transaction user sends the ACK for 2xx responses and
+            # sets it as `ack` to answer retransmissions, timer M
+            self.state = 'accepted'
+            linger = 64 * T1
+        self.timeout_timer = self.wheel.call_later(linger, self.terminate)
+        self.responses.put_nowait(response)
+
+    async def response(self):
+        ''' wait for the next response
+        '''
+        resp = await self.responses.get()
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+    async def final_response(self):
+        ''' wait for the final response, skipping provisional ones
+        '''
+        resp = await self.response()
+        while resp.code < 200:
+            resp = await self.response()
+        return resp
+
+    def _cancel(self):
+        for timer in (self.retransmit_timer, self.timeout_timer):
+            if timer is not None:
+                timer.cancel()
+        self.retransmit_timer = self.timeout_timer = None
+
+    def terminate(self):
+        ''' stop all timers and forget the transaction
+        '''
+        self._cancel()
+        self.state = 'terminated'
+        self.protocol.remove_transaction(self)
@@ -1,17 +1,25 @@
 import logging
 import socket
 import select
-from threading import Timer, Lock
 from voip.sipmessage import SIPMessage
+from voip.metrics import REGISTRY
+
+DATAGRAMS = REGISTRY.counter(
+    'udp_datagrams_total', 'datagrams of UDPClient', ('direction',)
+    )
+BYTES = REGISTRY.counter('udp_bytes_total', 'bytes of UDPClient', ('direction',))
+RECEIVED = (DATAGRAMS.labels('received'), BYTES.labels('received'))
+SENT = (DATAGRAMS.labels('sent'), BYTES.labels('sent'))
 
 class UDPClient():
-    def __init__(self, server, port, callback = None, buffersize=8196):
+    def __init__(self, server, port, callback = None, buffersize=8196,
+            sock=None):
         ''' initialize the udp client using `server` and `port`
-        additionally, if a callback is given, a thread is started which waits
-        until `buffersize` bytes are received.
-        callback gets received data as single parameter as in:
+        additionally, a callback can be given which is called by the Reactor
+        the client is attached to with the received bytes as in:
         def callback(self, data):
             print(data.encode('utf8')
+        an already bound `sock` is used instead of opening one
         '''
         self.log = logging.getLogger(self.__class__.__name__)
         self.server = server
@@ -19,22 +27,29 @@ class UDPClient():
         self.__callback = callback
         self.buffersize = buffersize
         self.ip = "0.0.0.0"
-        self.socket = None
-
-        # if a callback is given run a receive task
-        if callback is not None:
-            self.t = Timer(1, self.__receive)
+        self.socket = sock
+        self.reactor = None
 
-    def __receive(self):
-        ''' receive function which constantly waits for data and calls
-        the callback function
+    def attach(self, reactor, callback=None):
+        ''' receive on the socket with a Reactor instead of blocking in
+        `recv`. the callback is called with the received bytes, a handler
+        taking the reactor's memoryview and the sender's address can be
+        registered with the reactor directly instead.
         '''
-        while True:
-            try:
-                data = self.recv(self.buffersize)
-                self.__callback(data)
-            except:
-                pass
+        callback = callback if callback is not None else self.__callback
+
+        def handler(data, address):
+            RECEIVED[0].inc()
+            RECEIVED[1].inc(len(data))
+            callback(bytes(data))
+
+        self.reactor = reactor
+        return reactor.register(self.socket, handler)
+
+    def detach(self):
+        if self.reactor is not None:
+            self.reactor.unregister(self.socket)
+            self.reactor = None
 
     def open(self):
         ''' open udp connection
@@ -48,6 +63,7 @@ class UDPClient():
         ''' close socket
         '''
         self.log.debug('closing socket')
+        self.detach()
         if self.socket is not None:
             self.socket.close()
             self.socket = None
@@ -58,7 +74,10 @@ class UDPClient():
         ready = select.select([self.socket], [], [], timeout)
         if ready[0]:
             retval = self.socket.recv(buffersize)
-            self.log.debug(f'RECEIVED\n====\n{retval.decode()}====\n')
+            RECEIVED[0].inc()
+            RECEIVED[1].inc(len(retval))
+            if self.log.isEnabledFor(logging.DEBUG):
+                self.log.debug(f'RECEIVED\n====\n{retval.decode()}====\n')
             return retval
         else:
             self.log.error('receive timeout')
@@ -67,15 +86,27 @@ class UDPClient():
     def send(self, text):
         ''' send data
         '''
-        self.log.debug(f'SENDING\n====\n{str(text)}====\n')
-        self.socket.sendto(str(text).encode(),(self.server, self.port))
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug(f'SENDING\n====\n{str(text)}====\n')
+        data = str(text).encode()
+        SENT[0].inc()
+        SENT[1].inc(len(data))
+        self.socket.sendto(data,(self.server, self.port))
 
     def write(self, data):
         ''' send data
         '''
-        self.log.debug(f'SENDING {len(data)}bytes\n')
+        SENT[0].inc()
+        SENT[1].inc(len(data))
         self.socket.sendto(data,(self.server, self.port))
 
+    def writev(self, buffers):
+        ''' send several buffers as one datagram without joining them
+        '''
+        size = self.socket.sendmsg(buffers, [], 0, (self.server, self.port))
+        SENT[0].inc()
+        SENT[1].inc(size)
+
     def do_request(self, text):
         ''' send a text and wait for return value as raw
         '''
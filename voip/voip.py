@@ -21,228 +21,698 @@
 #  MA 02110-1301, USA.
 #
 #
+import asyncio
+import collections
 import hashlib
-from datetime import datetime
+import logging
+import time
+import uuid
+from threading import Thread
 
 # TODO: Threading mit Lock implementieren
 
 from voip.sipmessage import *
 from voip.udp import UDPClient
+from voip.aio import open_transport
+from voip.transaction import T1
+from voip.auth import CredentialCache, Nonce
+from voip.sipparser import Address
+from voip.wire import Templates
+from voip.rtp import RTPPacketizer, RTPSender
+from voip.receiver import JitterBuffer, RTPReceiver
+from voip.resample import ConvertedSource, matches
+from voip.rtcp import RTCPSession
+from voip.recorder import CallRecorder
+from voip.sdp import Session, negotiate, offer
+from voip.ports import PortPool, local_address
+from voip.metrics import REGISTRY
+
+REGISTRATIONS = REGISTRY.counter(
+    'sip_registrations_total', 'registrations by result', ('result',)
+    )
+REGISTER_TIME = REGISTRY.histogram(
+    'sip_register_seconds', 'time to complete a registration'
+    )
+CHALLENGES = REGISTRY.counter(
+    'sip_challenges_total', 'requests answered with an authentication '
+    'challenge', ('method', 'code')
+    )
+CALLS = REGISTRY.counter('sip_calls_total', 'calls by result', ('result',))
+CALL_SETUP = REGISTRY.histogram(
+    'sip_call_setup_seconds', 'time from the first INVITE to the first '
+    'response with a code', ('code',)
+    )
+
+# payloads of the outbound leg kept for the recorder, a sender running
+# ahead of the recording loses the oldest
+RECORD_BACKLOG = 50
 
 
 class VoIPCall():
     ''' this is the call object
+    `sdpconfig` is the session description of the remote side, `media` is
+    the PortPair of the call. without it a socket is bound to the remote
+    rtp port.
     '''
-    def __init__(self, sdpconfig):
+    def __init__(self, sdpconfig, ptime=20, media=None, codecs=None):
         self.sdpconfig = sdpconfig
-        self.config = { 'attrib' : {}}
-        self.__currentmedia = 'attrib'
-
-        # a function lookup prevents big if-elifififififs
-        functions = {
-            'm' : self.add_media,
-            'v' : self.set_version,
-            'a' : self.set_attributes,
-            's' : self.set_session,
-            'o' : self.set_origin,
-            }
-        # read every line
-        for line in self.sdpconfig.splitlines():
-            param, value = line.split('=')
-            if param in functions:
-                functions[param](value.split(' '))
-
-        # todo open udp socket
+        self.media = media
+        self.sender = None
+        self.receiver = None
+        self.stream = None
+        self.scheduler = None
+        self.reactor = None
+        self.rtcp = None
+        self.recorder = None
+        self.record_timer = None
+        # payloads handed out to the remote side, taken by the recorder
+        self.outbound = collections.deque(maxlen=RECORD_BACKLOG)
+        # rtcp summary of the call after the hangup
+        self.quality = None
+        self.sdp = Session.parse(sdpconfig)
+        self.audio = self.sdp.audio
+        if self.audio is None:
+            raise ValueError('session description without audio')
+        self.ptime = self.audio.ptime \
+            if self.audio.ptime in RTPPacketizer.PTIMES else ptime
+        self.direction = self.sdp.direction_of(self.audio)
+
+        # pick the codec from the remote side's preference
+        supported = negotiate(self.audio, codecs)
+        if supported:
+            self._payload_type, self.codec = supported[0]
+            self.codec = self.codec()
+        else:
+            self._payload_type, self.codec = None, None
+
         self.client = UDPClient(
-            self.config['origin'][-1],
-            self.config['audio']['port']
+            self.sdp.address(self.audio),
+            self.audio.port,
+            sock=media.rtp if media is not None else None
             )
         self.client.open()
 
-    def add_media(self, values):
-        ''' add media information
+    @property
+    def payload_type(self):
+        ''' payload type of the selected codec, or the first audio format
+        offered by the remote side if none is supported
         '''
-        mtype = values.pop(0)
-        config = {
-            'port' : int(values.pop(0)),
-            'prot' : values.pop(0),
-            'formates' : values,
-            }
-        self.config[mtype] = config
-        # this is for configuring media attributes
-        self.__currentmedia = mtype
+        if self._payload_type is not None:
+            return self._payload_type
+        return self.audio.payload_types[0]
 
-    def set_version(self, values):
-        self.version = int(values[0])
+    def play(self, data, sampwidth=2):
+        ''' encode linear pcm with the negotiated codec and send it
+        '''
+        if self.codec is None:
+            raise ValueError('no supported codec negotiated')
+        return self.send_raw(self.codec.encode(data, sampwidth))
+
+    def send_raw(self, data):
+        ''' send encoded audio in real time as rtp packets
+        returns the pacing statistics of the stream
+        '''
+        return self.get_sender().send(data)
 
-    def set_attributes(self,values):
-        # append attributes to
-        config = self.config[self.__currentmedia]
-        pass
+    def play_announcement(self, announcement):
+        ''' send a pre-encoded announcement from an `AnnouncementStore`
+        '''
+        if announcement.payload_type != self.payload_type or \
+                announcement.ptime != self.ptime:
+            raise ValueError(f'{announcement} does not match the call')
+        return self.get_sender().send_frames(announcement.frames)
+
+    def start_raw(self, data, wheel, done=None):
+        ''' like `send_raw`, but paced by timers on `wheel` without
+        blocking. `done` is called with the pacing statistics at the end
+        '''
+        sender = self.get_sender()
+        sender.start(
+            wheel, sender.packetizer.packets(data), self.client.write, done
+            )
 
-    def set_session(self,values):
-        self.config['session'] = ' '.join(values)
+    def start_announcement(self, announcement, wheel, done=None):
+        ''' like `play_announcement`, but paced by timers on `wheel`
+        '''
+        if announcement.payload_type != self.payload_type or \
+                announcement.ptime != self.ptime:
+            raise ValueError(f'{announcement} does not match the call')
+        sender = self.get_sender()
+        sender.start(
+            wheel, sender.packetizer.frames(announcement.frames),
+            self.client.writev, done
+            )
 
-    def set_origin(self,values):
-        self.config['origin'] = values
-        pass
+    def stream_raw(self, data, scheduler, done=None):
+        ''' like `start_raw`, but paced by a MediaScheduler together with
+        the streams of other calls
+        '''
+        packetizer = self.get_sender().packetizer
+        return self._schedule(scheduler, packetizer.packets(data), done)
 
-    def send_raw(self, data):
-        self.client.write(data)
+    def stream_announcement(self, announcement, scheduler, done=None):
+        ''' like `start_announcement`, but paced by a MediaScheduler
+        '''
+        if announcement.payload_type != self.payload_type or \
+                announcement.ptime != self.ptime:
+            raise ValueError(f'{announcement} does not match the call')
+        packetizer = self.get_sender().packetizer
+        return self._schedule(
+            scheduler, packetizer.frames(announcement.frames), done
+            )
+
+    def play_source(self, source):
+        ''' send the linear pcm of a media source like a WaveSource or
+        Playlist in real time, it is converted to the codec's clock rate if
+        needed and encoded frame by frame
+        '''
+        return self.get_sender().send_frames(self._encoded(source))
+
+    def stream_source(self, source, scheduler, done=None):
+        ''' like `play_source`, but paced by a MediaScheduler
+        '''
+        packetizer = self.get_sender().packetizer
+        return self._schedule(
+            scheduler, packetizer.frames(self._encoded(source)), done
+            )
+
+    def _encoded(self, source):
+        if self.codec is None:
+            raise ValueError('no supported codec negotiated')
+        if not matches(source, self.codec.clockrate) or \
+                source.ptime != self.ptime:
+            source = ConvertedSource(source, self.codec.clockrate, self.ptime)
+        return source.encoded(self.codec)
+
+    def _schedule(self, scheduler, packets, done):
+        if self.stream is not None:
+            self.scheduler.remove(self.stream)
+        self.scheduler = scheduler
+        self.stream = scheduler.add(
+            self.client.socket, (self.client.server, self.client.port),
+            packets, self.ptime, done
+            )
+        return self.stream
+
+    def receive(self, reactor, rtp=None, rtcp=None):
+        ''' dispatch the media received by the call with `reactor`
+        `rtp` and `rtcp` are handlers taking the datagram as memoryview and
+        the sender's address, rtcp needs the PortPair of the call. rtp goes
+        to the RTPReceiver of the call by default.
+        '''
+        self.reactor = reactor
+        rtp = rtp if rtp is not None else self.get_receiver()
+        reactor.register(self.client.socket, rtp, 'rtp')
+        if rtcp is not None and self.media is not None:
+            reactor.register(self.media.rtcp, rtcp, 'rtcp')
+
+    def start_rtcp(self, reactor, wheel, cname):
+        ''' send rtcp reports from the rtcp socket of the call's PortPair
+        with timers on `wheel` and receive the remote reports on `reactor`
+        '''
+        if self.media is None:
+            raise ValueError('rtcp needs the PortPair of the call')
+        port = self.audio.port + 1
+        for name, value in self.audio.attributes:
+            # rfc 3605 rtcp attribute
+            if name == 'rtcp' and value.split()[0].isdigit():
+                port = int(value.split()[0])
+        sender = self.get_sender()
+        self.rtcp = RTCPSession(
+            self.media.rtcp, (self.client.server, port),
+            sender.packetizer.ssrc, cname, self.get_receiver(),
+            sender.packetizer
+            )
+        if self.reactor is None:
+            self.receive(reactor)
+        reactor.register(self.media.rtcp, self.rtcp, 'rtcp')
+        self.rtcp.start(wheel)
+        return self.rtcp
+
+    def record(self, path, wheel, stereo=True):
+        ''' record the call to the wave file `path` until the hangup
+        every packet interval a timer on `wheel` takes the next frame from
+        the jitter buffer of the receiver and the last payload handed out by
+        the sender and writes both legs, decoded to linear pcm
+        '''
+        if self.codec is None:
+            raise ValueError('no supported codec negotiated')
+        if self.recorder is not None:
+            raise ValueError('the call is already recorded')
+        self.recorder = CallRecorder(path, stereo, self.codec.clockrate)
+        self.get_receiver()
+        self.get_sender().packetizer.monitor = self._monitor
+        deadline = wheel.next_tick()
+        self.record_timer = wheel.call_at(
+            deadline, self._record, wheel, deadline
+            )
+        return self.recorder
+
+    def _monitor(self, payload):
+        # the payload is a view of a reused buffer
+        self.outbound.append(bytes(payload))
+
+    def _record(self, wheel, deadline):
+        if self.recorder is None:
+            return
+        outbound = self.codec.decode(self.outbound.popleft()) \
+            if self.outbound else None
+        self.recorder.tick(self.receiver, self.codec, outbound)
+        deadline += self.ptime / 1000
+        self.record_timer = wheel.call_at(
+            deadline, self._record, wheel, deadline
+            )
+
+    def get_sender(self):
+        ''' the rtp sender of the call, created on first use
+        '''
+        if self.sender is None:
+            packetizer = RTPPacketizer(self.payload_type, ptime=self.ptime)
+            self.sender = RTPSender(self.client, packetizer)
+        return self.sender
+
+    def get_receiver(self, callback=None):
+        ''' the rtp receiver of the call, created on first use
+        '''
+        if self.receiver is None:
+            clockrate = self.codec.clockrate if self.codec is not None \
+                else 8000
+            samples = self.ptime * clockrate // 1000
+            buffer = JitterBuffer(
+                size=max(640, 2 * samples), samples=samples,
+                clockrate=clockrate
+                )
+            self.receiver = RTPReceiver(
+                buffer, (self.payload_type,), callback
+                )
+        return self.receiver
 
     def hangup(self):
-        self.client.close()
+        if self.stream is not None:
+            self.scheduler.remove(self.stream)
+            self.stream = None
+        if self.recorder is not None:
+            self.record_timer.cancel()
+            self.record_timer = None
+            self.sender.packetizer.monitor = None
+            self.recorder.close()
+            self.recorder = None
+        if self.rtcp is not None:
+            self.rtcp.stop()
+            self.quality = self.rtcp.summary()
+            self.rtcp.observe(self.quality)
+            self.rtcp = None
+        if self.reactor is not None:
+            self.reactor.unregister(self.client.socket)
+            if self.media is not None:
+                self.reactor.unregister(self.media.rtcp)
+            self.reactor = None
+        if self.media is not None:
+            # the socket belongs to the port pool
+            self.client.socket = None
+            self.media.release()
+            self.media = None
+        else:
+            self.client.close()
 
 
-class VoIP(UDPClient):
-    ''' this is the voice over ip class
+class SIPError(Exception):
+    ''' raised if the server answers with an unexpected response
+    '''
+    def __init__(self, response, text=None):
+        self.response = response
+        text = text if text is not None else 'Unexpected Response Code'
+        super().__init__(f'{text} {response.code} {response.message}')
+
+
+class AsyncVoIP():
+    ''' this is the asyncio voice over ip class
+    any number of instances can share one `SIPProtocol` and event loop.
+    requests carry cached `credentials` up front once the server challenged
+    a request. media sockets of calls are taken from the PortPool `ports`.
     '''
     def __init__(self,
         server, user, password, port=5060,
-        proxy=None, callback=None):
+        proxy=None, callback=None, protocol=None, credentials=None,
+        ports=None):
         ''' initialize the voip object
         '''
-        super().__init__(server, port, callback)
-
+        self.log = logging.getLogger(self.__class__.__name__)
+        self.server = server
+        self.port = port
         self.user = user
         self.password = password
         self.proxy = proxy
+        self.callback = callback
+        self.protocol = protocol
+        self._own_protocol = protocol is None
+        self.credentials = credentials if credentials is not None \
+            else CredentialCache()
+        self.ports = ports if ports is not None else PortPool()
+        self._own_ports = ports is None
+        self.address = None
         self.call_id = self._gen_callid()
+        self.cseq = 0
+        self.refresh_timer = None
+        # requests are rendered from templates compiled for this account
+        self.templates = Templates(server, self.caller_id, port)
 
-    def sip_request(self, request):
-        ''' creates a request and responds a SIPMessage
+    async def open(self):
+        ''' open the sip transport unless a shared one was given
         '''
-        retval = self.do_request(request)
-        return SIPMessage.from_text(self.server.encode('utf8'), retval)
-
-    def connect(self):
-        ''' connect to server and authentify
-        '''
-        self.open()
-        # send register request
-        register = Register(self.server, self.caller_id, self.call_id)
-        resp = self.sip_request(register)
-
-        if resp.code == 401:
-            # generate authentication response
-            self.log.debug('Unauthorized as expected')
-            register.set_sequence(2)
-            register.set_to(resp.get('To'))
-            auth = resp.get('WWW-Authenticate')
-            method = resp.get('CSeq')[1]
-            values = get_values(auth[1])
-            register.set(
-                'Authorization',
-                self.gen_authorization(values,method)
+        if self.protocol is None:
+            self.protocol = await open_transport(
+                self.server, self.port, callback=self.callback
                 )
 
-            resp = self.sip_request(register)
-            if resp.code != 200:
-                raise(
-                    f'authentication got returnval {resp.code} {resp.message}'
-                    )
-
-        elif resp.code == 407:
-            # generate proxy authentication response
-            raise(f'proxy authenticate not yet implemented')
+    def close(self):
+        ''' close the sip transport if it is owned by this object
+        '''
+        if self.refresh_timer is not None:
+            self.refresh_timer.cancel()
+            self.refresh_timer = None
+        if self._own_protocol and self.protocol is not None:
+            self.protocol.close()
+            self.protocol = None
+        if self._own_ports:
+            self.ports.close()
+
+    async def sip_request(self, request):
+        ''' send a request and wait for its final response
+        '''
+        return await self.protocol.request(request).final_response()
 
+    def preauthorize(self, request, method):
+        ''' add the cached credentials for the server to `request`
+        '''
+        for nonce in self.credentials.preemptive(self.server):
+            request.set(nonce.header, self.credentials.authorization(
+                nonce, self.user, self.password, method, self.digest_uri
+                ))
+
+    def authorize(self, request, resp):
+        ''' prepare `request` to be sent again with credentials for the
+        challenge in `resp`
+        returns False if the credentials of `request` were rejected
+        '''
+        cseq = resp.cseq
+        CHALLENGES.labels(cseq.method, str(resp.code)).inc()
+        if resp.code == 407:
+            header = 'Proxy-Authenticate'
         else:
-            raise(f'Unexpected Response Code {resp.code} {resp.message}')
+            header = 'WWW-Authenticate'
+        nonce, retry = self.credentials.challenge(
+            self.server, header, resp.get(header), request
+            )
+        if not retry:
+            return False
+        request.new_branch()
+        request.set_sequence(cseq.number + 1)
+        self.preauthorize(request, cseq.method)
+        return True
+
+    async def register(self, expires=None):
+        ''' register once for `expires` seconds, 0 removes the registration
+        returns the expiry granted by the server
+        '''
+        await self.open()
+        started = time.monotonic()
+        self.cseq += 1
+        register = self.templates.register(
+            self.call_id, self.cseq, 30 if expires is None else expires
+            )
+        self.preauthorize(register, 'REGISTER')
+        try:
+            resp = await self.sip_request(register)
+            if resp.code in (401, 407):
+                self.log.debug('Unauthorized as expected')
+                register.set('To', resp.get('To'))
+                if not self.authorize(register, resp):
+                    raise SIPError(resp, 'credentials rejected')
+                self.cseq += 1
+                resp = await self.sip_request(register)
+                if resp.code != 200:
+                    raise SIPError(resp, 'authentication got returnval')
+            elif resp.code != 200:
+                raise SIPError(resp)
+        except SIPError:
+            REGISTRATIONS.labels('rejected').inc()
+            raise
+        except Exception:
+            REGISTRATIONS.labels('error').inc()
+            raise
+        REGISTRATIONS.labels('registered').inc()
+        REGISTER_TIME.observe(time.monotonic() - started)
+
+        # the server may list the bindings of other clients as well
+        for contact in resp.get_all('Contact'):
+            address = Address(contact)
+            granted = address.params.get('expires')
+            if address.uri == self.contact_uri and granted is not None \
+                    and granted.isdigit():
+                return int(granted)
+        return int(resp.get('Expires', register.get('Expires')))
+
+    async def connect(self):
+        ''' connect to server and authentify
+        the registration is refreshed before it expires
+        '''
+        expires = await self.register()
+        if self.refresh_timer is not None:
+            self.refresh_timer.cancel()
+        self.refresh_timer = self.protocol.wheel.call_later(
+            expires * 0.9, self._refresh
+            )
 
-    def call(self, number):
-        ''' call a number
+    def _refresh(self):
+        ''' refresh timer fired, register again
         '''
-        # call the number first
-        invite = Invite(self.server, self.caller_id, self.call_id, number)
-        resp = self.sip_request(invite)
-        # response can be one of those
-        if resp.code == 401: # authorization
-            invite.set_sequence(int (resp.get('CSeq')[0]) +1)
-            auth = resp.get('WWW-Authenticate')
-            method = resp.get('CSeq')[1]
-            values = get_values(auth[1])
-            invite.set(
-                'Authorization',
-                self.gen_authorization(values,method)
-                )
-            resp = self.sip_request(invite)
-
-        elif resp.code == 407: #proxy authenticate
-            invite.set_sequence(int (resp.get('CSeq')[0]) +1)
-            auth = resp.get('Proxy-Authenticate')
-            method = resp.get('CSeq')[1]
-            values = get_values(auth[1])
-            invite.set(
-                'Authorization',
-                self.gen_authorization(values,method)
-                )
-            resp = self.sip_request(invite)
+        self.refresh_timer = None
+        task = asyncio.ensure_future(self.connect())
+        task.add_done_callback(self._refreshed)
+
+    def _refreshed(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            self.log.error(f'registration refresh failed: {task.exception()}')
+
+    def _cancel_invite(self, transaction):
+        ''' call timeout fired, cancel the INVITE if it is still ringing
+        a CANCEL may only be sent after a provisional response, an INVITE
+        without one is ended locally and its call raises TimeoutError
+        '''
+        if transaction.final is not None:
+            return
+        if transaction.provisional:
+            self.log.debug('call timed out, cancelling')
+            self.protocol.request(self.templates.cancel(transaction.request))
+            # the 487 may never come, then the INVITE is given up after
+            # 64*T1 as well (rfc 3261 section 9.1)
+            transaction.expire(64 * T1)
         else:
-            raise(f'Unexpected Response Code {resp.code} {resp.message}')
-
-        # wait until it has been received or hung up
-        while resp.code in [100,183,401]:
-            retval = self.recv(self.buffersize)
-            resp = SIPMessage.from_text(self.server.encode('utf8'), retval)
-
-        # if call is received, send ack
-        if resp.code == 200:
-            ack = Ack(
-                self.server,
-                self.caller_id,
-                self.call_id,
-                number,
-                int(resp.get('CSeq')[0])
-                )
-            self.send(ack)
-            call = VoIPCall(resp.content)
-            return call
+            self.log.debug('call timed out without provisional response')
+            transaction.expire(0)
 
-        return None
-
-    def hangup(self, call):
-        pass
+    async def invite(self, invite, timeout, started, seen):
+        ''' send an INVITE and wait for the final response
+        the time from `started` to every response code not `seen` yet is
+        recorded
+        '''
+        transaction = self.protocol.request(invite)
+        timer = self.protocol.wheel.call_later(
+            timeout, self._cancel_invite, transaction
+            )
+        try:
+            while True:
+                resp = await transaction.response()
+                if resp.code not in seen:
+                    seen.add(resp.code)
+                    CALL_SETUP.labels(str(resp.code)).observe(
+                        time.monotonic() - started
+                        )
+                if resp.code >= 200:
+                    return transaction, resp
+        finally:
+            timer.cancel()
+
+    async def call(self, number, timeout=180):
+        ''' call a number and return the established call or None
+        if the call is not answered within `timeout` seconds, it is cancelled.
+        TimeoutError is raised if there was no provisional response to
+        cancel or the CANCEL got no final response within 64*T1
+        '''
+        call_id = self._gen_callid()
+        invite = self.templates.invite(call_id, number)
+        media = self.ports.acquire()
+        invite.set('Content-Type', 'application/sdp')
+        invite.set_content(offer(self.media_address, media.port))
+        self.preauthorize(invite, 'INVITE')
+        started = time.monotonic()
+        seen = set()
+        try:
+            transaction, resp = await self.invite(
+                invite, timeout, started, seen
+                )
+            if resp.code in (401, 407) and self.authorize(invite, resp):
+                transaction, resp = await self.invite(
+                    invite, timeout, started, seen
+                    )
+        except Exception:
+            CALLS.labels('error').inc()
+            media.release()
+            raise
+
+        if resp.code != 200:
+            CALLS.labels('rejected').inc()
+            media.release()
+            return None
+        CALLS.labels('answered').inc()
+
+        # if call is received, send ack. retransmitted 200s are answered
+        # by the transaction
+        # the ACK carries the To tag of the 2xx to match the dialog
+        cseq = resp.cseq.number
+        ack = self.templates.ack(call_id, number, cseq, to=resp.get('To'))
+        transaction.ack = ack
+        self.protocol.send(ack)
+
+        try:
+            call = VoIPCall(resp.content, media=media)
+        except Exception:
+            media.release()
+            raise
+        call.call_id = call_id
+        call.number = number
+        call.to = resp.get('To')
+        call.cseq = cseq
+        return call
+
+    async def hangup(self, call):
+        ''' end the dialog of `call` and close its media
+        '''
+        bye = self.templates.bye(
+            call.call_id, call.number, call.cseq + 1, call.to
+            )
+        try:
+            resp = await self.sip_request(bye)
+            if resp.code != 200:
+                self.log.warning(f'hangup got {resp.code} {resp.message}')
+        finally:
+            call.hangup()
 
     def _gen_callid(self):
         ''' generate call identifier
         '''
-        callid = (self.caller_id + str(datetime.now())).encode('utf8')
+        callid = (self.caller_id + uuid.uuid4().hex).encode('utf8')
         return hashlib.md5(callid).hexdigest()
 
     def gen_authorization(self, auth, method):
-        ''' generate authorization field
-        '''
-        self.log.debug(f'Generating authentication Digest')
-        self.log.debug(f'usthing auth: {auth}')
-        self.log.debug(f'using method: {method}')
-
-        # get neccessary information
-        realm=auth.get("realm")
-        nonce=auth.get("nonce")
-        sipuri=f'sip:{self.server};transport=UDP'
-
-        # generate hashes
-        ha1str = f'{self.user}:{realm}:{self.password}'
-        HA1 = hashlib.md5(ha1str.encode('utf8')).hexdigest()
-        ha2str = f'{method}:{self.digest_uri}'
-        HA2 = hashlib.md5(ha2str.encode('utf8')).hexdigest()
-        rspstr = f'{HA1}:{nonce}:{HA2}'
-        response= hashlib.md5(rspstr.encode('utf8')).hexdigest()
-
-        # generate digest string
-        s = f'Digest username="{self.user}",realm="{realm}",' + \
-            f'nonce="{nonce}",uri="{sipuri}",' + \
-            f'response="{response}",algorithm=MD5'
-        return s
+        ''' generate authorization field for the challenge values `auth`
+        '''
+        nonce = Nonce('Authorization', auth)
+        return self.credentials.authorization(
+            nonce, self.user, self.password, method, self.digest_uri
+            )
 
     @property
     def caller_id(self):
         ''' return caller id
         '''
-        return f'"{self.user}" <sip:{self.user}@{self.server}>'
+        return f'"{self.user}" <{self.contact_uri}>'
+
+    @property
+    def media_address(self):
+        ''' the address advertised for media
+        '''
+        if self.address is None:
+            self.address = self.ports.address
+            if self.address == '0.0.0.0':
+                self.address = local_address(self.server, self.port)
+        return self.address
+
+    @property
+    def contact_uri(self):
+        return f'sip:{self.user}@{self.server}'
 
     @property
     def digest_uri(self):
         ''' generate server uri for digest
         '''
         return f'sip:{self.server};transport=UDP'
+
+
+class VoIP():
+    ''' this is the voice over ip class
+    a synchronous wrapper which runs the coroutines of an AsyncVoIP on its
+    own event loop. the loop runs in a background thread, so the
+    registration is refreshed between the calls as well. the `callback` is
+    called from that thread. other attributes are the ones of the wrapped
+    AsyncVoIP `voip`.
+    '''
+    def __init__(self,
+        server, user, password, port=5060,
+        proxy=None, callback=None, credentials=None):
+        ''' initialize the voip object
+        '''
+        self.voip = AsyncVoIP(
+            server, user, password, port,
+            proxy=proxy, callback=callback, credentials=credentials
+            )
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def __getattr__(self, name):
+        # only called for names the wrapper does not have itself
+        if name == 'voip':
+            raise AttributeError(name)
+        return getattr(self.voip, name)
+
+    def _run(self, coroutine):
+        ''' run `coroutine` on the event loop and wait for its result
+        '''
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def open(self):
+        ''' open the sip transport
+        '''
+        return self._run(self.voip.open())
+
+    def sip_request(self, request):
+        ''' send a request and wait for its final response
+        '''
+        return self._run(self.voip.sip_request(request))
+
+    def register(self, expires=None):
+        ''' register once for `expires` seconds, 0 removes the registration
+        '''
+        return self._run(self.voip.register(expires))
+
+    def connect(self):
+        ''' connect to server and authentify
+        '''
+        return self._run(self.voip.connect())
+
+    def call(self, number, timeout=180):
+        ''' call a number
+        '''
+        return self._run(self.voip.call(number, timeout))
+
+    def hangup(self, call):
+        ''' hang up a call
+        '''
+        return self._run(self.voip.hangup(call))
+
+    async def _close(self):
+        self.voip.close()
+        # let the transport finish closing
+        await asyncio.sleep(0)
+
+    def close(self):
+        ''' close connection and the event loop
+        '''
+        if self.loop.is_closed():
+            return
+        self._run(self._close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
@@ -0,0 +1,312 @@
+''' precompiled wire templates for sip requests
+
+building a SIPRequest sets every header through a dict, draws a uuid for
+the branch and `generate` concatenates the message and type checks every
+value before it gets encoded. the templates here are compiled once per
+account and method: the request line, static headers and account values
+like From and Contact are encoded in advance, only branch, Call-ID, CSeq,
+To, extra headers like Authorization and the body are filled into the
+bytes on rendering.
+
+the rendered messages are the same as the ones of the SIPRequest classes.
+`response` renders the answer to a received request.
+'''
+import itertools
+import os
+
+from voip.sipmessage import SIPMessage
+
+USER_AGENT = 'T3cPh0n3 0.1'
+ALLOW = 'INVITE, ACK, BYE, CANCEL'
+REASONS = {
+    100: 'Trying',
+    180: 'Ringing',
+    183: 'Session Progress',
+    200: 'OK',
+    401: 'Unauthorized',
+    403: 'Forbidden',
+    405: 'Method Not Allowed',
+    407: 'Proxy Authentication Required',
+    480: 'Temporarily Unavailable',
+    481: 'Call/Transaction Does Not Exist',
+    486: 'Busy Here',
+    487: 'Request Terminated',
+    503: 'Service Unavailable',
+    }
+
+# branches are unique per process by the random prefix and per request by
+# a counter, which is cheaper than a uuid per request
+_BRANCH_PREFIX = f'z9hG4bKt3c{os.urandom(5).hex()}'
+_branches = itertools.count()
+
+
+def new_branch():
+    return f'{_BRANCH_PREFIX}{next(_branches):015x}'
+
+
+class RequestTemplate():
+    ''' the wire form of a request method with fixed and variable headers
+    `headers` are (name, value) pairs in wire order, a value of None marks
+    a slot which is filled on rendering. Via and CSeq are always slots.
+    '''
+    def __init__(self, method, headers, userip='0.0.0.0', port=5060):
+        self.method = method
+        self.via = f'SIP/{SIPMessage.SIPVERSION}/UDP {userip}:{port};' + \
+            'branch={};rport'
+        self.static = {}
+        # names of the slots in wire order
+        self.slots = []
+        parts = [f'{method} sip:%b SIP/{SIPMessage.SIPVERSION}\r\n']
+        for name, value in headers:
+            if name == 'Via':
+                parts.append('Via: ' + escape(self.via).format('%b') + '\r\n')
+            elif name == 'CSeq':
+                parts.append(f'CSeq: %b {method}\r\n')
+            elif value is not None:
+                parts.append(f'{name}: {escape(str(value))}\r\n')
+                self.static[name] = str(value)
+                continue
+            else:
+                parts.append(f'{name}: %b\r\n')
+            self.slots.append(name)
+        # extra headers, content length and body
+        parts.append('%bContent-Length: %d\r\n\r\n%b')
+        self.template = ''.join(parts).encode('utf8')
+
+    def render(self, request):
+        ''' the bytes of `request`, a WireRequest of this template
+        '''
+        args = [request.uri.encode('utf8')]
+        values = request.values
+        for name in self.slots:
+            if name == 'Via':
+                args.append(request.branch.encode('utf8'))
+            elif name == 'CSeq':
+                args.append(b'%d' % request.cseq)
+            else:
+                args.append(values[name].encode('utf8'))
+        if request.extra:
+            args.append(''.join(
+                f'{name}: {value}\r\n' for name, value in request.extra.items()
+                ).encode('utf8'))
+        else:
+            args.append(b'')
+        body = request.body.encode('utf8') if request.body else b''
+        args.append(len(body))
+        args.append(body)
+        return self.template % tuple(args)
+
+
+def escape(text):
+    return text.replace('%', '%%')
+
+
+def response(msg, code, headers=(), body=b'', tag=None, server=USER_AGENT):
+    ''' the bytes of the response `code` to the received request `msg`
+    `tag` is added to To unless it has one, `headers` are extra lines
+    '''
+    to = msg.get('To', '')
+    if tag is not None and ';tag=' not in to:
+        to += f';tag={tag}'
+    lines = [f'SIP/2.0 {code} {REASONS.get(code, "Unknown")}']
+    lines += [f'Via: {via}' for via in msg.get_all('Via')]
+    lines += [
+        f'From: {msg.get("From", "")}',
+        f'To: {to}',
+        f'Call-ID: {msg.get("Call-ID", "")}',
+        f'CSeq: {msg.get("CSeq", "")}',
+        f'Server: {server}',
+        ]
+    lines += headers
+    if body:
+        lines.append('Content-Type: application/sdp')
+    lines.append(f'Content-Length: {len(body)}')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('utf8') + body
+
+
+class WireRequest():
+    ''' a request rendered from a RequestTemplate
+    it provides the parts of the SIPRequest interface used by transactions
+    and authentication, the bytes are rendered once and cached
+    '''
+    __slots__ = (
+        'template', 'server', 'port', 'uri', 'branch', 'cseq', 'values',
+        'extra', 'body', '_data',
+        )
+
+    def __init__(self, template, server, port, uri, cseq, values):
+        self.template = template
+        self.server = server
+        self.port = port
+        self.uri = uri
+        self.branch = new_branch()
+        self.cseq = cseq
+        self.values = values
+        self.extra = {}
+        self.body = ''
+        self._data = None
+
+    @property
+    def function(self):
+        return self.template.method
+
+    @property
+    def method(self):
+        return self.template.method
+
+    @property
+    def headsip(self):
+        return self.uri
+
+    def get(self, key, value=None):
+        if key == 'Via':
+            return self.template.via.format(self.branch)
+        if key == 'CSeq':
+            return f'{self.cseq} {self.template.method}'
+        if key == 'Content-Length':
+            return str(len(self.body.encode('utf8')))
+        for headers in (self.values, self.extra, self.template.static):
+            if key in headers:
+                return headers[key]
+        return value
+
+    def set(self, key, value):
+        ''' set a variable header, others are appended to the request
+        '''
+        if key in self.template.static:
+            raise KeyError(f'{key} is static in {self.template.method}')
+        if key in self.values:
+            self.values[key] = str(value)
+        else:
+            self.extra[key] = str(value)
+        self._data = None
+
+    def set_to(self, destination):
+        self.set('To', destination)
+
+    def set_expires(self, value=30):
+        self.set('Expires', value)
+
+    def set_sequence(self, number):
+        self.cseq = number
+        self._data = None
+
+    def set_content(self, content):
+        self.body = content
+        self._data = None
+
+    def new_branch(self):
+        self.branch = new_branch()
+        self._data = None
+
+    def __bytes__(self):
+        if self._data is None:
+            self._data = self.template.render(self)
+        return self._data
+
+    def __str__(self):
+        return bytes(self).decode('utf8')
+
+    __repr__ = __str__
+
+
+class Templates():
+    ''' the request templates of one account
+    '''
+    def __init__(self, server, caller, port=5060, userip='0.0.0.0'):
+        self.server = server
+        self.caller = caller
+        self.port = port
+        common = [
+            ('Via', None),
+            ('Expires', 30),
+            ('User-Agent', USER_AGENT),
+            ('Allow', ALLOW),
+            ]
+
+        def template(method, headers):
+            return RequestTemplate(method, headers, userip, port)
+
+        self.register_template = template('REGISTER', [
+            ('Via', None),
+            ('Expires', None),
+            ('User-Agent', USER_AGENT),
+            ('Allow', ALLOW),
+            ('From', None),
+            ('To', None),
+            ('Call-ID', None),
+            ('CSeq', None),
+            ('Contact', caller),
+            ])
+        self.invite_template = template('INVITE', common + [
+            ('From', caller),
+            ('Contact', caller),
+            ('Call-ID', None),
+            ('To', None),
+            ('CSeq', None),
+            ])
+        self.ack_template = template('ACK', common + [
+            ('From', caller),
+            ('To', None),
+            ('Call-ID', None),
+            ('CSeq', None),
+            ])
+        self.bye_template = template('BYE', common + [
+            ('From', caller),
+            ('To', None),
+            ('Call-ID', None),
+            ('CSeq', None),
+            ])
+        self.cancel_template = template('CANCEL', common + [
+            ('From', caller),
+            ('To', None),
+            ('Call-ID', None),
+            ('CSeq', None),
+            ])
+
+    def _request(self, template, uri, cseq, **values):
+        return WireRequest(
+            template, self.server, self.port, uri, cseq, values
+            )
+
+    def _to(self, number):
+        return f'<sip:{number}@{self.server}>'
+
+    def register(self, call_id, cseq=1, expires=30):
+        ''' like `Register`, the tag of From and To is taken from `call_id`
+        '''
+        tag = f'{self.caller};tag={call_id[:8]}'
+        return self._request(
+            self.register_template, self.server, cseq,
+            **{
+                'Expires': str(expires), 'From': tag, 'To': tag,
+                'Call-ID': f'{call_id}@0.0.0.0:5060',
+                })
+
+    def invite(self, call_id, number, cseq=100):
+        return self._request(
+            self.invite_template, f'{number}@{self.server}', cseq,
+            **{'Call-ID': call_id, 'To': self._to(number)}
+            )
+
+    def ack(self, call_id, number, cseq=1, to=None):
+        return self._request(
+            self.ack_template, self.server, cseq,
+            **{'To': to or self._to(number), 'Call-ID': call_id}
+            )
+
+    def bye(self, call_id, number, cseq=1, to=None):
+        return self._request(
+            self.bye_template, f'{number}@{self.server}', cseq,
+            **{'To': to or self._to(number), 'Call-ID': call_id}
+            )
+
+    def cancel(self, request):
+        ''' the CANCEL of a pending INVITE `request`
+        '''
+        cancel = self._request(
+            self.cancel_template, request.uri, request.cseq,
+            **{'To': request.get('To'), 'Call-ID': request.get('Call-ID')}
+            )
+        cancel.branch = request.branch
+        return cancel
@@ -21,26 +21,23 @@
 #  MA 02110-1301, USA.
 #
 import logging
-import wave
 import time
 
 from voip import VoIP, SIPMessage
+from voip.store import AnnouncementStore
+from voip.metrics import REGISTRY
 
 server = "192.168.178.1"
 proxy = ""
 user = "auser"
 password = "apassword"
+announcement = "announcment.wav"
 
 def called(call):
     pass
 
 def main(args):
-
-    f = wave.open('announcment.wav', 'rb')
-    frames = f.getnframes()
-    data = f.readframes(frames)
-    f.close()
-
+    store = AnnouncementStore('.announcements')
 
     logging.basicConfig(level=logging.DEBUG)
     logging.debug("Running in Debug mode.")
@@ -50,9 +47,11 @@ def main(args):
     call = vp.call('01752002091')
     if call is not None:
         time.sleep(1)
-        call.send_raw(data)
+        call.play_announcement(store.get(announcement, call.codec, call.ptime))
         vp.hangup(call)
     vp.close()
+    store.close()
+    REGISTRY.write('voip.prom')
     return 0
 
 if __name__ == '__main__':